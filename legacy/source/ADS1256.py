@@ -27,6 +27,8 @@
 # THE SOFTWARE.
 #
 
+import threading
+import numpy as np
 import source.config as config
 import RPi.GPIO as GPIO
 
@@ -99,6 +101,13 @@ class ADS1256:
         self.cs_pin = config.CS_PIN
         self.drdy_pin = config.DRDY_PIN
 
+        # Continuous scan state, see ADS1256_StartScan
+        self.scan_thread = None
+        self.scan_running = threading.Event()
+        self.scan_lock = threading.Lock()
+        self.scan_count = 0
+        self.scan_timeouts = 0
+
     # Hardware reset
     def ADS1256_reset(self):
         config.digital_write(self.rst_pin, GPIO.HIGH)
@@ -232,5 +241,139 @@ class ADS1256:
         for i in range(0,8,1):
             ADC_Value[i] = self.ADS1256_GetChannalValue(i)
         return ADC_Value
+
+    def ADS1256_MuxCode(self, Channel):
+        # MUX register of a single-ended (AINx - AINCOM) or differential (AIN2x - AIN2x+1) channel
+        if(self.ScanMode == 0):
+            return (Channel<<4) | (1<<3)
+        return ((2*Channel)<<4) | (2*Channel + 1)
+
+    def ADS1256_WaitDRDYEdge(self, timeout_ms = 100):
+        # Sleep until DRDY goes low instead of polling it, False on timeout
+        if(config.digital_read(self.drdy_pin) == 0):
+            return True
+        return GPIO.wait_for_edge(self.drdy_pin, GPIO.FALLING, timeout = timeout_ms) is not None
+
+    def ADS1256_StartScan(self, Channels = None, capacity = 1024):
+        # Convert the channels continuously in a background thread, one sweep of all channels per row of a ring buffer
+        # A single channel is read in RDATAC mode, several channels by cycling the multiplexer:
+        # the next channel is selected while the conversion of the current one is read
+        if self.scan_running.is_set():
+            return
+
+        if Channels is None:
+            Channels = range(8) if self.ScanMode == 0 else range(4)
+        self.scan_channels = list(Channels)
+        self.scan_mux = [self.ADS1256_MuxCode(Channel) for Channel in self.scan_channels]
+
+        # Raw conversion bytes of every sweep, decoded when read
+        self.scan_capacity = capacity
+        self.scan_bytes = np.zeros((capacity, len(self.scan_channels), 3), dtype = np.uint8)
+        self.scan_codes = np.zeros((capacity, len(self.scan_channels)), dtype = np.int64)
+        self.scan_count = 0
+
+        self.scan_running.set()
+        if len(self.scan_channels) == 1:
+            target = self.ADS1256_ContinuousLoop
+        else:
+            target = self.ADS1256_CycleLoop
+        self.scan_thread = threading.Thread(target = target, name = 'ADS1256Scan', daemon = True)
+        self.scan_thread.start()
+
+    def ADS1256_StopScan(self, timeout = 2):
+        self.scan_running.clear()
+        if self.scan_thread is not None:
+            self.scan_thread.join(timeout)
+            self.scan_thread = None
+
+    def ADS1256_CycleLoop(self):
+        # Cycling the input multiplexer: once DRDY falls the conversion of the previous MUX setting is ready,
+        # the next channel is selected and restarted with SYNC and WAKEUP, then the ready conversion is read
+        n_channel = len(self.scan_mux)
+
+        # Start the first conversion
+        self.ADS1256_WaitDRDYEdge()
+        with config.spi_lock:
+            self.ADS1256_WriteReg(self.REG_E['REG_MUX'], self.scan_mux[0])
+            self.ADS1256_WriteCmd(self.CMD['CMD_SYNC'])
+            self.ADS1256_WriteCmd(self.CMD['CMD_WAKEUP'])
+
+        i = 0
+        while self.scan_running.is_set():
+            row = self.scan_bytes[self.scan_count % self.scan_capacity]
+
+            if not self.ADS1256_WaitDRDYEdge():
+                self.scan_timeouts += 1
+                continue
+
+            with config.spi_lock:
+                config.digital_write(self.cs_pin, GPIO.LOW)#cs  0
+                config.spi_writebyte([self.CMD['CMD_WREG'] | self.REG_E['REG_MUX'], 0x00, self.scan_mux[(i + 1) % n_channel]])
+                config.spi_writebyte([self.CMD['CMD_SYNC']])
+                config.spi_writebyte([self.CMD['CMD_WAKEUP']])
+                config.spi_writebyte([self.CMD['CMD_RDATA']])
+                row[i] = config.spi_readbytes(3)
+                config.digital_write(self.cs_pin, GPIO.HIGH)#cs 1
+
+            i += 1
+            if i == n_channel:
+                # Publish the completed sweep
+                with self.scan_lock:
+                    self.scan_count += 1
+                i = 0
+
+    def ADS1256_ContinuousLoop(self):
+        # Read Data Continuously: the conversion is shifted out on every DRDY without sending a command
+        self.ADS1256_WaitDRDYEdge()
+        with config.spi_lock:
+            self.ADS1256_WriteReg(self.REG_E['REG_MUX'], self.scan_mux[0])
+            self.ADS1256_WriteCmd(self.CMD['CMD_SYNC'])
+            self.ADS1256_WriteCmd(self.CMD['CMD_WAKEUP'])
+        self.ADS1256_WaitDRDYEdge()
+        with config.spi_lock:
+            self.ADS1256_WriteCmd(self.CMD['CMD_RDATAC'])
+
+        while self.scan_running.is_set():
+            if not self.ADS1256_WaitDRDYEdge():
+                self.scan_timeouts += 1
+                continue
+
+            row_index = self.scan_count % self.scan_capacity
+            with config.spi_lock:
+                config.digital_write(self.cs_pin, GPIO.LOW)#cs  0
+                self.scan_bytes[row_index, 0] = config.spi_readbytes(3)
+                config.digital_write(self.cs_pin, GPIO.HIGH)#cs 1
+
+            with self.scan_lock:
+                self.scan_count += 1
+
+        # Leave continuous mode so the commands of the other reads are accepted again
+        self.ADS1256_WaitDRDYEdge()
+        with config.spi_lock:
+            self.ADS1256_WriteCmd(self.CMD['CMD_SDATAC'])
+
+    def ADS1256_DecodeScan(self, raw, out):
+        # 24 bit big-endian codes, negative codes read as 0 like ADS1256_Read_ADC_Data
+        np.left_shift(raw[..., 0], 16, out = out, dtype = np.int64)
+        out |= raw[..., 1].astype(np.int64) << 8
+        out |= raw[..., 2]
+        out[out & 0x800000 != 0] = 0
+        return out
+
+    def ADS1256_GetScan(self, out, n_sweeps = 1):
+        # Mean codes of the latest n_sweeps complete sweeps copied into out, without waiting on the ADC
+        # Returns the number of sweeps so far, out is unchanged before the first one
+        with self.scan_lock:
+            count = self.scan_count
+            if count == 0:
+                return 0
+
+            # The row after the latest sweep is being written
+            n_sweeps = min(n_sweeps, count, self.scan_capacity - 1)
+            rows = np.arange(count - n_sweeps, count) % self.scan_capacity
+            codes = self.ADS1256_DecodeScan(self.scan_bytes[rows], self.scan_codes[:n_sweeps])
+
+        np.mean(codes, axis = 0, out = out[:codes.shape[1]])
+        return count
 ### END OF FILE ###
 
@@ -52,9 +52,10 @@ class DAC8532:
         self.DAC_VREF = 5
     
     def DAC8532_Write_Data(self, Channel, Data):
-        config.digital_write(self.cs_dac_pin, GPIO.LOW)#cs  0
-        config.spi_writebyte([Channel, Data >> 8, Data & 0xff])
-        config.digital_write(self.cs_dac_pin, GPIO.HIGH)#cs  0
+        with config.spi_lock:
+            config.digital_write(self.cs_dac_pin, GPIO.LOW)#cs  0
+            config.spi_writebyte([Channel, Data >> 8, Data & 0xff])
+            config.digital_write(self.cs_dac_pin, GPIO.HIGH)#cs  0
         
     def DAC8532_Out_Voltage(self, Channel, Voltage):
         if((Voltage <= self.DAC_VREF) and (Voltage >= 0)):
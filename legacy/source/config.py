@@ -28,6 +28,7 @@
 #
 
 
+import threading
 import spidev
 import RPi.GPIO as GPIO
 
@@ -40,6 +41,9 @@ DRDY_PIN        = 17
 # SPI device, bus = 0, device = 0
 SPI = spidev.SpiDev(0, 0)
 
+# The ADC and the DAC share the bus, each chip select frame holds the lock
+spi_lock = threading.Lock()
+
 def digital_write(pin, value):
     GPIO.output(pin, value)
 
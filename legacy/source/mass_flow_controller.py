@@ -24,6 +24,11 @@ class MFC():
 		self.ADC = ADS1256()
 		
 		self.ADC.ADS1256_init()
+
+		# Scan the flow meters continuously in the background, reads only copy the latest sweep
+		self.ADC_Value = np.zeros(8)
+		self.ADC_analog = np.zeros(8)
+		self.ADC.ADS1256_StartScan()
 		
 		self.DAC = DAC8532()
 		self.multiplexer = CD74HC4067()
@@ -34,10 +39,14 @@ class MFC():
 	def get_analog_read(self):
 		if self.test_UI:
 			return
-		self.ADC_Value = self.ADC.ADS1256_GetAll()
-		self.ADC_analog = []
-		for i in range(len(self.ADC_Value)):
-			self.ADC_analog.append((self.ADC_Value[i]*5.0/0x7fffff))
+		self.ADC.ADS1256_GetScan(self.ADC_Value)
+		np.multiply(self.ADC_Value, 5.0/0x7fffff, out = self.ADC_analog)
+
+	def stop(self):
+		'''Stop the background scan of the flow meters'''
+		if self.test_UI:
+			return
+		self.ADC.ADS1256_StopScan()
 
 	def get_flow_rate(self):
 		if self.test_UI:
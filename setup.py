@@ -30,13 +30,14 @@ setup(
     packages=find_packages(include=["*","source", "source.*"]),
     include_package_data=True,
     package_data={
-        'source': ['style.qss', 'nrc.png'],         # Add style.qss here
+        'source': ['style.qss', 'nrc.png', 'test_data/*.csv'],         # Add style.qss here
     },
     install_requires=parse_requirements('requirements.txt'),  # Load dependencies from requirements.txt
     entry_points={
         'console_scripts': [
             'active-cooling-experiment=source.main:Application.run',  # Entry point for command line execution
-            'active-cooling-experiment-test=source.main:Application.run_test'
+            'active-cooling-experiment-test=source.main:Application.run_test',
+            'active-cooling-identify-decoupling=source.identify_decoupling:main'
         ],
     },
     classifiers=[
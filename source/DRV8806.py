@@ -17,7 +17,7 @@ import spidev
 import time
 
 class DRV8806:
-    def __init__(self, bus = 0, device = 0, latch = 11, srclr = 13, reset = 29):
+    def __init__(self, bus = 0, device = 0, latch = 11, srclr = 13, reset = 29, spi_speed_hz = 100000):
  
         self.latch = latch
         self.srclr = srclr
@@ -37,7 +37,7 @@ class DRV8806:
         self.spi = spidev.SpiDev()
         self.spi.open(bus, device)
 
-        self.spi.max_speed_hz = 100000
+        self.spi.max_speed_hz = spi_speed_hz
         self.spi.mode = 0b00
 
     def reset_driver(self):
@@ -21,20 +21,49 @@ class TLA2528:
     OP_SINGLE_WRITE = 0x08
     OP_SINGLE_READ = 0x10
 
-    def __init__(self, address):
-        from smbus2 import SMBus
+    # Register values
+    SEQ_MODE_AUTO = 0x01
+    SEQ_START = 0x10
+
+    def __init__(self, address, bus=None, armed=True, oversampling=1):
+        """
+        bus: SMBus-like object, SMBus(1) by default
+        armed: keep the auto-sequencer running so a measurement is a single burst read,
+               False restarts the sequence with two register writes before every read
+        oversampling: on-chip averaging ratio (1, 2, 4, ..., 128), results become 16 bit above 1
+        """
         import time
 
-        self.bus = SMBus(1)
+        if bus is None:
+            from smbus2 import SMBus
+            bus = SMBus(1)
+
+        if oversampling not in [2**i for i in range(8)]:
+            raise ValueError(f"Unsupported TLA2528 oversampling ratio: {oversampling}")
+
+        self.bus = bus
         self.address = address
         self.AVDD = 5.55
         self.data = np.zeros(8)
+        self.armed = armed
+        self.oversampling = oversampling
+
+        # 12-bit results are left aligned in 16 bits, averaged results use all 16 bits
+        self.shift = 0 if oversampling > 1 else 4
+        self.scale = self.AVDD / (65536 if oversampling > 1 else 4096)
+
+        # Read message reused by every burst read, from the message factory of the bus if it has one, smbus2 otherwise
+        message_factory = getattr(bus, 'i2c_msg', None)
+        if message_factory is None:
+            from smbus2 import i2c_msg as message_factory
+        self.read_message = message_factory.read(self.address, 16)  # 8 channels * 2 bytes
+        self.codes = np.zeros(8, dtype=np.uint16)
 
         # Configure all pins as analog inputs
         self.write_register(self.PIN_CFG, 0x00)
 
-        # Enable auto-sequence mode (SEQ_MODE = 01)
-        self.write_register(self.SEQUENCE_CFG, 0x01)
+        # Average oversampling conversions per result
+        self.write_register(self.OSR_CFG, oversampling.bit_length() - 1)
 
         # Enable all 8 channels for auto-sequence
         self.write_register(self.AUTO_SEQ_CH_SEL, 0xFF)
@@ -42,8 +71,15 @@ class TLA2528:
         # Disable APPEND_STATUS to receive 2 bytes per channel only
         self.write_register(self.DATA_CFG, 0x00)
 
-        # Start sequencer (SEQ_START=1, CNVST=0 initially)
-        self.write_register(self.GENERAL_CFG, 0x10)
+        if self.armed:
+            # Enable auto-sequence mode and start the sequencer once, every read frame then converts the next channel
+            self.write_register(self.SEQUENCE_CFG, self.SEQ_MODE_AUTO | self.SEQ_START)
+        else:
+            # Enable auto-sequence mode (SEQ_MODE = 01)
+            self.write_register(self.SEQUENCE_CFG, 0x01)
+
+            # Start sequencer (SEQ_START=1, CNVST=0 initially)
+            self.write_register(self.GENERAL_CFG, 0x10)
         time.sleep(0.1)
 
     def write_register(self, register, value):
@@ -64,23 +100,23 @@ class TLA2528:
                 raise TimeoutError("OSR not done within timeout period")
 
     def burst_read_16_bytes(self):
-        from smbus2 import i2c_msg
-        read = i2c_msg.read(self.address, 16)  # 8 channels * 2 bytes
-        self.bus.i2c_rdwr(read)
-        return list(read)
+        self.bus.i2c_rdwr(self.read_message)
+        return bytes(self.read_message)
 
     def measure_voltage(self):
-        # Trigger conversion: clear and then set CNVST and SEQ_START
-        self.write_register(self.GENERAL_CFG, 0x00)
-        self.write_register(self.GENERAL_CFG, 0x18)
-
-        raw_data = self.burst_read_16_bytes()
-        for i in range(8):
-            msb = raw_data[2 * i]
-            lsb = raw_data[2 * i + 1]
-            adc_value = (msb << 4) | (lsb >> 4)
-            voltage = adc_value * self.AVDD / 4096
-            self.data[i] = voltage
+        if not self.armed:
+            # Trigger conversion: clear and then set CNVST and SEQ_START
+            self.write_register(self.GENERAL_CFG, 0x00)
+            self.write_register(self.GENERAL_CFG, 0x18)
+
+            # Averaged conversions of a restarted sequence must finish before the read
+            if self.oversampling > 1:
+                self.wait_osr_done()
+
+        # Big-endian 16-bit words, one per channel
+        np.copyto(self.codes, np.frombuffer(self.burst_read_16_bytes(), dtype='>u2'))
+        np.right_shift(self.codes, self.shift, out=self.codes)
+        np.multiply(self.codes, self.scale, out=self.data)
         return self.data
 
 if __name__ == "__main__":
@@ -90,4 +126,4 @@ if __name__ == "__main__":
     while True:
         voltages = adc.measure_voltage()
         print("Voltages:", [f"{v:.3f} V" for v in voltages])
-        sleep(1)
\ No newline at end of file
+        sleep(1)
@@ -13,6 +13,7 @@ THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
 '''
 
 import os
+import json
 import numpy as np
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QLabel, QComboBox, QCheckBox, QPushButton, QFileDialog, QPushButton, QGridLayout, QFrame, QTextEdit
 from PySide6.QtGui import QFont
@@ -289,6 +290,16 @@ class UI(QWidget):
         
         # Show decoupler checkbox only if temperature control mode is selected
         self.mfc_temperature_checkbox.toggled.connect(lambda: self.decoupler_checkbox.setVisible(self.mfc_temperature_checkbox.isChecked()))
+
+        # Step-response experiment proposing the PID gains of every region, unchecked once it finishes
+        self.autotune_checkbox = QCheckBox('Autotune', self)
+        self.autotune_checkbox.setVisible(False)  # Initially hidden
+
+        mfc_temperature_selector.addWidget(self.autotune_checkbox)
+
+        # Autotune, like the decoupler, is only available in temperature control mode
+        self.mfc_temperature_checkbox.toggled.connect(lambda: self.autotune_checkbox.setVisible(self.mfc_temperature_checkbox.isChecked()))
+        self.mfc_temperature_checkbox.toggled.connect(lambda: self.autotune_checkbox.setChecked(False))
         
         # Add checkbox to main layout
         self.layout.addLayout(mfc_temperature_selector)
@@ -444,6 +455,9 @@ class UI(QWidget):
             self.ax[0].plot(self.time_plot, self.flow_rate_plot[i, :], '.', color = self.colors_qualitative[i])  # Plot new data
             self.ax[2].plot(self.time_plot, self.temperature_plot[i, :], '.', color = self.colors_qualitative[i], label = f'Region {i}')  # Plot new data
 
+        # Mark the hottest pixel of each region
+        self.hotspot_markers, = self.ax[1].plot(temperature.region_statistics['hotspot_column'], temperature.region_statistics['hotspot_row'], 'x', color = 'white', markersize = 8)
+
         # Place legend outside of the plot
         lines = self.ax[2].get_lines()
         labels = [i.get_label() for i in lines]
@@ -773,10 +787,8 @@ class UI(QWidget):
         self.flow_rate_setpoint = np.zeros(self.n_region)
         self.temperature_setpoint = np.repeat(None, self.n_region)
         
-        for i in range(self.n_region):
-            
-            # Reset MFCs flow rate
-            self.MFC.set_flow_rate(i, 0)
+        # Reset MFCs flow rate
+        self.MFC.set_flow_rates(np.zeros(self.n_region))
 
         self.clear_layout(self.temperature_mfc_edit_layout)
 
@@ -838,9 +850,14 @@ class UI(QWidget):
         # Set filename to the new filename
         self.save_file_widget.setText(self.filename)
 
+        # Identify the region definitions in a sidecar file, masks and polygons are not stored in the columns
+        with open(self.filename.replace('.csv', '_regions.json'), 'w') as file:
+            json.dump({'region_hash': self.temperature.get_region_hash(self.n_region, self.region_boundaries),
+                       'region_boundaries': np.asarray(self.region_boundaries[:self.n_region]).tolist()}, file, indent = 4)
+
         # Create a new file
         with open(self.filename, 'w') as file:
-            
+
             # Write header
             header = 'time'
 
@@ -849,8 +866,8 @@ class UI(QWidget):
                 header += f', mfc_{i}'
 
             # Add Temperature headers
-                for i in range(self.n_region):
-                    header += f', temperature_{i}'
+            for i in range(self.n_region):
+                header += f', temperature_{i}'
 
             # Executes if temperature control mode is enabled (be sure to create file and save data after clicking the checkbox)
             if self.mfc_temperature_checkbox.isChecked():
@@ -876,6 +893,15 @@ class UI(QWidget):
         with open(self.filename.replace('.csv', '_temp.csv'), 'w') as file:
             header = 'time, temperature\n'
             file.write(header)
+
+        # Create file for region statistics
+        with open(self.filename.replace('.csv', '_stats.csv'), 'w') as file:
+            header = 'time'
+            for field in self.temperature.region_statistics.dtype.names:
+                for i in range(self.n_region):
+                    header += f', {field}_{i}'
+            header += '\n'
+            file.write(header)
             
 
     def set_pid_gains(self, region, parameter):
@@ -891,6 +917,16 @@ class UI(QWidget):
         self.pid_display[region][parameter].setText(str(self.PID[region].gains[parameter]))
         
 
+    def show_autotune_gains(self):
+        '''Show the gains applied by the autotune and uncheck it'''
+
+        self.autotune_checkbox.setChecked(False)
+        if self.mfc_temperature_checkbox.isChecked():
+            for region in range(self.n_region):
+                for parameter in range(self.n_controller_parameters):
+                    self.pid_display[region][parameter].setText(str(self.PID[region].gains[parameter]))
+
+
     def set_mfc(self, region):
         '''Set MFC flow rate upon changing value'''
          # Only positive inputs are valid
@@ -981,6 +1017,7 @@ class UI(QWidget):
 
             # Update temperature heatmap according to new temperature information
             self.temperature_image.set_data(temperature.temperature_grid)
+            self.hotspot_markers.set_data(temperature.region_statistics['hotspot_column'], temperature.region_statistics['hotspot_row'])
         
             # Update time array
             self.time_plot = self.time_plot[1:]
@@ -0,0 +1,268 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Import libraries
+import numpy as np
+
+def interaction_groups(matrix, threshold = 0.05):
+    '''Groups of regions that can be tuned together, no two regions of a group interact
+    Regions i and j interact when either decoupling term between them exceeds threshold
+    '''
+
+    matrix = np.asarray(matrix)
+    interacting = (np.abs(matrix) > threshold) | (np.abs(matrix.T) > threshold)
+
+    # Greedy colouring in region order
+    groups = []
+    for region in range(len(matrix)):
+        for group in groups:
+            if not np.any(interacting[region, group]):
+                group.append(region)
+                break
+        else:
+            groups.append([region])
+    return groups
+
+def fit_fopdt(time_points, response, step, max_delay = None, time_constants = None):
+    '''First order plus dead time models of step responses, y = K step (1 - exp(-(t - theta) / tau)) after theta
+    time_points (n_points,) start at the step, response (n_points, n_region) is the change from the baseline
+    Every (theta, tau) of a grid is evaluated at once, K is the least squares gain of each
+    Returns arrays of K, tau, theta and the residual variance of every region
+    '''
+
+    duration = time_points[-1]
+    if max_delay is None:
+        max_delay = duration / 3
+    if time_constants is None:
+        time_constants = np.geomspace(duration / 500, 2 * duration, 60)
+    delays = np.linspace(0, max_delay, 40)
+
+    # Unit step responses of the grid (n_delay, n_tau, n_points)
+    delayed_time = np.maximum(time_points[None, :] - delays[:, None], 0)
+    basis = step * (1 - np.exp(-delayed_time[:, None, :] / time_constants[None, :, None]))
+
+    projection = basis @ response
+    energy = np.sum(basis**2, axis = 2)[:, :, None]
+    residual = np.sum(response**2, axis = 0) - projection**2 / energy
+
+    # Best model of every region
+    best = residual.reshape(-1, response.shape[1]).argmin(axis = 0)
+    delay_index, tau_index = np.unravel_index(best, residual.shape[:2])
+    regions = np.arange(response.shape[1])
+    gain = projection[delay_index, tau_index, regions] / energy[delay_index, tau_index, 0]
+    return gain, time_constants[tau_index], delays[delay_index], residual[delay_index, tau_index, regions] / len(time_points)
+
+def simc_gains(process_gain, time_constant, delay, sample_time = 0., tau_c = None):
+    '''PI gains (Kp, Ki, Kd) of the SIMC rules for first order plus dead time processes
+    The controller error is temperature - setpoint, so the gain of a cooling process enters with its sign changed
+    Half the sample time is added to the delay, the closed-loop time constant defaults to the delay
+    '''
+
+    delay = delay + sample_time / 2
+    if tau_c is None:
+        tau_c = delay
+
+    process_gain = -np.asarray(process_gain)
+    Kc = time_constant / (process_gain * (tau_c + delay))
+    tau_i = np.minimum(time_constant, 4 * (tau_c + delay))
+    return np.stack([Kc, Kc / tau_i, np.zeros_like(Kc)], axis = -1)
+
+
+class Autotune():
+    '''Step-response autotuning of the PID gains of every region
+
+    Groups of non-interacting regions are tuned one after the other. For each group every region holds
+    the base flow rate for settle_time, then the regions of the group step their flow rate by step_size
+    for step_time while the others hold. The step responses are fitted with first order plus dead time
+    models and the SIMC rules give the PI gains. The experiment is driven by update() from the control
+    loop, with the loop time, so it runs the same against the rig and the simulated plant.
+    '''
+
+    # groups are lists of regions tuned together, every region alone by default
+    # base_flow_rate and step_size are flow rates, settle_time and step_time are in seconds of loop time
+    # tau_c is the closed-loop time constant of the SIMC rules, the delay of each region by default
+    def __init__(self, n_region, groups = None, base_flow_rate = 50., step_size = 50., settle_time = 30., step_time = 60., tau_c = None):
+
+        self.n_region = n_region
+        self.groups = groups if groups is not None else [[region] for region in range(n_region)]
+        self.base_flow_rate = base_flow_rate
+        self.step_size = step_size
+        self.settle_time = settle_time
+        self.step_time = step_time
+        self.tau_c = tau_c
+
+        # Set by the UI, the control loop starts and stops the experiment accordingly
+        self.requested = False
+        self.running = False
+        self.finished = False
+
+        # Progress of the experiment, shown in the status bar of the application
+        self.status = ''
+
+        # Models (K, tau, theta) and proposed gains (Kp, Ki, Kd) of every region, NaN until tuned
+        self.models = np.full((n_region, 3), np.nan)
+        self.gains = np.full((n_region, 3), np.nan)
+
+        # Root mean square residual of the fit of every region, in degC
+        self.residuals = np.full(n_region, np.nan)
+
+    def request(self, enabled):
+        self.requested = bool(enabled)
+
+    def start(self, time):
+        '''Start the experiment with the first group'''
+
+        self.running = True
+        self.finished = False
+        self.group = 0
+        self.start_group(time)
+
+    def stop(self):
+        '''Abort the experiment, the regions tuned so far keep their results'''
+        self.running = False
+        self.requested = False
+        self.status = 'Autotune aborted'
+
+    def start_group(self, time):
+        self.phase = 'settle'
+        self.phase_start = time
+        self.times = []
+        self.temperatures = []
+        self.status = f"Autotune group {self.group + 1} of {len(self.groups)}: settling before the step of regions {self.groups[self.group]}"
+
+    def duration(self):
+        '''Total duration of the experiment in seconds of loop time'''
+        return len(self.groups) * (self.settle_time + self.step_time)
+
+    def update(self, time, temperature, flow_rates):
+        '''Advance the experiment to time with the region temperatures, writing the flow rate of every region to flow_rates
+        Returns True on the tick the last group finishes
+        '''
+
+        regions = self.groups[self.group]
+        flow_rates[:] = self.base_flow_rate
+
+        if self.phase == 'settle':
+            if time - self.phase_start >= self.settle_time:
+                # Baseline over the last quarter of the settling time
+                times = np.array(self.times)
+                temperatures = np.array(self.temperatures)
+                recent = times >= self.phase_start + 0.75 * self.settle_time
+                self.baseline = np.mean(temperatures[recent], axis = 0) if np.any(recent) else temperature[regions]
+
+                self.phase = 'step'
+                self.phase_start = time
+                self.times = []
+                self.temperatures = []
+                self.status = f"Autotune group {self.group + 1} of {len(self.groups)}: step of regions {regions}"
+            else:
+                self.times.append(time)
+                self.temperatures.append(temperature[regions].copy())
+                return False
+
+        self.times.append(time)
+        self.temperatures.append(temperature[regions].copy())
+        flow_rates[regions] = self.base_flow_rate + self.step_size
+
+        if time - self.phase_start < self.step_time:
+            return False
+
+        self.fit_group()
+        flow_rates[:] = self.base_flow_rate
+        self.group += 1
+        if self.group < len(self.groups):
+            self.start_group(time)
+            return False
+
+        self.running = False
+        self.requested = False
+        self.finished = True
+        self.status = 'Autotune finished'
+        return True
+
+    def fit_group(self):
+        '''Fit the step responses of the current group and propose their gains'''
+
+        regions = self.groups[self.group]
+        times = np.array(self.times) - self.phase_start
+        response = np.array(self.temperatures) - self.baseline
+        sample_time = np.median(np.diff(times)) if len(times) > 1 else 0.
+
+        gain, time_constant, delay, residual = fit_fopdt(times, response, self.step_size)
+        self.models[regions] = np.column_stack([gain, time_constant, delay])
+        self.residuals[regions] = np.sqrt(residual)
+        self.gains[regions] = simc_gains(gain, time_constant, delay, sample_time, self.tau_c)
+
+    def apply(self, pid):
+        '''Copy the proposed gains of the tuned regions to a PIDBank'''
+        tuned = np.flatnonzero(np.all(np.isfinite(self.gains), axis = 1) & (self.gains[:, 0] > 0))
+        pid.gains[tuned] = self.gains[tuned]
+        self.status = f"Autotune applied the gains of regions {tuned.tolist()}"
+        return tuned
+
+
+if __name__ == "__main__":
+    import time
+    from source.simulator import Simulator
+    from source.solenoid_valve import Solenoid
+    from source.mass_flow_controller import MFC
+    from source.temperature import Temperature
+    from source.pid_controller import PIDBank
+    from source.decouplers import decouplers
+    from source.control_loop import ControlScheduler
+
+    # Tune the simulated plant with the control loop of the application, then follow a setpoint with the gains
+    n_region = 4
+    time_scale = 20
+    simulator = Simulator(n_region, time_scale = time_scale, seed = 0)
+    solenoid = Solenoid(n_region, simulator = simulator)
+    mfc = MFC(n_region, simulator = simulator)
+    temperature = Temperature(n_region, simulator = simulator)
+    region_boundaries = np.array([[8 * i, 8 * (i + 1), 0, 24] for i in range(n_region)])
+    solenoid.set_states(np.ones(n_region, dtype = bool))
+
+    # Neighbouring jets interact, the others are tuned together
+    decoupler = decouplers(n_region, np.eye(n_region) - 0.2 * (np.abs(np.subtract.outer(range(n_region), range(n_region))) == 1))
+    groups = interaction_groups(decoupler.matrix)
+    autotune = Autotune(n_region, groups, settle_time = 30 / time_scale, step_time = 60 / time_scale)
+    print(f"Groups: {groups}, experiment of {autotune.duration():.1f} s instead of {n_region * (autotune.settle_time + autotune.step_time):.1f} s")
+
+    pid = PIDBank(n_region)
+    flow_rates = np.zeros(n_region)
+    setpoint = np.full(n_region, 85.)
+
+    def tick():
+        temperature.get_temperature()
+        temperature.get_temperature_average(n_region, region_boundaries)
+        mfc.get_flow_rate()
+        if autotune.running:
+            if autotune.update(scheduler.loop_time, temperature.temperature_average, flow_rates):
+                autotune.apply(pid)
+            mfc.set_flow_rates(flow_rates)
+        else:
+            mfc.set_flow_rates(pid.compute_outputs(temperature.temperature_average, setpoint, scheduler.time_step, mfc.flow_rate))
+
+    scheduler = ControlScheduler(tick, 0.05)
+    autotune.start(0.)
+    scheduler.start()
+    while autotune.running:
+        time.sleep(0.1)
+
+    print(autotune.status)
+    print(f"Models (K, tau, theta):\n{np.round(autotune.models, 4)}")
+    print(f"Gains:\n{np.round(pid.gains, 3)}")
+    for _ in range(6):
+        time.sleep(0.5)
+        print(f"t = {scheduler.loop_time * time_scale:6.1f} s plant time, temperature: {np.round(temperature.temperature_average, 2)}, flow rate: {np.round(mfc.flow_rate, 1)}")
+    scheduler.stop()
@@ -0,0 +1,170 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Import libraries
+import threading
+import time
+import traceback
+import numpy as np
+
+class ControlScheduler():
+    '''Runs the control tick periodically on absolute deadlines of the monotonic clock
+
+    Deadlines are start + k * period, so slow ticks never shift the later ones. A tick running past
+    the next deadline is an overrun, handled by the overrun policy:
+        'skip'      the missed deadlines are dropped and the loop resumes on the next deadline
+        'catch_up'  the missed ticks run back to back, at most max_catch_up of them, older ones are dropped
+    time_step is the scheduled time since the previous tick, a whole number of periods that is never
+    near zero, the loop time is the deadline of the tick relative to the start of the loop.
+    '''
+
+    overrun_policies = ('skip', 'catch_up')
+
+    # Number of recent ticks kept for the jitter statistics
+    history = 256
+
+    # callback is called without arguments on every tick, from the scheduler thread
+    # period is in seconds
+    def __init__(self, callback, period, overrun_policy = 'skip', max_catch_up = 10):
+
+        if overrun_policy not in self.overrun_policies:
+            raise ValueError(f"Unknown overrun policy: {overrun_policy}")
+
+        self.callback = callback
+        self.period = period
+        self.overrun_policy = overrun_policy
+        self.max_catch_up = max_catch_up
+
+        # Timing of the current tick
+        self.start_time = 0.
+        self.deadline = 0.
+        self.loop_time = 0.
+        self.time_step = period
+
+        # Per tick jitter (start after the deadline) and duration in seconds, in a ring of the recent ticks
+        self.jitter = np.zeros(self.history)
+        self.duration = np.zeros(self.history)
+        self.ticks = 0
+        self.max_jitter = 0.
+        self.max_duration = 0.
+
+        # Ticks running past the next deadline, deadlines dropped and ticks that raised
+        self.overruns = 0
+        self.skipped = 0
+        self.errors = 0
+
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        '''Start the loop, the first tick runs immediately'''
+
+        if self.thread is not None:
+            return
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target = self.loop, name = 'ControlScheduler', daemon = True)
+        self.thread.start()
+
+    def stop(self, timeout = 5):
+        '''Stop the loop, waiting for the current tick to finish'''
+
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+        self.thread = None
+
+    def loop(self):
+        self.start_time = time.monotonic()
+        deadline = self.start_time
+        previous_deadline = deadline - self.period
+
+        while not self.stop_event.is_set():
+            delay = deadline - time.monotonic()
+            if delay > 0 and self.stop_event.wait(delay):
+                break
+
+            tick_start = time.monotonic()
+            self.deadline = deadline
+            self.loop_time = deadline - self.start_time
+            self.time_step = deadline - previous_deadline
+
+            try:
+                self.callback()
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
+
+            tick_end = time.monotonic()
+            self.record(tick_start - deadline, tick_end - tick_start)
+
+            previous_deadline = deadline
+            deadline += self.period
+
+            # Overrun: the tick ended after the next deadline
+            if tick_end > deadline:
+                self.overruns += 1
+                missed = int((tick_end - deadline) / self.period) + 1
+                if self.overrun_policy == 'skip':
+                    dropped = missed
+                else:
+                    dropped = max(0, missed - self.max_catch_up)
+                self.skipped += dropped
+                deadline += dropped * self.period
+
+    def record(self, jitter, duration):
+        index = self.ticks % self.history
+        self.jitter[index] = jitter
+        self.duration[index] = duration
+        self.ticks += 1
+        self.max_jitter = max(self.max_jitter, jitter)
+        self.max_duration = max(self.max_duration, duration)
+
+    def statistics(self):
+        '''Tick count, overrun counts, and jitter and duration of the recent ticks in seconds'''
+
+        n = min(self.ticks, self.history)
+        jitter = self.jitter[:n]
+        duration = self.duration[:n]
+        return {'ticks': self.ticks, 'overruns': self.overruns, 'skipped': self.skipped, 'errors': self.errors,
+                'last_jitter': self.jitter[(self.ticks - 1) % self.history] if n else 0.,
+                'mean_jitter': float(np.mean(jitter)) if n else 0., 'std_jitter': float(np.std(jitter)) if n else 0.,
+                'max_jitter': self.max_jitter,
+                'mean_duration': float(np.mean(duration)) if n else 0., 'max_duration': self.max_duration}
+
+    def print_statistics(self):
+        '''Print the tick and overrun counts and the timing of the recent ticks'''
+        statistics = self.statistics()
+        print(f"Control loop: {statistics['ticks']} ticks of {1000 * self.period:.0f} ms, {statistics['overruns']} overruns, "
+              f"{statistics['skipped']} ticks skipped ({self.overrun_policy}), {statistics['errors']} errors")
+        print(f"  jitter mean {1000 * statistics['mean_jitter']:.2f} ms, std {1000 * statistics['std_jitter']:.2f} ms, max {1000 * statistics['max_jitter']:.2f} ms")
+        print(f"  tick duration mean {1000 * statistics['mean_duration']:.2f} ms, max {1000 * statistics['max_duration']:.2f} ms")
+
+
+if __name__ == "__main__":
+    # A 20 ms loop where every fifth tick takes 50 ms, under both overrun policies
+    for policy in ControlScheduler.overrun_policies:
+        steps = []
+
+        def tick():
+            steps.append(scheduler.time_step)
+            if len(steps) % 5 == 0:
+                time.sleep(0.05)
+
+        scheduler = ControlScheduler(tick, 0.02, policy)
+        scheduler.start()
+        time.sleep(1)
+        scheduler.stop()
+        scheduler.print_statistics()
+        print(f"  time steps: {sorted(set(np.round(steps, 3).tolist()))} s, loop time {scheduler.loop_time:.2f} s")
@@ -12,26 +12,127 @@ Redistribution and use in source and binary forms, with or without modification,
 THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 '''
 
+import json
 import numpy as np
 
 class decouplers:
-    def __init__(self):
-        self.output = 0
-
-    def compute_decoupled_output(self, pid_outputs):
-        '''Compute decoupled output for each controller'''
-        # Currently only works for 2 controller inputs
-
-        self.output = np.zeros(len(pid_outputs))
-
-        # Decoupling terms (must be recalculated for each new arrangement of controllers)
-        # Current arrangement: oixio (o = output, i = input, x = closed)
-        g_T0_MFC1 = -0.98
-        g_T1_MFC0 = -0.97
-        
-        decoupling_terms = [g_T0_MFC1, g_T1_MFC0]
-        for i in range(len(pid_outputs)):
-            decoupler_output = decoupling_terms[i]*pid_outputs[1 - i]
-            self.output[i] = pid_outputs[i] + decoupler_output
-
-        return self.output
\ No newline at end of file
+    '''Decoupling of the PID outputs by an N x N matrix, outputs = D @ pid_outputs
+
+    Row i of D holds the contribution of every PID output to MFC i, the diagonal is normally 1.
+    Each term can lag behind its PID output with a first-order time constant, 0 applies it immediately.
+    The matrix of an arrangement of controllers is loaded from a JSON file:
+        {"arrangement": "oixio", "matrix": [[1, -0.98], [-0.97, 1]], "time_constants": [[0, 2.5], [2.5, 0]]}
+    or several arrangements in one file, {"arrangements": {"oixio": {"matrix": ...}, ...}}.
+    '''
+
+    # Decoupling terms of the arrangement oixio (o = output, i = input, x = closed), used by default for 2 regions
+    default_matrix_2 = [[1, -0.98], [-0.97, 1]]
+
+    # matrix is the N x N decoupling matrix, the identity by default for other than 2 regions
+    # time_constants are the N x N first-order lags of the terms in seconds, None for a static matrix
+    def __init__(self, n_region = 2, matrix = None, time_constants = None, arrangement = None):
+
+        self.n_region = n_region
+        self.arrangement = arrangement
+
+        if matrix is None:
+            matrix = self.default_matrix_2 if n_region == 2 else np.eye(n_region)
+        self.matrix = np.array(matrix, dtype = float)
+        if self.matrix.shape != (n_region, n_region):
+            raise ValueError(f"Decoupling matrix of shape {self.matrix.shape} for {n_region} regions")
+
+        self.time_constants = None
+        if time_constants is not None:
+            self.time_constants = np.array(time_constants, dtype = float)
+            if self.time_constants.shape != (n_region, n_region) or np.any(self.time_constants < 0):
+                raise ValueError(f"Decoupling time constants must be a non-negative {n_region} x {n_region} matrix")
+            if not np.any(self.time_constants > 0):
+                self.time_constants = None
+
+        self.output = np.zeros(n_region)
+
+        # Lagged terms D_ij u_j and work arrays of the dynamic decoupler
+        self.terms = np.zeros((n_region, n_region))
+        self.term_targets = np.zeros((n_region, n_region))
+        self.term_gains = np.zeros((n_region, n_region))
+        self.initialized = False
+
+    @classmethod
+    def load(cls, path, n_region, arrangement = None):
+        '''Read the decoupling matrix from a JSON file, arrangement picks one in a file holding several'''
+
+        with open(path, 'r') as file:
+            configuration = json.load(file)
+
+        if 'arrangements' in configuration:
+            arrangements = configuration['arrangements']
+            if arrangement is None:
+                if len(arrangements) != 1:
+                    raise ValueError(f"Choose one of the arrangements in {path}: {', '.join(arrangements)}")
+                arrangement = next(iter(arrangements))
+            configuration = dict(arrangements[arrangement], arrangement = arrangement)
+
+        return cls(n_region, configuration['matrix'], configuration.get('time_constants'), configuration.get('arrangement'))
+
+    def save(self, path):
+        '''Write the decoupling matrix to a JSON file'''
+
+        configuration = {'arrangement': self.arrangement, 'matrix': self.matrix.tolist()}
+        if self.time_constants is not None:
+            configuration['time_constants'] = self.time_constants.tolist()
+        with open(path, 'w') as file:
+            json.dump(configuration, file, indent = 4)
+
+    def reset(self):
+        '''Forget the state of the lagged terms'''
+        self.initialized = False
+
+    def compute_decoupled_output(self, pid_outputs, time_step = None):
+        '''Decoupled output of every MFC, one matrix-vector product per tick
+        The lagged terms advance by time_step, without it the matrix is applied statically
+        Returns the output array, overwritten by the next call
+        '''
+
+        if self.time_constants is None or time_step is None:
+            np.dot(self.matrix, pid_outputs, out = self.output)
+            return self.output
+
+        # First-order lag of every term, discretized with backward Euler: s += dt / (tau + dt) * (D_ij u_j - s)
+        np.multiply(self.matrix, pid_outputs, out = self.term_targets)
+        if not self.initialized:
+            np.copyto(self.terms, self.term_targets)
+            self.initialized = True
+        else:
+            np.add(self.time_constants, time_step, out = self.term_gains)
+            np.divide(time_step, self.term_gains, out = self.term_gains)
+            np.subtract(self.term_targets, self.terms, out = self.term_targets)
+            np.multiply(self.term_targets, self.term_gains, out = self.term_targets)
+            np.add(self.terms, self.term_targets, out = self.terms)
+
+        np.sum(self.terms, axis = 1, out = self.output)
+        return self.output
+
+
+if __name__ == "__main__":
+    import time
+
+    # The default reproduces the two hardcoded decoupling terms
+    decoupler = decouplers(2)
+    pid_outputs = np.array([120., 80.])
+    expected = [pid_outputs[0] - 0.98 * pid_outputs[1], pid_outputs[1] - 0.97 * pid_outputs[0]]
+    print(f"Default 2 x 2 error: {np.max(np.abs(decoupler.compute_decoupled_output(pid_outputs) - expected)):.2e}")
+
+    # A lagged term converges to the static output after a step
+    lagged = decouplers(2, time_constants = [[0, 2.], [2., 0]])
+    lagged.compute_decoupled_output(np.zeros(2), 0.5)
+    for _ in range(40):
+        output = lagged.compute_decoupled_output(pid_outputs, 0.5)
+    print(f"Lagged output after 20 s: {output}, static: {decoupler.compute_decoupled_output(pid_outputs)}")
+
+    for n_region in [2, 10, 32]:
+        decoupler = decouplers(n_region, np.eye(n_region) - 0.1 * (1 - np.eye(n_region)))
+        pid_outputs = np.linspace(0, 100, n_region)
+        start = time.perf_counter()
+        for _ in range(10000):
+            decoupler.compute_decoupled_output(pid_outputs)
+        print(f"{n_region:3d} regions: {1e6 * (time.perf_counter() - start) / 10000:.2f} us per tick")
@@ -0,0 +1,128 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Import libraries
+import importlib
+import json
+
+# Registered backends of every kind of device, by name
+# Targets are 'module:function' strings, the module is only imported when the backend is first used
+drivers = {
+    'camera': {
+        'mlx90640': 'source.drivers.hardware:mlx90640_camera',
+        'replay': 'source.drivers.recording:replay_camera',
+        'simulated': 'source.drivers.simulated:simulated_camera',
+    },
+    'flow_meter': {
+        'tla2528': 'source.drivers.hardware:tla2528_flow_meters',
+        'simulated': 'source.drivers.simulated:simulated_flow_meters',
+    },
+    'flow_actuator': {
+        'dacx578': 'source.drivers.hardware:dacx578_flow_actuators',
+        'simulated': 'source.drivers.simulated:simulated_flow_actuators',
+    },
+    'valve': {
+        'drv8806': 'source.drivers.hardware:drv8806_valves',
+        'simulated': 'source.drivers.simulated:simulated_valves',
+    },
+}
+
+# Factories already imported, by kind and name
+loaded = {}
+
+def register(kind, name, target):
+    '''Register a backend under a name, target is a factory or a 'module:function' string imported on first use'''
+
+    if kind not in drivers:
+        raise ValueError(f"Unknown driver kind: {kind}")
+    drivers[kind][name] = target
+    loaded.pop((kind, name), None)
+
+def get(kind, name):
+    '''Factory of a backend, importing its module the first time'''
+
+    if (kind, name) not in loaded:
+        if kind not in drivers:
+            raise ValueError(f"Unknown driver kind: {kind}")
+        if name not in drivers[kind]:
+            raise ValueError(f"Unknown {kind} driver: {name}, available: {', '.join(drivers[kind])}")
+
+        target = drivers[kind][name]
+        if isinstance(target, str):
+            module_name, function_name = target.split(':')
+            target = getattr(importlib.import_module(module_name), function_name)
+        loaded[(kind, name)] = target
+
+    return loaded[(kind, name)]
+
+def create(kind, name, **options):
+    '''Create the device of a backend, factories ignore the options they do not use'''
+    return get(kind, name)(**options)
+
+
+class RigConfig():
+    '''Backend and options of every kind of device of the rig
+
+    The JSON file maps each kind to a driver name, or to a dict with the driver name and its options:
+        {"camera": "mlx90640", "flow_meter": {"driver": "tla2528", "oversampling": 4}}
+    Kinds left out keep the default hardware backend.
+    '''
+
+    # Backends of the physical rig
+    default_drivers = {'camera': 'mlx90640', 'flow_meter': 'tla2528', 'flow_actuator': 'dacx578', 'valve': 'drv8806'}
+
+    def __init__(self, drivers = None):
+
+        self.drivers = dict(self.default_drivers)
+        self.options = {kind: {} for kind in self.default_drivers}
+
+        for kind, driver in (drivers or {}).items():
+            if kind not in self.default_drivers:
+                raise ValueError(f"Unknown driver kind: {kind}")
+            if isinstance(driver, dict):
+                driver = dict(driver)
+                self.drivers[kind] = driver.pop('driver', self.default_drivers[kind])
+                self.options[kind] = driver
+            else:
+                self.drivers[kind] = driver
+
+    @classmethod
+    def load(cls, path):
+        '''Read the rig configuration from a JSON file'''
+
+        with open(path, 'r') as file:
+            return cls(json.load(file))
+
+    @classmethod
+    def simulated(cls):
+        '''Every device replaced by the simulated rig'''
+        return cls({kind: 'simulated' for kind in cls.default_drivers})
+
+    @classmethod
+    def select(cls, test = False, simulator = None):
+        '''Configuration of the run modes without a rig file: simulated, recorded frames only, or hardware'''
+
+        if simulator is not None:
+            return cls.simulated()
+        if test:
+            return cls({'camera': 'replay'})
+        return cls()
+
+    def uses_simulator(self):
+        '''True when some device is served by the simulated rig'''
+        return 'simulated' in self.drivers.values()
+
+    def create(self, kind, **context):
+        '''Create the device of a kind, the options of the rig file come first and the context overrides them'''
+        return create(kind, self.drivers[kind], **dict(self.options[kind], **context))
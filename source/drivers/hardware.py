@@ -0,0 +1,54 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Backends of the physical rig, the device libraries are imported by each factory
+
+
+def mlx90640_camera(backend = 'numpy', rebuild_calibration = False, refresh_rate = 1, bus_manager = None, **context):
+    '''MLX90640 thermal camera'''
+    from source.thermal_cam import ThermalCam
+    return ThermalCam(backend = backend, rebuild_calibration = rebuild_calibration, refresh_rate = refresh_rate, bus_manager = bus_manager)
+
+def tla2528_flow_meters(addresses = (0x12, 0x13), armed = True, oversampling = 1, bus_manager = None, **context):
+    '''TLA2528 ADCs reading the flow meters, 8 channels each'''
+    from source.TLA2825IRTER import TLA2528
+
+    if bus_manager is not None:
+        return [TLA2528(address = address, bus = bus_manager.smbus_device(f'adc_{address:#04x}', bus_manager.PRIORITY_ADC), armed = armed, oversampling = oversampling) for address in addresses]
+    return [TLA2528(address = address, armed = armed, oversampling = oversampling) for address in addresses]
+
+def dacx578_flow_actuators(addresses = (0x48, 0x47), bus_manager = None, **context):
+    '''DACx578 DACs commanding the MFCs, 8 channels each'''
+    from adafruit_dacx578 import DACx578
+
+    if bus_manager is not None:
+        i2c = bus_manager.i2c()
+    else:
+        import board
+        import busio
+        i2c = busio.I2C(board.SCL, board.SDA)
+
+    dacs = [DACx578(i2c, address = address) for address in addresses]
+
+    # DAC writes go ahead of any other waiting transaction
+    if bus_manager is not None:
+        for dac, address in zip(dacs, addresses):
+            dac.i2c_device = bus_manager.manage_i2c_device(dac.i2c_device, f'dac_{address:#04x}', bus_manager.PRIORITY_DAC)
+
+    return dacs
+
+def drv8806_valves(bus = 0, device = 0, spi_speed_hz = 100000, **context):
+    '''DRV8806 shift registers driving the solenoid valves'''
+    from source.DRV8806 import DRV8806
+    return DRV8806(bus = bus, device = device, spi_speed_hz = spi_speed_hz)
@@ -0,0 +1,37 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Backends of the simulated rig, every device belongs to the simulator passed in the context
+
+
+def simulator_device(simulator, name):
+    if simulator is None:
+        raise ValueError(f"The simulated {name} backend needs a simulator")
+    return getattr(simulator, name)
+
+def simulated_camera(simulator = None, **context):
+    '''Frames rendered by the simulator'''
+    return simulator_device(simulator, 'camera')
+
+def simulated_flow_meters(simulator = None, **context):
+    '''Simulated TLA2528 ADCs'''
+    return simulator_device(simulator, 'adc')
+
+def simulated_flow_actuators(simulator = None, **context):
+    '''Simulated DACx578 DACs'''
+    return simulator_device(simulator, 'dac')
+
+def simulated_valves(simulator = None, **context):
+    '''Simulated DRV8806 shift registers'''
+    return simulator_device(simulator, 'drv')
@@ -0,0 +1,177 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Import libraries
+import json
+import numpy as np
+
+class CalibrationCurves():
+    '''Monotone voltage to flow rate curves of several channels, evaluated for all channels at once in both directions
+
+    Each channel is one of:
+        {'type': 'linear', 'offset': V0, 'gain': G}                         flow = (V - V0) * G
+        {'type': 'polynomial', 'coefficients': [c0, c1, ...], 'range': [V_min, V_max]}
+                                                                            flow = c0 + c1 V + ..., sampled into a table over range
+        {'type': 'table', 'voltage': [...], 'flow': [...]}                  linear interpolation, linear extrapolation past the ends
+    Linear channels are evaluated exactly, the others through tables compiled once.
+    '''
+
+    # Points of the table sampled from a polynomial
+    n_polynomial_points = 256
+
+    def __init__(self, models):
+
+        self.models = [dict(model) for model in models]
+        self.n_channel = len(models)
+
+        # Linear channels
+        self.linear = np.array([model['type'] == 'linear' for model in self.models])
+        self.offset = np.array([float(model.get('offset', 0)) if model['type'] == 'linear' else 0. for model in self.models])
+        self.gain = np.array([float(model.get('gain', 1)) if model['type'] == 'linear' else 1. for model in self.models])
+        if np.any(self.gain[self.linear] <= 0):
+            raise ValueError("Linear calibration gains must be positive")
+
+        # Tables of the other channels, padded to a common length along the extension of their last segment
+        self.table_channels = np.flatnonzero(~self.linear)
+        tables = [self.compile_table(self.models[i]) for i in self.table_channels]
+        n_points = max([len(voltage) for voltage, _ in tables], default = 2)
+        self.table_voltage = np.zeros((len(tables), n_points))
+        self.table_flow = np.zeros((len(tables), n_points))
+        for row, (voltage, flow) in enumerate(tables):
+            n_pad = n_points - len(voltage)
+            step = np.arange(1, n_pad + 1)
+            self.table_voltage[row] = np.concatenate([voltage, voltage[-1] + step * (voltage[-1] - voltage[-2])])
+            self.table_flow[row] = np.concatenate([flow, flow[-1] + step * (flow[-1] - flow[-2])])
+
+        # Work buffers of the table interpolation
+        self.table_input = np.zeros(len(tables))
+        self.table_output = np.zeros(len(tables))
+        self.table_rows = np.arange(len(tables))
+
+    def compile_table(self, model):
+        '''Voltage and flow rate points of a polynomial or table model, strictly increasing in both'''
+
+        if model['type'] == 'polynomial':
+            v_min, v_max = model.get('range', [0., 5.])
+            voltage = np.linspace(v_min, v_max, self.n_polynomial_points)
+            flow = np.polynomial.polynomial.polyval(voltage, model['coefficients'])
+        elif model['type'] == 'table':
+            voltage = np.asarray(model['voltage'], dtype = float)
+            flow = np.asarray(model['flow'], dtype = float)
+        else:
+            raise ValueError(f"Unknown calibration type: {model['type']}")
+
+        if len(voltage) < 2 or len(voltage) != len(flow):
+            raise ValueError("Calibration tables need at least 2 points with one flow rate per voltage")
+        if np.any(np.diff(voltage) <= 0) or np.any(np.diff(flow) <= 0):
+            raise ValueError("Calibration curves must be strictly increasing to be inverted")
+
+        return voltage, flow
+
+    def interpolate(self, x_table, y_table, x, out):
+        '''Interpolate one value per table row, linear extrapolation past the ends'''
+
+        # Segment of every row, from the number of points at or below the value
+        index = np.count_nonzero(x_table <= x[:, None], axis = 1)
+        np.clip(index, 1, x_table.shape[1] - 1, out = index)
+        x0 = x_table[self.table_rows, index - 1]
+        x1 = x_table[self.table_rows, index]
+        y0 = y_table[self.table_rows, index - 1]
+        y1 = y_table[self.table_rows, index]
+        np.copyto(out, y0 + (x - x0) * (y1 - y0) / (x1 - x0))
+
+    def to_flow(self, voltage, out):
+        '''Flow rate of every channel from its voltage'''
+
+        np.subtract(voltage, self.offset, out = out)
+        np.multiply(out, self.gain, out = out)
+
+        if len(self.table_channels):
+            np.take(voltage, self.table_channels, out = self.table_input)
+            self.interpolate(self.table_voltage, self.table_flow, self.table_input, self.table_output)
+            out[self.table_channels] = self.table_output
+        return out
+
+    def to_voltage(self, flow, out):
+        '''Voltage of every channel from its flow rate, the inverse of to_flow'''
+
+        np.divide(flow, self.gain, out = out)
+        np.add(out, self.offset, out = out)
+
+        if len(self.table_channels):
+            np.take(flow, self.table_channels, out = self.table_input)
+            self.interpolate(self.table_flow, self.table_voltage, self.table_input, self.table_output)
+            out[self.table_channels] = self.table_output
+        return out
+
+class FlowCalibration():
+    '''Per-channel calibration of the mass flow controllers
+
+    measure converts the flow meter output voltages to flow rates, command relates the setpoint input
+    voltages to flow rates and is used inverted to compute the DAC outputs.
+    The default reproduces the original conversions, (V - 1) * 75 * 0.98 and flow / 75 + 1.
+    '''
+
+    default_measure = {'type': 'linear', 'offset': 1., 'gain': 75 * 0.98}
+    default_command = {'type': 'linear', 'offset': 1., 'gain': 75.}
+
+    # channels is a list of {'measure': model, 'command': model}, missing channels or entries use the defaults
+    def __init__(self, n_channel, channels = None):
+
+        channels = list(channels or [])
+        channels += [{}] * (n_channel - len(channels))
+        self.channels = channels[:n_channel]
+
+        self.measure = CalibrationCurves([channel.get('measure', self.default_measure) for channel in self.channels])
+        self.command = CalibrationCurves([channel.get('command', self.default_command) for channel in self.channels])
+
+    @classmethod
+    def load(cls, path, n_channel):
+        '''Read the calibration from a JSON file {"channels": [{"measure": ..., "command": ...}, ...]}'''
+
+        with open(path, 'r') as file:
+            calibration = json.load(file)
+        return cls(n_channel, calibration.get('channels'))
+
+    def save(self, path):
+        '''Write the calibration to a JSON file'''
+
+        with open(path, 'w') as file:
+            json.dump({'channels': self.channels}, file, indent = 4)
+
+
+if __name__ == "__main__":
+    # Check that the default reproduces the original conversions and that tables invert exactly
+    rng = np.random.default_rng(0)
+    n_channel = 10
+
+    calibration = FlowCalibration(n_channel)
+    voltage = rng.uniform(0, 5.5, n_channel)
+    flow = np.zeros(n_channel)
+    calibration.measure.to_flow(voltage, flow)
+    print(f"Default measure error: {np.max(np.abs(flow - (voltage - 1) * 75 * 0.98)):.2e}")
+
+    command = np.zeros(n_channel)
+    calibration.command.to_voltage(flow, command)
+    print(f"Default command error: {np.max(np.abs(command - (flow / 75. + 1.))):.2e}")
+
+    # Mixed models
+    channels = [{'measure': {'type': 'table', 'voltage': [1, 2, 3, 5], 'flow': [0, 60, 150, 300]}},
+                {'measure': {'type': 'polynomial', 'coefficients': [-80, 75, 1], 'range': [1, 5]}}]
+    calibration = FlowCalibration(n_channel, channels)
+    voltage[0] = 2.5
+    calibration.measure.to_flow(voltage, flow)
+    round_trip = np.zeros(n_channel)
+    calibration.measure.to_voltage(flow, round_trip)
+    print(f"Table at 2.5 V: {flow[0]} (expected 105), round trip error: {np.max(np.abs(round_trip - voltage)):.2e}")
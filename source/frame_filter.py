@@ -0,0 +1,222 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Import libraries
+import time
+import numpy as np
+
+class FrameFilter():
+    '''Per-pixel temporal filter, dead pixel rejection and stale frame detection between the camera and Temperature
+    Every step works in place on the flattened frame
+    '''
+
+    # Default constructor
+    # mode is 'ema', 'kalman' or None to only reject dead pixels and detect stale frames
+    # alpha is the EMA weight of the new frame
+    # process_noise and measurement_noise (degC^2) set the steady-state gain of the Kalman filter
+    # n_learning_frames fresh frames are collected at startup to learn the dead pixel mask, 0 disables the rejection
+    # outlier_threshold is the margin, in robust standard deviations of the pixel noise, by which a dead pixel
+    # lies above or below all of its neighbours
+    # min_deviation in degC is the smallest margin, so sharp but real features, such as the centre of a jet, are kept
+    # max_frame_age in seconds marks old frames as stale, None only checks the sequence number
+    def __init__(self, resolution = (24,32), mode = 'ema', alpha = 0.3, process_noise = 0.05, measurement_noise = 0.5,
+                 n_learning_frames = 20, outlier_threshold = 8, min_deviation = 15, max_frame_age = None):
+
+        # Tuple of the resolution of the camera
+        self.resolution = resolution
+        self.n_pixels = resolution[0] * resolution[1]
+
+        if mode not in ('ema', 'kalman', None):
+            raise ValueError(f"Unknown frame filter mode: {mode}")
+        self.mode = mode
+
+        # With constant noise the Kalman gain converges to a constant, so the filter is an EMA with that gain
+        # Steady-state prior variance M solves M = M r / (M + r) + q
+        if mode == 'kalman':
+            prior_variance = (process_noise + np.sqrt(process_noise**2 + 4 * process_noise * measurement_noise)) / 2
+            self.gain = prior_variance / (prior_variance + measurement_noise)
+        else:
+            self.gain = alpha
+
+        self.n_learning_frames = n_learning_frames
+        self.outlier_threshold = outlier_threshold
+        self.min_deviation = min_deviation
+        self.max_frame_age = max_frame_age
+
+        # Filtered frame
+        self.state = np.zeros(self.n_pixels)
+        self.difference = np.zeros(self.n_pixels)
+        self.initialized = False
+
+        # Startup frames for the dead pixel mask
+        self.learning_frames = np.zeros((n_learning_frames, self.n_pixels))
+        self.n_learned = 0
+
+        # Dead pixels and their valid neighbours, empty until learned
+        self.dead_pixels = np.zeros(0, dtype = np.int64)
+        self.neighbours = np.zeros((0, 8), dtype = np.int64)
+        self.neighbour_weights = np.zeros((0, 8))
+        self.neighbour_values = np.zeros((0, 8))
+        self.replacement = np.zeros(0)
+
+        # 8 neighbours of every pixel, out of frame neighbours point to the pixel itself and are masked
+        rows, columns = np.indices(resolution)
+        offsets = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+        neighbour_rows = np.stack([rows + dr for dr, _ in offsets], axis = -1).reshape(self.n_pixels, 8)
+        neighbour_columns = np.stack([columns + dc for _, dc in offsets], axis = -1).reshape(self.n_pixels, 8)
+        self.neighbour_inside = (neighbour_rows >= 0) & (neighbour_rows < resolution[0]) & (neighbour_columns >= 0) & (neighbour_columns < resolution[1])
+        self.all_neighbours = np.where(self.neighbour_inside, neighbour_rows * resolution[1] + neighbour_columns, np.arange(self.n_pixels)[:, None])
+
+        # Stale frame detection
+        self.last_sequence = None
+        self.stale = False
+        self.stale_frames = 0
+        self.frame_age = 0.
+
+    def learn_dead_pixels(self):
+        '''Mark pixels of the startup frames that are not finite, or isolated above or below all of their neighbours, as dead
+        Edges of hot regions have neighbours on both sides of their value and are kept
+        '''
+
+        median_frame = np.median(self.learning_frames, axis = 0)
+        finite = np.isfinite(median_frame)
+
+        # Pixel noise from the median absolute deviation of every pixel over the startup frames
+        mad = np.median(np.abs(self.learning_frames[:, finite] - median_frame[finite]), axis = 0)
+        robust_std = 1.4826 * np.median(mad)
+        margin = max(self.outlier_threshold * robust_std, self.min_deviation)
+
+        # Distance above the hottest or below the coldest neighbour
+        neighbour_frame = np.where(self.neighbour_inside & np.isfinite(median_frame[self.all_neighbours]), median_frame[self.all_neighbours], np.nan)
+        above = median_frame - np.nanmax(neighbour_frame, axis = 1)
+        below = np.nanmin(neighbour_frame, axis = 1) - median_frame
+        dead = ~finite | (above > margin) | (below > margin)
+
+        self.set_dead_pixels(np.flatnonzero(dead))
+
+    def set_dead_pixels(self, dead_pixels):
+        '''Precompile the replacement of dead pixels by the mean of their valid neighbours'''
+
+        dead_mask = np.zeros(self.n_pixels, dtype = bool)
+        dead_mask[dead_pixels] = True
+
+        self.dead_pixels = np.asarray(dead_pixels, dtype = np.int64)
+        self.neighbours = self.all_neighbours[self.dead_pixels]
+        valid = self.neighbour_inside[self.dead_pixels] & ~dead_mask[self.neighbours]
+
+        # Unused slots point to a valid neighbour, so a non-finite dead pixel does not leak through a zero weight
+        first_valid = self.neighbours[np.arange(len(self.dead_pixels)), np.argmax(valid, axis = 1)]
+        self.neighbours = np.where(valid, self.neighbours, first_valid[:, None])
+
+        # A dead pixel without valid neighbours keeps its value
+        count = valid.sum(axis = 1, keepdims = True)
+        self.neighbour_weights = np.divide(valid, count, out = np.zeros(valid.shape), where = count > 0)
+        keep = count[:, 0] == 0
+        self.neighbours[keep, 0] = self.dead_pixels[keep]
+        self.neighbour_weights[keep, 0] = 1
+
+        self.neighbour_values = np.zeros(self.neighbours.shape)
+        self.replacement = np.zeros(len(self.dead_pixels))
+
+        if len(self.dead_pixels):
+            print(f"Frame filter: {len(self.dead_pixels)} dead pixels replaced by their neighbours: {self.dead_pixels.tolist()}")
+
+    def is_stale(self, sequence, timestamp):
+        '''True if the frame was already filtered or is older than max_frame_age'''
+
+        stale = sequence is not None and sequence == self.last_sequence
+        self.last_sequence = sequence
+
+        if timestamp:
+            self.frame_age = time.monotonic() - timestamp
+            if self.max_frame_age is not None and self.frame_age > self.max_frame_age:
+                stale = True
+
+        return stale
+
+    def apply(self, frame, sequence = None, timestamp = None):
+        '''Filter the flattened frame in place
+        sequence and timestamp (time.monotonic) identify the frame, a repeated or old frame is not filtered again
+        '''
+
+        self.stale = self.is_stale(sequence, timestamp)
+        if self.stale:
+            self.stale_frames += 1
+            if self.initialized:
+                np.copyto(frame, self.state)
+            return
+
+        # Learn the dead pixel mask from the first fresh frames
+        if self.n_learned < self.n_learning_frames:
+            np.copyto(self.learning_frames[self.n_learned], frame)
+            self.n_learned += 1
+            if self.n_learned == self.n_learning_frames:
+                self.learn_dead_pixels()
+
+                # Restart the filter from the first clean frame
+                self.initialized = False
+
+        # Replace dead pixels by the mean of their neighbours
+        if len(self.dead_pixels):
+            np.take(frame, self.neighbours, out = self.neighbour_values)
+            np.multiply(self.neighbour_values, self.neighbour_weights, out = self.neighbour_values)
+            np.sum(self.neighbour_values, axis = 1, out = self.replacement)
+            np.put(frame, self.dead_pixels, self.replacement)
+
+        if self.mode is None:
+            return
+
+        # state += gain * (frame - state)
+        if not self.initialized:
+            np.copyto(self.state, frame)
+            self.initialized = True
+        else:
+            np.subtract(frame, self.state, out = self.difference)
+            np.multiply(self.difference, self.gain, out = self.difference)
+            np.add(self.state, self.difference, out = self.state)
+
+        np.copyto(frame, self.state)
+
+
+if __name__ == "__main__":
+    # Check the noise reduction and the dead pixel rejection on a synthetic scene, and time a tick
+    import timeit
+
+    rng = np.random.default_rng(0)
+    rows, columns = np.indices((24, 32))
+    scene = (30 + 60 * np.exp(-((rows - 12)**2 + (columns - 16)**2) / 30)).reshape(-1)
+    dead = [5, 100, 767]
+
+    frame_filter = FrameFilter(mode = 'kalman')
+    frame = np.zeros(768)
+    errors = []
+    for sequence in range(200):
+        np.add(scene, rng.normal(0, 0.7, 768), out = frame)
+        frame[dead] = [-273, 500, np.nan]
+        frame_filter.apply(frame, sequence, time.monotonic())
+        errors.append(np.std(np.delete(frame - scene, dead)))
+
+    print(f"Kalman gain: {frame_filter.gain:.3f}, noise before: 0.70, after: {np.mean(errors[-50:]):.2f} degC")
+    print(f"Dead pixels found: {frame_filter.dead_pixels.tolist()}, max error on them: {np.max(np.abs(frame[dead] - scene[dead])):.2f} degC")
+
+    frame_filter.apply(frame, sequence, time.monotonic())
+    print(f"Repeated frame stale: {frame_filter.stale}")
+
+    sequence = [1000]
+    def tick():
+        sequence[0] += 1
+        frame_filter.apply(frame, sequence[0], None)
+
+    n = 10000
+    print(f"Filter tick: {timeit.timeit(tick, number = n) / n * 1e6:.1f} us")
@@ -0,0 +1,219 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Import libraries
+import heapq
+import itertools
+import threading
+import time
+
+class BusManager():
+    '''Single owner of the I2C bus shared by the thermal camera, the ADCs and the DACs
+
+    Every transaction of a managed device holds the bus lock. Waiting transactions are granted in
+    order of priority, then arrival, so flow reads and DAC writes go ahead of the next camera read.
+    The time each device waits for and holds the bus is recorded.
+    '''
+
+    # Priorities, lower values are served first
+    PRIORITY_DAC = 0
+    PRIORITY_ADC = 1
+    PRIORITY_CAMERA = 2
+
+    def __init__(self):
+
+        # Bus handles, opened on first use, devices may be brought up from several threads
+        self.i2c_connection = None
+        self.smbus_connection = None
+        self.connection_lock = threading.Lock()
+
+        # Priority lock: owner of the bus and heap of waiting (priority, arrival) tickets
+        self.condition = threading.Condition()
+        self.owner = None
+        self.waiting = []
+        self.arrival = itertools.count()
+
+        # Per device: number of transactions, total and maximum wait and hold time in seconds
+        # Recorded after the bus is released, by every thread using the bus
+        self.statistics = {}
+        self.statistics_lock = threading.Lock()
+
+    def i2c(self):
+        '''busio.I2C connection used by the Adafruit drivers'''
+        with self.connection_lock:
+            if self.i2c_connection is None:
+                import board
+                import busio
+                self.i2c_connection = busio.I2C(board.SCL, board.SDA)
+        return self.i2c_connection
+
+    def smbus(self):
+        '''SMBus connection used by the TLA2528 driver'''
+        with self.connection_lock:
+            if self.smbus_connection is None:
+                from smbus2 import SMBus
+                self.smbus_connection = SMBus(1)
+        return self.smbus_connection
+
+    def acquire(self, priority):
+        '''Wait until the bus is free and no waiting transaction has precedence'''
+
+        with self.condition:
+            ticket = (priority, next(self.arrival))
+            heapq.heappush(self.waiting, ticket)
+            while self.owner is not None or self.waiting[0] != ticket:
+                self.condition.wait()
+            heapq.heappop(self.waiting)
+            self.owner = ticket
+
+    def release(self):
+        '''Free the bus for the next waiting transaction'''
+
+        with self.condition:
+            self.owner = None
+            self.condition.notify_all()
+
+    def record(self, device, wait, hold):
+        '''Add one transaction to the statistics of a device'''
+
+        with self.statistics_lock:
+            statistics = self.statistics.setdefault(device, {'count': 0, 'wait': 0., 'wait_max': 0., 'hold': 0., 'hold_max': 0.})
+            statistics['count'] += 1
+            statistics['wait'] += wait
+            statistics['hold'] += hold
+            statistics['wait_max'] = max(statistics['wait_max'], wait)
+            statistics['hold_max'] = max(statistics['hold_max'], hold)
+
+    def transaction(self, device, priority):
+        '''Context manager holding the bus for one transaction of a device'''
+        return BusTransaction(self, device, priority)
+
+    def manage_i2c_device(self, i2c_device, device, priority):
+        '''Wrap an adafruit_bus_device I2CDevice so each of its transactions goes through the manager'''
+        return ManagedI2CDevice(self, i2c_device, device, priority)
+
+    def smbus_device(self, device, priority):
+        '''SMBus-like object for one device, each call is a managed transaction on the shared SMBus'''
+        return ManagedSMBus(self, self.smbus(), device, priority)
+
+    def print_statistics(self):
+        '''Print the bus time used by every device'''
+
+        with self.statistics_lock:
+            snapshot = {device: dict(statistics) for device, statistics in self.statistics.items()}
+
+        for device, statistics in sorted(snapshot.items()):
+            count = max(statistics['count'], 1)
+            print(f"{device}: {statistics['count']} transactions, "
+                  f"hold {statistics['hold'] / count * 1e3:.2f} ms mean, {statistics['hold_max'] * 1e3:.2f} ms max, total {statistics['hold']:.1f} s, "
+                  f"wait {statistics['wait'] / count * 1e3:.2f} ms mean, {statistics['wait_max'] * 1e3:.2f} ms max")
+
+class BusTransaction():
+    '''Holds the bus between __enter__ and __exit__ and records the timing'''
+
+    def __init__(self, manager, device, priority):
+        self.manager = manager
+        self.device = device
+        self.priority = priority
+
+    def __enter__(self):
+        self.request_time = time.perf_counter()
+        self.manager.acquire(self.priority)
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end_time = time.perf_counter()
+        self.manager.release()
+        self.manager.record(self.device, self.start_time - self.request_time, end_time - self.start_time)
+        return False
+
+class ManagedI2CDevice():
+    '''Proxy of an I2CDevice, "with device as i2c" also holds the managed bus'''
+
+    def __init__(self, manager, i2c_device, device, priority):
+        self.i2c_device = i2c_device
+        self.manager = manager
+        self.device = device
+        self.priority = priority
+
+        # Transaction in progress, per thread since the UI and the worker may both write the DACs
+        self.local = threading.local()
+
+    def __enter__(self):
+        transaction = self.manager.transaction(self.device, self.priority)
+        transaction.__enter__()
+        self.local.transaction = transaction
+        try:
+            return self.i2c_device.__enter__()
+        except BaseException:
+            transaction.__exit__(None, None, None)
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            return self.i2c_device.__exit__(exc_type, exc_value, traceback)
+        finally:
+            self.local.transaction.__exit__(exc_type, exc_value, traceback)
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['i2c_device'], name)
+
+class ManagedSMBus():
+    '''SMBus proxy for one device, every call is a managed transaction'''
+
+    def __init__(self, manager, bus, device, priority):
+        self.bus = bus
+        self.manager = manager
+        self.device = device
+        self.priority = priority
+
+    def write_i2c_block_data(self, *args, **kwargs):
+        with self.manager.transaction(self.device, self.priority):
+            return self.bus.write_i2c_block_data(*args, **kwargs)
+
+    def read_byte(self, *args, **kwargs):
+        with self.manager.transaction(self.device, self.priority):
+            return self.bus.read_byte(*args, **kwargs)
+
+    def i2c_rdwr(self, *messages):
+        with self.manager.transaction(self.device, self.priority):
+            return self.bus.i2c_rdwr(*messages)
+
+
+if __name__ == "__main__":
+    # Check that waiting DAC transactions go ahead of waiting camera transactions
+    order = []
+    manager = BusManager()
+
+    def transaction(device, priority, duration):
+        with manager.transaction(device, priority):
+            order.append(device)
+            time.sleep(duration)
+
+    # Hold the bus while a camera and then a DAC transaction queue up
+    holder = threading.Thread(target = transaction, args = ('camera', BusManager.PRIORITY_CAMERA, 0.2))
+    holder.start()
+    time.sleep(0.05)
+    threads = [threading.Thread(target = transaction, args = ('camera', BusManager.PRIORITY_CAMERA, 0.01))]
+    threads[0].start()
+    time.sleep(0.05)
+    threads.append(threading.Thread(target = transaction, args = ('dac', BusManager.PRIORITY_DAC, 0.01)))
+    threads[1].start()
+
+    for thread in [holder] + threads:
+        thread.join()
+
+    print(f"Order of transactions: {order}")
+    manager.print_statistics()
@@ -0,0 +1,295 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Import libraries
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+
+from source.decouplers import decouplers
+
+# Identification of the interaction between the MFCs and the region temperatures from saved runs
+#
+# Every temperature is modelled as a sum of first-order responses to the flow rate of every MFC,
+#     T_i(t) = c + sum_j G_ij x_ij(t),    tau_ij dx_ij/dt = F_j(t) - x_ij(t)
+# The inputs are filtered once for every time constant of a grid, the gains of a choice of time constants
+# are then a small least squares problem solved from the Gram matrix of all filtered inputs.
+# Each temperature picks its time constants by coordinate descent over the grid.
+# The constant c is removed per segment between MFC steps, so slow drifts of the rig do not bias the gains.
+
+
+def read_run(path):
+    '''Time, MFC flow rates and region temperatures of a run saved by the application
+    The columns are positional: time, n_region flow rates, n_region temperatures, then the other columns
+    '''
+
+    with open(path, 'r') as file:
+        # Skip comment lines, runs saved before the region hash moved to the _regions.json file start with one
+        header = file.readline()
+        while header.startswith('#'):
+            header = file.readline()
+
+        names = [name.strip() for name in header.split(',')]
+        n_region = len({name for name in names if name.startswith('mfc_')})
+        if names[0] != 'time' or n_region == 0:
+            raise ValueError(f"{path} is not a run saved by the application")
+
+        data = np.atleast_2d(np.loadtxt(file, delimiter = ','))
+
+    return data[:, 0], data[:, 1:n_region + 1], data[:, n_region + 1:2 * n_region + 1]
+
+def split_runs(time_points, max_gap = 5):
+    '''Start index of every continuous run, time going backwards or a gap of more than max_gap ticks starts a new one'''
+
+    dt = np.diff(time_points)
+    typical_dt = np.median(dt[dt > 0]) if np.any(dt > 0) else 1.
+    breaks = np.flatnonzero((dt <= 0) | (dt > max_gap * typical_dt)) + 1
+    return np.concatenate([[0], breaks])
+
+def detect_steps(flow_rate, run_starts, threshold, window = 3):
+    '''Steps of every MFC: indices where the mean flow rate over the next window differs from the previous window by more than threshold
+    Returns a list of (index, mfc, size)
+    '''
+
+    n_points, n_region = flow_rate.shape
+    cumulative = np.concatenate([np.zeros((1, n_region)), np.cumsum(flow_rate, axis = 0)])
+
+    # Mean of the window before and after every index
+    index = np.arange(window, n_points - window + 1)
+    before = (cumulative[index] - cumulative[index - window]) / window
+    after = (cumulative[index + window] - cumulative[index]) / window
+    change = after - before
+
+    # Windows straddling two runs are not steps
+    run_id = np.searchsorted(run_starts, np.arange(n_points), side = 'right')
+    same_run = run_id[index - window] == run_id[index + window - 1]
+    above = (np.abs(change) > threshold) & same_run[:, None]
+
+    steps = []
+    for mfc in range(n_region):
+        # One step per group of consecutive indices, at its largest change
+        flagged = np.flatnonzero(above[:, mfc])
+        if len(flagged) == 0:
+            continue
+        groups = np.split(flagged, np.flatnonzero(np.diff(flagged) > 1) + 1)
+        for group in groups:
+            peak = group[np.argmax(np.abs(change[group, mfc]))]
+            steps.append((int(index[peak]), mfc, float(change[peak, mfc])))
+
+    return sorted(steps)
+
+def filter_inputs(time_points, flow_rate, run_starts, time_constants):
+    '''First-order responses of every flow rate for every time constant, exact for inputs held between samples
+    Returns an array (n_points, n_region, n_tau), the filters restart at the steady state of every run
+    '''
+
+    n_points, n_region = flow_rate.shape
+    filtered = np.zeros((n_points, n_region, len(time_constants)))
+
+    dt = np.diff(time_points, prepend = time_points[0])
+    decay = np.exp(-np.maximum(dt, 0)[:, None] / time_constants[None, :])
+    starts = np.zeros(n_points, dtype = bool)
+    starts[run_starts] = True
+
+    state = np.zeros((n_region, len(time_constants)))
+    for k in range(n_points):
+        if starts[k]:
+            state[:] = flow_rate[k][:, None]
+        else:
+            # x_k = a x_k-1 + (1 - a) F_k-1
+            state -= flow_rate[k - 1][:, None]
+            state *= decay[k]
+            state += flow_rate[k - 1][:, None]
+        filtered[k] = state
+
+    return filtered
+
+def remove_segment_means(values, segment_starts):
+    '''Subtract the mean of every segment from values in place, along the first axis'''
+
+    lengths = np.diff(np.append(segment_starts, len(values)))
+    means = np.add.reduceat(values, segment_starts, axis = 0) / lengths.reshape((-1,) + (1,) * (values.ndim - 1))
+    values -= np.repeat(means, lengths, axis = 0)
+    return values
+
+def fit_interactions(filtered, temperature, time_constants, n_sweeps = 3):
+    '''Gains (n_region, n_region) and time constants of the response of every temperature to every flow rate
+    filtered and temperature are segment-centered, returns the gains, the time constants and the residual variance
+    '''
+
+    n_points, n_region, n_tau = filtered.shape
+    columns = filtered.reshape(n_points, n_region * n_tau)
+
+    # Gram matrix of every filtered input, and their products with every temperature
+    gram = columns.T @ columns
+    projection = columns.T @ temperature
+    energy = np.sum(temperature**2, axis = 0)
+
+    gains = np.zeros((n_region, n_region))
+    tau_index = np.full((n_region, n_region), n_tau // 2)
+    residual = np.zeros(n_region)
+    regularization = 1e-9 * np.trace(gram) / len(gram)
+
+    for i in range(n_region):
+        for _ in range(n_sweeps):
+            for j in range(n_region):
+                # Column indices of every candidate time constant of input j, the others fixed
+                candidates = np.tile(np.arange(n_region) * n_tau + tau_index[i], (n_tau, 1))
+                candidates[:, j] = j * n_tau + np.arange(n_tau)
+
+                # Batched normal equations of all candidates
+                A = gram[candidates[:, :, None], candidates[:, None, :]] + regularization * np.eye(n_region)
+                b = projection[candidates, i]
+                solution = np.linalg.solve(A, b[:, :, None])[:, :, 0]
+                candidate_residual = energy[i] - np.sum(solution * b, axis = 1)
+
+                best = np.argmin(candidate_residual)
+                tau_index[i, j] = best
+                gains[i] = solution[best]
+                residual[i] = candidate_residual[best]
+
+    return gains, time_constants[tau_index], residual / n_points
+
+def decoupling_matrix(gains, time_constants, dynamic = True):
+    '''Decoupler D = G^-1 diag(G), scaled so every PID output keeps a unit weight on its own MFC
+    Then G D is diagonal and each PID loop sees its own region only. The lag of each off-diagonal term
+    approximates the lead-lag of the ideal decoupler by the difference of the time constants.
+    '''
+
+    matrix = np.linalg.solve(gains, np.diag(np.diag(gains)))
+    matrix /= np.diag(matrix)[None, :]
+
+    lags = None
+    if dynamic:
+        lags = np.maximum(time_constants - np.diag(time_constants)[:, None], 0)
+        np.fill_diagonal(lags, 0)
+    return matrix, lags
+
+def identify(paths, step_threshold = 5., time_constants = None):
+    '''Identify the interactions from several runs
+    Returns the gains, the time constants, the residual variance, the steps and the number of samples
+    '''
+
+    if time_constants is None:
+        time_constants = np.geomspace(0.5, 200, 40)
+
+    filtered_runs = []
+    temperature_runs = []
+    all_steps = []
+    for path in paths:
+        time_points, flow_rate, temperature = read_run(path)
+        run_starts = split_runs(time_points)
+        steps = detect_steps(flow_rate, run_starts, step_threshold)
+        all_steps += [(path, time_points[index], mfc, size) for index, mfc, size in steps]
+
+        # Segments between steps, within runs, each with its own constant
+        segment_starts = np.unique(np.concatenate([run_starts, [index for index, _, _ in steps]])).astype(np.int64)
+        filtered = filter_inputs(time_points, flow_rate, run_starts, time_constants)
+        filtered_runs.append(remove_segment_means(filtered, segment_starts))
+        temperature_runs.append(remove_segment_means(temperature.copy(), segment_starts))
+
+    n_region = {filtered.shape[1] for filtered in filtered_runs}
+    if len(n_region) != 1:
+        raise ValueError("The runs have different numbers of regions")
+    if not all_steps:
+        raise ValueError(f"No MFC step larger than {step_threshold} found, lower --step-threshold")
+
+    filtered = np.concatenate(filtered_runs)
+    temperature = np.concatenate(temperature_runs)
+    gains, taus, residual = fit_interactions(filtered, temperature, time_constants)
+    return gains, taus, residual, all_steps, len(temperature)
+
+def write_synthetic_run(path, n_region = 3, hours = 1, period = 0.5, seed = 0):
+    '''Write a run of random MFC steps through a known interaction, returns its gains and time constants'''
+
+    rng = np.random.default_rng(seed)
+    gains = -0.3 * np.eye(n_region) - 0.06 * rng.uniform(0.5, 1, (n_region, n_region)) * (1 - np.eye(n_region))
+    taus = np.where(np.eye(n_region, dtype = bool), 8., rng.uniform(15, 40, (n_region, n_region)))
+
+    n_points = int(hours * 3600 / period)
+    time_points = period * np.arange(n_points)
+
+    # Every MFC holds a random level for 60 to 180 s
+    flow_rate = np.zeros((n_points, n_region))
+    for j in range(n_region):
+        k = 0
+        while k < n_points:
+            hold = int(rng.uniform(60, 180) / period)
+            flow_rate[k:k + hold, j] = rng.uniform(20, 150)
+            k += hold
+
+    filtered = filter_inputs(time_points, flow_rate, np.array([0]), np.unique(taus))
+    tau_index = np.searchsorted(np.unique(taus), taus)
+    temperature = 100 + np.einsum('ij,kij->ki', gains, filtered[:, np.arange(n_region)[None, :], tau_index])
+    temperature += 0.002 * np.cumsum(rng.normal(0, 1, (n_points, n_region)), axis = 0) + rng.normal(0, 0.1, (n_points, n_region))
+
+    with open(path, 'w') as file:
+        file.write('time' + ''.join(f', mfc_{i}' for i in range(n_region)) + ''.join(f', temperature_{i}' for i in range(n_region)) + '\n')
+        np.savetxt(file, np.column_stack([time_points, flow_rate, temperature]), delimiter = ',', fmt = '%10.5f')
+
+    return gains, taus
+
+def main():
+    parser = argparse.ArgumentParser(description='Identify the interaction between the MFCs and the region temperatures from saved runs and write the decoupling matrix')
+    parser.add_argument('runs', nargs='*', help='Run files saved by the application (the .csv file, not _temp or _stats)')
+    parser.add_argument('-o', '--output', default='decoupler.json', help='Decoupling matrix file, loaded by the application with --decoupler')
+    parser.add_argument('--arrangement', help='Name of the arrangement of controllers stored in the file')
+    parser.add_argument('--step-threshold', type=float, default=5, help='Smallest change of an MFC flow rate detected as a step')
+    parser.add_argument('--tau-min', type=float, default=0.5, help='Shortest time constant considered in seconds')
+    parser.add_argument('--tau-max', type=float, default=200, help='Longest time constant considered in seconds')
+    parser.add_argument('--n-tau', type=int, default=40, help='Number of time constants considered, spaced geometrically')
+    parser.add_argument('--static', action='store_true', help='Write a static matrix without the lags of the decoupling terms')
+    parser.add_argument('--synthetic', type=float, metavar='HOURS', help='Identify a synthetic run of this length with a known interaction instead')
+    arguments = parser.parse_args()
+
+    known = None
+    synthetic_directory = None
+    if arguments.synthetic:
+        # The generated run is written to a temporary directory, removed once identified
+        synthetic_directory = tempfile.TemporaryDirectory()
+        arguments.runs = [os.path.join(synthetic_directory.name, 'synthetic_run.csv')]
+        known = write_synthetic_run(arguments.runs[0], hours = arguments.synthetic)
+    elif not arguments.runs:
+        parser.error('no run files given')
+
+    start = time.perf_counter()
+    time_constants = np.geomspace(arguments.tau_min, arguments.tau_max, arguments.n_tau)
+    try:
+        gains, taus, residual, steps, n_points = identify(arguments.runs, arguments.step_threshold, time_constants)
+    except ValueError as error:
+        parser.exit(1, f"{error}\n")
+    finally:
+        if synthetic_directory is not None:
+            synthetic_directory.cleanup()
+    elapsed = time.perf_counter() - start
+
+    print(f"{n_points} samples, {len(steps)} steps, identified in {elapsed:.2f} s")
+    np.set_printoptions(precision = 4, suppress = True)
+    print(f"Gains (temperature i per flow rate j):\n{gains}")
+    print(f"Time constants (s):\n{taus}")
+    print(f"Residual standard deviation: {np.sqrt(residual)}")
+    if known is not None:
+        print(f"Largest gain error: {np.max(np.abs(gains - known[0])):.4f}, largest time constant error: {np.max(np.abs(taus - known[1]) / known[1]):.1%}")
+
+    matrix, lags = decoupling_matrix(gains, taus, dynamic = not arguments.static)
+    decoupler = decouplers(len(gains), matrix, lags, arguments.arrangement)
+    decoupler.save(arguments.output)
+    print(f"Decoupling matrix:\n{matrix}")
+    print(f"Written to {arguments.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,22 +3,41 @@ from PySide6.QtCore import QTimer, QElapsedTimer, QThread
 from PySide6.QtGui import QIcon
 import sys
 import os
+import time
+import argparse
 import numpy as np
 
 from source.UI import UI
 from source.solenoid_valve import Solenoid
 from source.temperature import Temperature
 from source.mass_flow_controller import MFC
-from source.pid_controller import PIDControl
+from source.flow_calibration import FlowCalibration
+from source.drivers import RigConfig
+from source.pid_controller import PIDBank
 from source.decouplers import decouplers
+from source.autotune import Autotune, interaction_groups
 from source.workers import MeasureAndControlWorker
+from source.startup import DeviceStartup
 
 class Application(QMainWindow):
-    def __init__(self, n_region=1, test_UI=False):
+    def __init__(self, n_region=1, test_UI=False, camera_options=None, control_period=0.5, replay_file=None, filter_options=None, flow_sample_rate=None, flow_calibration=None, solenoid_spi_speed=100000, simulator=None, rig=None, overrun_policy='skip', decoupler_file=None, decoupler_arrangement=None, autotune_options=None):
         super().__init__()
 
         self.n_region = n_region
         self.test_UI = test_UI
+        self.camera_options = camera_options or {}
+        self.replay_file = replay_file
+        self.filter_options = filter_options
+
+        # Simulated rig replacing the hardware, the full control loop runs against it
+        self.simulator = simulator
+
+        # Backend of every device, picked from the run mode unless a rig configuration is given
+        self.rig = rig if rig is not None else RigConfig.select(self.test_UI or self.replay_file is not None, self.simulator)
+
+        # Period of the measure and control loop in seconds, and what to do with the ticks missed by a slow tick
+        self.control_period = control_period
+        self.overrun_policy = overrun_policy
         
         application_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -31,21 +50,35 @@ class Application(QMainWindow):
         window_icon = QIcon(f"{application_dir}/nrc.png")
         self.setWindowIcon(window_icon)
 
-        # Create solenoid valve instance
-        self.solenoid = Solenoid(n_region, self.test_UI)
+        # Single owner of the I2C bus shared by the camera, ADCs and DACs
+        self.bus_manager = None
+        if not self.test_UI and not self.rig.uses_simulator():
+            from source.i2c_bus import BusManager
+            self.bus_manager = BusManager()
+            self.camera_options = dict(self.camera_options, bus_manager=self.bus_manager)
 
-        # Create temperature instance
-        self.temperature = Temperature(n_region, self.test_UI)
+        # Create the device instances, their hardware is brought up concurrently while the UI is built
+        self.solenoid = Solenoid(n_region, self.test_UI, solenoid_spi_speed, self.simulator, self.rig, connect = False)
+        self.temperature = Temperature(n_region, self.test_UI, self.camera_options, self.replay_file, filter_options = self.filter_options, simulator = self.simulator, rig = self.rig, connect = False)
+        calibration = FlowCalibration.load(flow_calibration, n_region) if flow_calibration else None
+        self.MFC = MFC(n_region, test_UI, flow_sample_rate, self.bus_manager, calibration, self.simulator, self.rig, connect = False)
 
-        # Create MFC instance
-        self.MFC = MFC(n_region, test_UI)
+        self.device_startup = DeviceStartup({'solenoid valves': self.solenoid.connect, 'thermal camera': self.temperature.connect_camera, 'mass flow controllers': self.MFC.connect})
+        ui_start_time = time.perf_counter()
 
         # Create control objects
-        self.PID = []
-        for j in range(n_region):
-            self.PID.append(PIDControl())
+        self.PID = PIDBank(n_region)
         
-        self.decouplers = decouplers()
+        # Decoupling matrix of the arrangement of controllers, the built-in one for 2 regions without a file
+        if decoupler_file:
+            self.decouplers = decouplers.load(decoupler_file, n_region, decoupler_arrangement)
+        else:
+            self.decouplers = decouplers(n_region)
+
+        # Regions that do not interact through a loaded decoupling matrix are autotuned concurrently
+        # Without one the interactions are unknown and the regions are tuned one at a time
+        autotune_groups = interaction_groups(self.decouplers.matrix) if decoupler_file else None
+        self.autotune = Autotune(n_region, autotune_groups, **(autotune_options or {}))
 
         # Create UI instance
         self.UI = UI()
@@ -59,38 +92,154 @@ class Application(QMainWindow):
         self.measure_and_control_worker.stop_signal.connect(self.measure_and_control_thread.quit)
         self.measure_and_control_thread.finished.connect(self.measure_and_control_worker.deleteLater)
 
+        self.ui_time = time.perf_counter() - ui_start_time
+
+        # Lagged decoupling terms restart from the current outputs when the decoupler is switched on
+        self.UI.decoupler_checkbox.checkStateChanged.connect(self.decouplers.reset)
+
+        # The autotune runs while its box is checked, the box is unchecked and the gains shown once it finishes
+        self.UI.autotune_checkbox.checkStateChanged.connect(lambda: self.autotune.request(self.UI.autotune_checkbox.isChecked()))
+        self.measure_and_control_worker.autotune_finished_signal.connect(self.UI.show_autotune_gains)
+
+        # Loop timing shown in the status bar after every tick
+        self.measure_and_control_worker.update_ui_signal.connect(self.show_loop_status)
+
+        # The controls are disabled until every device is ready, the progress is shown in the status bar
+        self.UI.setEnabled(False)
+        self.startup_timer = QTimer(self)
+        self.startup_timer.timeout.connect(self.check_device_startup)
+        self.startup_timer.start(50)
+        self.check_device_startup()
+
+    def check_device_startup(self):
+        '''Show the devices still starting, start the measure and control loop once all of them are ready'''
+
+        if not self.device_startup.ready():
+            self.statusBar().showMessage(f"Starting {', '.join(self.device_startup.pending())}... {self.device_startup.elapsed():.1f} s")
+            return
+
+        self.startup_timer.stop()
+        print(f"{'user interface':<24}{self.ui_time:8.3f} s")
+        self.device_startup.print_timings()
+
+        if self.device_startup.errors:
+            self.statusBar().showMessage(f"Failed to start {', '.join(self.device_startup.errors)}, see the console")
+            return
+
+        self.UI.setEnabled(True)
+        self.statusBar().showMessage(f"Devices ready in {self.device_startup.elapsed():.1f} s", 5000)
+        self.measure_and_control_worker.start_signal.emit()
+
+    def show_loop_status(self):
+        '''Show the jitter and overruns of the control loop, after the progress of the autotune'''
+        scheduler = self.measure_and_control_worker.scheduler
+        autotune_status = f"{self.autotune.status} | " if self.autotune.status else ''
+        self.statusBar().showMessage(f"{autotune_status}Tick {scheduler.ticks}, jitter {1000 * scheduler.jitter[(scheduler.ticks - 1) % scheduler.history]:.1f} ms, max {1000 * scheduler.max_jitter:.1f} ms, {scheduler.overruns} overruns, {scheduler.skipped} skipped")
+
     def closeEvent(self, event):
         
-        # Stop the worker's timer
+        # Stop the control loop after its current tick, then the worker's thread
+        self.measure_and_control_worker.stop_control_loop()
         self.measure_and_control_worker.stop_signal.emit()
 
         # Disconnect any signals to prevent access to deleted objects
         self.measure_and_control_worker.update_ui_signal.disconnect()
 
-        # Zero MFCs flow rate
-        for j in range(self.n_region):
-            self.MFC.set_flow_rate(j, 0)
+        # Let the devices finish starting before shutting them down
+        self.startup_timer.stop()
+        self.device_startup.wait()
+
+        # Stop the camera acquisition and flow sampling threads
+        self.temperature.stop()
+        self.MFC.stop()
+
+        # Report the loop timing and where the bus time went
+        self.measure_and_control_worker.scheduler.print_statistics()
+        if self.bus_manager is not None:
+            self.bus_manager.print_statistics()
 
-        # Zero solenoid state
-        for j in range(self.n_region):
-            self.solenoid.set_solenoid_state(j, False)
+        # Zero MFCs flow rate, writing every channel regardless of the cached codes
+        if 'mass flow controllers' not in self.device_startup.errors:
+            self.MFC.set_flow_rates(np.zeros(self.n_region), force = True)
+
+        # Close every solenoid with a single transfer
+        if 'solenoid valves' not in self.device_startup.errors:
+            self.solenoid.set_states(np.zeros(self.n_region, dtype=bool), force=True)
 
         # Allow the application to close
         event.accept()
 
+    @staticmethod
+    def parse_arguments():
+        '''Parse command line arguments, unknown arguments are left to Qt'''
+        parser = argparse.ArgumentParser(description='Active cooling experiment')
+        parser.add_argument('n_region', nargs='?', type=int, default=2, help='Number of controlled regions')
+        parser.add_argument('--rebuild-calibration', action='store_true', help='Read and parse the thermal camera EEPROM again instead of using the cached calibration')
+        parser.add_argument('--refresh-rate', type=float, default=1, choices=[0.5, 1, 2, 4, 8, 16, 32, 64], help='Thermal camera sub-page rate in Hz')
+        parser.add_argument('--control-period', type=float, default=0.5, help='Period of the measure and control loop in seconds')
+        parser.add_argument('--overrun-policy', choices=['skip', 'catch_up'], default='skip', help='Ticks missed while a tick runs late are dropped (skip) or run back to back (catch_up)')
+        parser.add_argument('--static', action='store_true', help='Test mode: serve the static frame with no-op devices instead of the simulated rig')
+        parser.add_argument('--time-scale', type=float, default=1, help='Speed of the simulated rig relative to the wall clock, in test mode or for the simulated devices of a rig file')
+        parser.add_argument('--replay', metavar='FILE', help='Test mode: stream frames from a recording (_temp.csv or .npy) instead of the static frame')
+        parser.add_argument('--replay-rate', type=float, help='Test mode: recorded frames per second, default is one frame per control tick')
+        parser.add_argument('--replay-once', action='store_true', help='Test mode: hold the last frame instead of looping the recording')
+        parser.add_argument('--flow-sample-rate', type=float, default=100, help='Background flow meter sampling rate in Hz, averaged over each control tick, 0 reads once per tick')
+        parser.add_argument('--flow-calibration', metavar='FILE', help='JSON file with the voltage to flow rate calibration of every MFC')
+        parser.add_argument('--solenoid-spi-speed', type=int, default=100000, help='SPI clock of the solenoid drivers in Hz')
+        parser.add_argument('--rig', metavar='FILE', help='JSON file selecting the driver and options of the camera, flow meters, flow actuators and valves')
+        parser.add_argument('--decoupler', metavar='FILE', help='JSON file with the decoupling matrix of the arrangement of controllers')
+        parser.add_argument('--decoupler-arrangement', metavar='NAME', help='Arrangement to use from a decoupler file holding several')
+        parser.add_argument('--autotune-base-flow', type=float, default=50, help='Autotune: flow rate of every region around the steps')
+        parser.add_argument('--autotune-step', type=float, default=50, help='Autotune: flow rate step of the regions being tuned')
+        parser.add_argument('--autotune-settle-time', type=float, default=30, help='Autotune: seconds at the base flow rate before each step')
+        parser.add_argument('--autotune-step-time', type=float, default=60, help='Autotune: seconds of step response recorded for each group of regions')
+        parser.add_argument('--filter', choices=['ema', 'kalman'], help='Filter every pixel over time and replace dead pixels learned at startup')
+        parser.add_argument('--filter-alpha', type=float, default=0.3, help='Weight of the new frame in the EMA filter')
+        parser.add_argument('--max-frame-age', type=float, help='Frames older than this many seconds are reported as stale')
+        return parser.parse_known_args()[0]
+
+    @staticmethod
+    def frame_filter_options(arguments):
+        '''Frame filter options from the command line, None without --filter'''
+        if arguments.filter is None:
+            return None
+        return {'mode': arguments.filter, 'alpha': arguments.filter_alpha, 'max_frame_age': arguments.max_frame_age}
+
+    @staticmethod
+    def autotune_options(arguments):
+        '''Autotune experiment options from the command line'''
+        return {'base_flow_rate': arguments.autotune_base_flow, 'step_size': arguments.autotune_step, 'settle_time': arguments.autotune_settle_time, 'step_time': arguments.autotune_step_time}
+
     @staticmethod
     def run():
         app = QApplication(sys.argv)        
-        n_region = int(sys.argv[1]) if len(sys.argv) > 1 else 2
-        window = Application(n_region=n_region)
+        arguments = Application.parse_arguments()
+        camera_options = {'rebuild_calibration': arguments.rebuild_calibration, 'refresh_rate': arguments.refresh_rate}
+        rig = RigConfig.load(arguments.rig) if arguments.rig else None
+
+        # Devices a rig file hands to the simulated rig run against a simulator
+        simulator = None
+        if rig is not None and rig.uses_simulator():
+            from source.simulator import Simulator
+            simulator = Simulator(arguments.n_region, time_scale=arguments.time_scale)
+
+        window = Application(n_region=arguments.n_region, camera_options=camera_options, control_period=arguments.control_period, overrun_policy=arguments.overrun_policy, decoupler_file=arguments.decoupler, decoupler_arrangement=arguments.decoupler_arrangement, autotune_options=Application.autotune_options(arguments), filter_options=Application.frame_filter_options(arguments), flow_sample_rate=arguments.flow_sample_rate or None, flow_calibration=arguments.flow_calibration, solenoid_spi_speed=arguments.solenoid_spi_speed, simulator=simulator, rig=rig)
         window.show()
         sys.exit(app.exec())
 
     @staticmethod
     def run_test():
         app = QApplication(sys.argv)
-        n_region = int(sys.argv[1]) if len(sys.argv) > 1 else 2
-        window = Application(n_region=n_region, test_UI=True)
+        arguments = Application.parse_arguments()
+        if arguments.static or arguments.replay:
+            # Recorded or static frames, the devices do nothing
+            replay_options = {'frame_rate': arguments.replay_rate, 'loop': not arguments.replay_once}
+            window = Application(n_region=arguments.n_region, test_UI=True, camera_options=replay_options, control_period=arguments.control_period, overrun_policy=arguments.overrun_policy, decoupler_file=arguments.decoupler, decoupler_arrangement=arguments.decoupler_arrangement, autotune_options=Application.autotune_options(arguments), replay_file=arguments.replay, filter_options=Application.frame_filter_options(arguments))
+        else:
+            # Full control loop against the simulated rig
+            from source.simulator import Simulator
+            simulator = Simulator(arguments.n_region, time_scale=arguments.time_scale)
+            window = Application(n_region=arguments.n_region, control_period=arguments.control_period, overrun_policy=arguments.overrun_policy, decoupler_file=arguments.decoupler, decoupler_arrangement=arguments.decoupler_arrangement, autotune_options=Application.autotune_options(arguments), filter_options=Application.frame_filter_options(arguments), flow_sample_rate=arguments.flow_sample_rate or None, simulator=simulator)
         window.show()
         sys.exit(app.exec())
 
@@ -12,72 +12,300 @@ Redistribution and use in source and binary forms, with or without modification,
 THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 '''
 
+import threading
+import time
 import numpy as np
+from source.flow_calibration import FlowCalibration
+from source.drivers import RigConfig
+
+class FlowSampler():
+	'''Background thread reading the flow meters at a fixed rate into a ring buffer
+	Each control tick pulls the mean, minimum, maximum and number of samples since the previous pull
+	'''
+
+	# read_analog(out) fills out with one voltage per channel
+	# rate is the sampling rate in Hz, capacity the number of samples kept in the ring buffer
+	def __init__(self, read_analog, n_channel, rate = 100, capacity = 4096):
+
+		self.read_analog = read_analog
+		self.rate = rate
+		self.period = 1 / rate
+
+		# Ring buffer of samples, count is the total number of samples written
+		self.capacity = capacity
+		self.buffer = np.zeros((capacity, n_channel))
+		self.sample = np.zeros(n_channel)
+		self.count = 0
+		self.pulled = 0
+
+		# Indices of the samples of the current pull, preallocated at full size
+		self.offsets = np.arange(capacity)
+		self.indices = np.zeros(capacity, dtype = np.int64)
+
+		# Lock only protects the copy of a sample into the buffer and the pull
+		self.lock = threading.Lock()
+		self.thread = None
+		self.running = threading.Event()
+
+		# Samples missed because a read took longer than the period, and failed reads
+		self.overruns = 0
+		self.errors = 0
+
+	def start(self):
+		'''Start the sampling thread'''
+
+		if self.running.is_set():
+			return
+
+		self.running.set()
+		self.thread = threading.Thread(target = self.sampling_loop, name = 'FlowSampler', daemon = True)
+		self.thread.start()
+
+	def stop(self, timeout = 2):
+		'''Stop the sampling thread'''
+
+		self.running.clear()
+		if self.thread is not None:
+			self.thread.join(timeout)
+			self.thread = None
+
+	def sampling_loop(self):
+		'''Read one sample per period, on absolute deadlines so the rate does not drift'''
+
+		deadline = time.monotonic()
+		while self.running.is_set():
+			# Any failure is counted and the sampling goes on, the control loop relies on this thread
+			try:
+				self.read_analog(self.sample)
+			except Exception:
+				self.errors += 1
+			else:
+				with self.lock:
+					self.buffer[self.count % self.capacity] = self.sample
+					self.count += 1
+
+			deadline += self.period
+			delay = deadline - time.monotonic()
+			if delay > 0:
+				time.sleep(delay)
+			else:
+				# Skip the missed deadlines instead of reading in a burst
+				missed = int(-delay / self.period) + 1
+				self.overruns += missed
+				deadline += missed * self.period
+
+	def pull(self, mean, minimum, maximum):
+		'''Write the statistics of the samples since the previous pull to mean, minimum and maximum
+		Returns the number of samples, the outputs are left unchanged if there are none
+		'''
+
+		with self.lock:
+			n_sample = min(self.count - self.pulled, self.capacity)
+			if n_sample > 0:
+				indices = self.indices[:n_sample]
+				np.add(self.offsets[:n_sample], self.count - n_sample, out = indices)
+				np.remainder(indices, self.capacity, out = indices)
+				samples = self.buffer[indices]
+			self.pulled = self.count
+
+		if n_sample > 0:
+			np.mean(samples, axis = 0, out = mean)
+			np.min(samples, axis = 0, out = minimum)
+			np.max(samples, axis = 0, out = maximum)
+		return n_sample
 
 class MFC():
 
-	def __init__(self, n_region, test_UI = False):
+	# DAC7578 command writing an input register and updating every output (software LDAC)
+	dac_write_global_update = 0x20
+
+	# sample_rate in Hz reads the flow meters in the background and reports the mean over each tick, None reads once per tick
+	# bus_manager shares the I2C bus with the other devices, the MFCs open their own connections otherwise
+	# calibration is a FlowCalibration, the default reproduces the nominal 1-5 V conversions
+	# simulator replaces the ADCs and DACs by the simulated ones
+	# rig selects the flow meter and actuator backends, by default the simulated ones with a simulator and the TLA2528 and DACx578 otherwise
+	# connect creates the devices in the constructor, otherwise connect is called later, possibly from another thread
+	def __init__(self, n_region, test_UI = False, sample_rate = None, bus_manager = None, calibration = None, simulator = None, rig = None, connect = True):
 
 		self.test_UI = test_UI
 		self.flow_rate = np.zeros(n_region)
 		self.flow_rate_setpoint = np.zeros(n_region)
 
-		if test_UI:
-			return
+		# Voltage to flow rate conversions of every channel
+		self.calibration = calibration if calibration is not None else FlowCalibration(n_region)
 
-		from source.TLA2825IRTER import TLA2528
-		from adafruit_dacx578 import DACx578
-		
-		import board
-		import busio
+		# Last flow rate requested for every region
+		self.flow_rate_request = np.zeros(n_region)
+		self.setpoint_work = np.zeros(n_region)
 
-		i2c = busio.I2C(board.SCL, board.SDA)
-			
-		self.ADC = [TLA2528(address=0x12), TLA2528(address=0x13)]
-		self.ADC_analog = np.zeros(n_region)
-	
-		self.DAC = [DACx578(i2c, address=0x48), DACx578(i2c, address=0x47)]
+		# Range of the flow rate and number of samples over the last tick
+		self.flow_rate_min = np.zeros(n_region)
+		self.flow_rate_max = np.zeros(n_region)
+		self.flow_samples = 0
+		self.sampler = None
+
+		# DAC and channel of each region
+		self.dac_index = np.arange(n_region) // 8
+		self.dac_channel = np.arange(n_region) % 8
+
+		# Last code written to each channel, -1 until written
+		self.dac_codes = np.full(n_region, -1, dtype = np.int64)
+		self.new_dac_codes = np.zeros(n_region, dtype = np.int64)
+		self.analog_input = np.zeros(n_region)
+
+		# The UI and the control loop both set flow rates, the lock keeps the requests and the cached codes consistent with the DACs
+		self.lock = threading.Lock()
+
+		# Channel writes issued and skipped because the code did not change
+		self.dac_writes = 0
+		self.dac_writes_skipped = 0
+
+		if test_UI:
+			return
 
 		self.n_region = n_region
 		self.flow_rate = np.zeros(n_region)
-	
-	def get_analog_read(self):
+		self.ADC_analog = np.zeros(n_region)
+		self.ADC_analog_min = np.zeros(n_region)
+		self.ADC_analog_max = np.zeros(n_region)
+
+		# Flow meters and DACs of the rig backends, created by connect
+		if rig is None:
+			rig = RigConfig.select(simulator = simulator)
+		self.rig = rig
+		self.bus_manager = bus_manager
+		self.simulator = simulator
+		self.sample_rate = sample_rate
+
+		if connect:
+			self.connect()
+
+	def connect(self):
+		'''Create the flow meters and DACs and start the background sampling, may run in another thread'''
 		if self.test_UI:
 			return
-		
+
+		self.ADC = self.rig.create('flow_meter', bus_manager = self.bus_manager, simulator = self.simulator)
+		self.DAC = self.rig.create('flow_actuator', bus_manager = self.bus_manager, simulator = self.simulator)
+
+		# Full-scale code of the DAC of every region, from its resolution like the shift of write_dac_channels
+		self.dac_full_scale = np.array([(1 << self.DAC[dac].resolution) - 1 for dac in self.dac_index], dtype = float)
+
+		if self.sample_rate is not None:
+			self.sampler = FlowSampler(self.read_analog, self.n_region, self.sample_rate)
+			self.sampler.start()
+
+	def read_analog(self, out):
+		'''Read the voltage of every flow meter into out'''
 		n_points_ADC0 = min(8, self.n_region)
-		self.ADC_analog[:n_points_ADC0] = self.ADC[0].measure_voltage()
+		out[:n_points_ADC0] = self.ADC[0].measure_voltage()[:n_points_ADC0]
 		if self.n_region > 8:
-			self.ADC_analog[n_points_ADC0:10] = self.ADC[1].measure_voltage()[:2]
+			out[n_points_ADC0:10] = self.ADC[1].measure_voltage()[:2]
+	
+	def get_analog_read(self):
+		if self.test_UI:
+			return
+
+		# Mean of the background samples since the last tick
+		# Without new samples the previous tick's values are kept, the sampler thread owns the ADCs
+		if self.sampler is not None:
+			self.flow_samples = self.sampler.pull(self.ADC_analog, self.ADC_analog_min, self.ADC_analog_max)
+			return
+
+		self.read_analog(self.ADC_analog)
+		np.copyto(self.ADC_analog_min, self.ADC_analog)
+		np.copyto(self.ADC_analog_max, self.ADC_analog)
+		self.flow_samples = 1
+
+	def analog_to_flow_rate(self, analog, out):
+		'''Convert flow meter voltages to flow rates, negative flow rates read as 0'''
+		self.calibration.measure.to_flow(analog, out)
+		np.maximum(out, 0, out = out)
+		np.round(out, decimals = 2, out = out)
 
 	def get_flow_rate(self):
 		if self.test_UI:
 			return
 		self.get_analog_read()
-		
-		for i in range(self.flow_rate.shape[0]):
-			flow_rate = (self.ADC_analog[i] - 1) * 75 * 0.98
-			
-			if flow_rate <= 0:
-				self.flow_rate[i] = 0
-			else:
-				self.flow_rate[i] = np.round(flow_rate, decimals=2)
+
+		self.analog_to_flow_rate(self.ADC_analog, self.flow_rate)
+		self.analog_to_flow_rate(self.ADC_analog_min, self.flow_rate_min)
+		self.analog_to_flow_rate(self.ADC_analog_max, self.flow_rate_max)
+
+	def stop(self):
+		'''Stop the background sampling'''
+		if self.sampler is not None:
+			self.sampler.stop()
 				
 	def set_flow_rate(self, region, flow_rate):
+		'''Set the flow rate of one region, the other regions keep their last request'''
+		if self.test_UI:
+			return
+		with self.lock:
+			self.flow_rate_request[region] = flow_rate
+			self.write_flow_rates(self.flow_rate_request, False, [region])
+
+	def set_flow_rates(self, flow_rates, force = False, regions = None):
+		'''Set the flow rate of every region at once
+		Only channels whose DAC code changed are written, unless force is set
+		regions restricts the writes to some regions
+		'''
 		if self.test_UI:
 			return
-		flow_rate = max(0., flow_rate)
-		analog_input = flow_rate/75. + 1.
-		if((analog_input <= 5.) and (analog_input > 1.)):
-			self.flow_rate_setpoint[region] = (analog_input - 1.) * 75.
-		elif analog_input > 5.:
-			self.flow_rate_setpoint[region] = 5.
-			analog_input = 5.
-		else:
-			self.flow_rate_setpoint[region] = 0.
-			analog_input = 0.
-
-		if region < 8:
-			self.DAC[0].channels[region].normalized_value = analog_input / 5.
-		else:
-			self.DAC[1].channels[region - 8].normalized_value = analog_input / 5.
+		with self.lock:
+			self.write_flow_rates(flow_rates, force, regions)
+
+	def write_flow_rates(self, flow_rates, force, regions):
+		'''Body of set_flow_rates, called with the lock held'''
+		if flow_rates is not self.flow_rate_request:
+			np.copyto(self.flow_rate_request, flow_rates)
+
+		# Setpoint voltages from the calibration of every channel
+		# Setpoints above 5 V are clamped and reported as 5, setpoints at or below 1 V turn the output off
+		analog_input = self.calibration.command.to_voltage(np.maximum(self.flow_rate_request, 0.), self.analog_input)
+		valid = (analog_input > 1.) & (analog_input <= 5.)
+		over = analog_input > 5.
+		self.calibration.command.to_flow(analog_input, self.setpoint_work)
+		np.copyto(self.flow_rate_setpoint, np.where(valid, self.setpoint_work, np.where(over, 5., 0.)), where = self.region_mask(regions))
+		analog_input[:] = np.where(valid, analog_input, np.where(over, 5., 0.))
+
+		# Vectorized DAC codes, truncated like the normalized_value setter of the DAC channel
+		np.divide(analog_input, 5., out = analog_input)
+		np.multiply(analog_input, self.dac_full_scale, out = analog_input)
+		self.new_dac_codes[:] = analog_input
+
+		changed = np.ones(len(self.dac_codes), dtype = bool) if force else self.new_dac_codes != self.dac_codes
+		changed &= self.region_mask(regions)
+		self.dac_writes_skipped += int(np.count_nonzero(~changed & self.region_mask(regions)))
+
+		# One bus transaction per DAC, the last channel written updates all outputs of the DAC together
+		for dac in np.unique(self.dac_index[changed]):
+			channels = np.flatnonzero(changed & (self.dac_index == dac))
+			self.write_dac_channels(self.DAC[dac], self.dac_channel[channels], self.new_dac_codes[channels])
+			self.dac_codes[channels] = self.new_dac_codes[channels]
+			self.dac_writes += len(channels)
+
+	def region_mask(self, regions):
+		'''Boolean mask of the given regions, all regions for None'''
+		mask = np.ones(len(self.dac_codes), dtype = bool)
+		if regions is not None:
+			mask[:] = False
+			mask[regions] = True
+		return mask
+
+	def write_dac_channels(self, dac, channels, codes):
+		'''Write several channels of a DAC while holding the bus once'''
+
+		shift = 16 - dac.resolution
+		buffer = bytearray(3 * len(channels))
+		for i, (channel, code) in enumerate(zip(channels, codes)):
+			value = int(code) << shift
+			command = self.dac_write_global_update if i == len(channels) - 1 else 0x00
+			buffer[3*i : 3*i + 3] = bytes([command | int(channel), (value >> 8) & 0xFF, value & 0xFF])
+
+			# Keep the channel objects of the driver in sync with the outputs
+			dac.channels[channel]._value = int(code)
+
+		with dac.i2c_device as i2c:
+			for i in range(len(channels)):
+				i2c.write(buffer, start = 3*i, end = 3*i + 3)
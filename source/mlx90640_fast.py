@@ -0,0 +1,437 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Import libraries
+import os
+import numpy as np
+
+# Constants of the MLX90640 calculation (same as the Melexis/Adafruit driver)
+SCALEALPHA = 0.000001
+OPENAIR_TA_SHIFT = 8
+
+# Version of the calibration cache layout, bump when calibration_parameters or their meaning change
+CALIBRATION_FORMAT_VERSION = 1
+
+def signed(value, bits):
+    '''Convert an unsigned integer (scalar or array) to two's complement'''
+    value = np.asarray(value, dtype = np.int64)
+    return np.where(value > (1 << (bits - 1)) - 1, value - (1 << bits), value)
+
+def signed_word(word):
+    '''Convert a single unsigned 16 bit word to two's complement'''
+    word = int(word)
+    return word - 65536 if word > 32767 else word
+
+def nibbles(words):
+    '''Split 16 bit words into their 4 signed nibbles, least significant first'''
+    words = np.asarray(words, dtype = np.int64)
+    return signed((words[:, None] >> np.array([0, 4, 8, 12])) & 0x000F, 4).reshape(-1)
+
+def quantize(values):
+    '''Round to the nearest integer away from zero, as the Melexis driver does'''
+    return np.trunc(values + np.copysign(0.5, values))
+
+def scale_exponent(maximum, limit):
+    '''Number of doublings of maximum needed to reach limit'''
+    exponent = 0
+    while maximum < limit:
+        maximum *= 2
+        exponent += 1
+    return exponent
+
+# Define vectorized MLX90640 calculation engine
+class MLX90640Fast:
+    '''Vectorized MLX90640 temperature calculation
+
+    The calibration parameters are extracted from the 832 EEPROM words once into
+    NumPy arrays, and each frame is computed with array operations instead of the
+    per-pixel loop of adafruit_mlx90640. The results match the Adafruit driver,
+    including its quantization of alpha, kta and kv.
+    '''
+
+    # Resolution of the camera
+    resolution = (24, 32)
+    n_pixels = 768
+
+    # Parsed calibration parameters, stored in the calibration cache
+    calibration_parameters = ('kVdd', 'vdd25', 'KvPTAT', 'KtPTAT', 'vPTAT25', 'alphaPTAT',
+                              'gainEE', 'tgc', 'resolutionEE', 'KsTa', 'ct', 'ksTo',
+                              'cpOffset', 'cpAlpha', 'cpKta', 'cpKv',
+                              'alphaScale', 'alpha', 'offset', 'ktaScale', 'kta', 'kvScale', 'kv',
+                              'calibrationModeEE', 'ilChessC', 'broken_pixels', 'outlier_pixels')
+
+    def __init__(self, ee_data = None, calibration = None):
+
+        # Parse the EEPROM words or restore already parsed parameters
+        if calibration is None:
+            self.extract_parameters(ee_data)
+        else:
+            for name in self.calibration_parameters:
+                value = np.asarray(calibration[name])
+                setattr(self, name, value.item() if value.ndim == 0 else value)
+
+        self.precompute()
+
+    def extract_parameters(self, ee_data):
+        '''Extract the calibration parameters from the 832 EEPROM words'''
+
+        # EEPROM words
+        ee = np.asarray(ee_data, dtype = np.int64)
+
+        # Pixel positions
+        pixel = np.arange(self.n_pixels)
+        row = pixel // 32
+        column = pixel % 32
+        split = 2 * (pixel // 32 - (pixel // 64) * 2) + pixel % 2
+
+        # Pixel words
+        pixel_words = ee[64:64 + self.n_pixels]
+
+        # ---------- VDD and PTAT ----------
+        self.kVdd = int(signed((ee[51] & 0xFF00) >> 8, 8)) * 32
+        self.vdd25 = ((int(ee[51] & 0x00FF) - 256) << 5) - 8192
+
+        self.KvPTAT = int(signed((ee[50] & 0xFC00) >> 10, 6)) / 4096
+        self.KtPTAT = int(signed(ee[50] & 0x03FF, 10)) / 8
+        self.vPTAT25 = int(ee[49])
+        self.alphaPTAT = int(ee[16] & 0xF000) / 2**14 + 8
+
+        # ---------- Gain, TGC, resolution and KsTa ----------
+        self.gainEE = int(signed(ee[48], 16))
+        self.tgc = int(signed(ee[60] & 0x00FF, 8)) / 32
+        self.resolutionEE = int(ee[56] & 0x3000) >> 12
+        self.KsTa = int(signed((ee[60] & 0xFF00) >> 8, 8)) / 8192
+
+        # ---------- KsTo and corner temperatures ----------
+        step = ((int(ee[63]) & 0x3000) >> 12) * 10
+        ct2 = ((int(ee[63]) & 0x00F0) >> 4) * step
+        ct3 = ct2 + ((int(ee[63]) & 0x0F00) >> 8) * step
+        self.ct = np.array([-40., 0., ct2, ct3])
+
+        KsToScale = 1 << ((int(ee[63]) & 0x000F) + 8)
+        ksTo_words = np.array([ee[61] & 0x00FF, (ee[61] & 0xFF00) >> 8, ee[62] & 0x00FF, (ee[62] & 0xFF00) >> 8])
+        self.ksTo = np.append(signed(ksTo_words, 8) / KsToScale, -0.0002)
+
+        # ---------- Compensation pixels ----------
+        alphaScale_CP = ((int(ee[32]) & 0xF000) >> 12) + 27
+
+        offsetSP0 = int(signed(ee[58] & 0x03FF, 10))
+        offsetSP1 = int(signed((ee[58] & 0xFC00) >> 10, 6)) + offsetSP0
+        self.cpOffset = np.array([offsetSP0, offsetSP1], dtype = float)
+
+        alphaSP0 = int(signed(ee[57] & 0x03FF, 10)) / 2**alphaScale_CP
+        alphaSP1 = (1 + int(signed((ee[57] & 0xFC00) >> 10, 6)) / 128) * alphaSP0
+        self.cpAlpha = np.array([alphaSP0, alphaSP1])
+
+        ktaScale1 = ((int(ee[56]) & 0x00F0) >> 4) + 8
+        kvScale = (int(ee[56]) & 0x0F00) >> 8
+        self.cpKta = int(signed(ee[59] & 0x00FF, 8)) / 2**ktaScale1
+        self.cpKv = int(signed((ee[59] & 0xFF00) >> 8, 8)) / 2**kvScale
+
+        # ---------- Alpha ----------
+        accRemScale = int(ee[32]) & 0x000F
+        accColumnScale = (int(ee[32]) & 0x00F0) >> 4
+        accRowScale = (int(ee[32]) & 0x0F00) >> 8
+        alphaScale = ((int(ee[32]) & 0xF000) >> 12) + 30
+        accRow = nibbles(ee[34:40])
+        accColumn = nibbles(ee[40:48])
+
+        alpha = signed((pixel_words & 0x03F0) >> 4, 6) * (1 << accRemScale)
+        alpha = alpha + int(ee[33]) + accRow[row] * (1 << accRowScale) + accColumn[column] * (1 << accColumnScale)
+        alpha = alpha / 2**alphaScale
+        alpha = alpha - self.tgc * (self.cpAlpha[0] + self.cpAlpha[1]) / 2
+        alpha = SCALEALPHA / alpha
+
+        self.alphaScale = scale_exponent(np.max(alpha), 32768)
+        self.alpha = np.trunc(alpha * 2**self.alphaScale + 0.5)
+
+        # ---------- Offset ----------
+        occRemScale = int(ee[16]) & 0x000F
+        occColumnScale = (int(ee[16]) & 0x00F0) >> 4
+        occRowScale = (int(ee[16]) & 0x0F00) >> 8
+        offsetRef = int(signed(ee[17], 16))
+        occRow = nibbles(ee[18:24])
+        occColumn = nibbles(ee[24:32])
+
+        offset = signed((pixel_words & 0xFC00) >> 10, 6) * (1 << occRemScale)
+        self.offset = (offset + offsetRef + occRow[row] * (1 << occRowScale) + occColumn[column] * (1 << occColumnScale)).astype(float)
+
+        # ---------- Kta ----------
+        KtaRC = signed(np.array([(ee[54] & 0xFF00) >> 8, (ee[55] & 0xFF00) >> 8, ee[54] & 0x00FF, ee[55] & 0x00FF]), 8)
+        ktaScale2 = int(ee[56]) & 0x000F
+
+        kta = signed((pixel_words & 0x000E) >> 1, 3) * (1 << ktaScale2) + KtaRC[split]
+        kta = kta / 2**ktaScale1
+
+        self.ktaScale = scale_exponent(np.max(np.abs(kta)), 64)
+        self.kta = quantize(kta * 2**self.ktaScale)
+
+        # ---------- Kv ----------
+        KvT = signed(np.array([(ee[52] & 0xF000) >> 12, (ee[52] & 0x00F0) >> 4, (ee[52] & 0x0F00) >> 8, ee[52] & 0x000F]), 4)
+
+        kv = KvT[split] / 2**kvScale
+
+        self.kvScale = scale_exponent(np.max(np.abs(kv)), 64)
+        self.kv = quantize(kv * 2**self.kvScale)
+
+        # ---------- Interleaved/chess pattern corrections ----------
+        self.calibrationModeEE = ((int(ee[10]) & 0x0800) >> 4) ^ 0x80
+        self.ilChessC = np.array([signed(ee[53] & 0x003F, 6) / 16.,
+                                  signed((ee[53] & 0x07C0) >> 6, 5) / 2.,
+                                  signed((ee[53] & 0xF800) >> 11, 5) / 8.])
+
+        # ---------- Deviating pixels ----------
+        self.broken_pixels = pixel_words == 0
+        self.outlier_pixels = ((pixel_words & 0x0001) != 0) & ~self.broken_pixels
+        if np.count_nonzero(self.broken_pixels) > 4:
+            raise RuntimeError("More than 4 broken pixels")
+        if np.count_nonzero(self.outlier_pixels) > 4:
+            raise RuntimeError("More than 4 outlier pixels")
+        if np.count_nonzero(self.broken_pixels | self.outlier_pixels) > 4:
+            raise RuntimeError("More than 4 faulty pixels")
+
+    def precompute(self):
+        '''Derive the per pixel constants used in every frame'''
+
+        # Pixel patterns
+        pixel = np.arange(self.n_pixels)
+        self.il_pattern = pixel // 32 - (pixel // 64) * 2
+        self.chess_pattern = self.il_pattern ^ (pixel - (pixel // 2) * 2)
+        self.conversion_pattern = ((pixel + 2) // 4 - (pixel + 3) // 4 + (pixel + 1) // 4 - pixel // 4) * (1 - 2 * self.il_pattern)
+
+        # Sensitivity correction per temperature range
+        self.alphaCorrR = np.zeros(4)
+        self.alphaCorrR[0] = 1 / (1 + self.ksTo[0] * 40)
+        self.alphaCorrR[1] = 1
+        self.alphaCorrR[2] = 1 + self.ksTo[1] * self.ct[2]
+        self.alphaCorrR[3] = self.alphaCorrR[2] * (1 + self.ksTo[2] * (self.ct[3] - self.ct[2]))
+
+        # Scaled pixel parameters
+        self.bad_pixels = np.flatnonzero(self.broken_pixels | self.outlier_pixels)
+        self.kta_scaled = self.kta / 2**self.ktaScale
+        self.kv_scaled = self.kv / 2**self.kvScale
+        self.alpha_scaled = SCALEALPHA * 2**self.alphaScale / self.alpha
+        self.pattern_correction = self.ilChessC[2] * (2 * self.il_pattern - 1) - self.ilChessC[1] * self.conversion_pattern
+
+        # Pixels computed for each (chess mode, sub-page) pair, excluding deviating pixels
+        good = np.ones(self.n_pixels, dtype = bool)
+        good[self.bad_pixels] = False
+        self.subpage_pixels = {}
+        for chess_mode in (False, True):
+            pattern = self.chess_pattern if chess_mode else self.il_pattern
+            for subpage in (0, 1):
+                self.subpage_pixels[(chess_mode, subpage)] = np.flatnonzero((pattern == subpage) & good)
+
+        # Per pixel constants gathered once for each sub-page, so frames only index contiguous arrays
+        self.subpage_constants = {}
+        for key, pixels in self.subpage_pixels.items():
+            self.subpage_constants[key] = (self.offset[pixels], self.kta_scaled[pixels], self.kv_scaled[pixels],
+                                           self.alpha_scaled[pixels], self.pattern_correction[pixels])
+
+        # Work buffers reused by every frame, sized for the largest sub-page
+        n_subpage = max(len(pixels) for pixels in self.subpage_pixels.values())
+        self.raw_work = np.zeros(n_subpage, dtype = np.int64)
+        self.range_work = np.zeros(n_subpage, dtype = np.int64)
+        self.mask_work = np.zeros(n_subpage, dtype = bool)
+        self.work = np.zeros((5, n_subpage))
+
+    def save(self, path, sensor_id):
+        '''Store the parsed calibration of the sensor sensor_id in a .npz file'''
+
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+
+        # Write to a temporary file first so an interrupted save never leaves a corrupted cache
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            np.savez(file, format_version = CALIBRATION_FORMAT_VERSION, sensor_id = sensor_id,
+                     **{name: getattr(self, name) for name in self.calibration_parameters})
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path, sensor_id):
+        '''Restore the calibration stored in path
+        Returns None if the file is missing, unreadable, from another sensor or from another format version
+        '''
+
+        if not os.path.isfile(path):
+            return None
+
+        try:
+            with np.load(path) as cache:
+                if int(cache['format_version']) != CALIBRATION_FORMAT_VERSION or str(cache['sensor_id']) != sensor_id:
+                    return None
+                calibration = {name: cache[name] for name in cls.calibration_parameters}
+        except (OSError, KeyError, ValueError):
+            return None
+
+        return cls(calibration = calibration)
+
+    def get_vdd(self, frame):
+        '''Supply voltage from a raw frame'''
+        vdd = signed_word(frame[810])
+        resolutionRAM = (int(frame[832]) & 0x0C00) >> 10
+        resolutionCorrection = 2**self.resolutionEE / 2**resolutionRAM
+        return (resolutionCorrection * vdd - self.vdd25) / self.kVdd + 3.3
+
+    def get_ta(self, frame):
+        '''Ambient temperature from a raw frame'''
+        vdd = self.get_vdd(frame)
+        ptat = signed_word(frame[800])
+        ptatArt = signed_word(frame[768])
+        ptatArt = (ptat / (ptat * self.alphaPTAT + ptatArt)) * 2**18
+
+        ta = ptatArt / (1 + self.KvPTAT * (vdd - 3.3)) - self.vPTAT25
+        return ta / self.KtPTAT + 25
+
+    def calculate_to(self, frame, emissivity, tr, result):
+        '''Object temperature of the sub-page contained in a raw 834 word frame
+        Only the pixels of the sub-page are written in result, as in the Adafruit driver
+        All array operations write into preallocated buffers, nothing is allocated per frame
+        '''
+
+        subpage = int(frame[833])
+        mode = (int(frame[832]) & 0x1000) >> 5
+
+        vdd = self.get_vdd(frame)
+        ta = self.get_ta(frame)
+
+        ta4 = (ta + 273.15)**4
+        tr4 = (tr + 273.15)**4
+        taTr = tr4 - (tr4 - ta4) / emissivity
+
+        # Gain
+        gain = self.gainEE / signed_word(frame[778])
+
+        # Compensation pixel of the current sub-page
+        cp_correction = (1 + self.cpKta * (ta - 25)) * (1 + self.cpKv * (vdd - 3.3))
+        if subpage == 0:
+            irDataCP = signed_word(frame[776]) * gain - self.cpOffset[0] * cp_correction
+        elif mode == self.calibrationModeEE:
+            irDataCP = signed_word(frame[808]) * gain - self.cpOffset[1] * cp_correction
+        else:
+            irDataCP = signed_word(frame[808]) * gain - (self.cpOffset[1] + self.ilChessC[0]) * cp_correction
+
+        # Pixels of the current sub-page and their constants
+        key = (mode != 0, subpage)
+        pixels = self.subpage_pixels[key]
+        offset, kta, kv, alpha, pattern_correction = self.subpage_constants[key]
+        n = len(pixels)
+
+        raw = self.raw_work[:n]
+        torange = self.range_work[:n]
+        mask = self.mask_work[:n]
+        irData, alphaCompensated, work, To, gathered = self.work[:, :n]
+
+        # Signed raw data, (x + 32768) & 0xFFFF - 32768 converts in place
+        np.take(frame, pixels, out = raw)
+        np.add(raw, 32768, out = raw)
+        np.bitwise_and(raw, 0xFFFF, out = raw)
+        np.subtract(raw, 32768, out = raw)
+        np.multiply(raw, gain, out = irData)
+
+        # Offset, Kta and Kv compensation
+        np.multiply(kta, ta - 25, out = work)
+        work += 1
+        np.multiply(kv, vdd - 3.3, out = To)
+        To += 1
+        work *= To
+        work *= offset
+        irData -= work
+
+        if mode != self.calibrationModeEE:
+            irData += pattern_correction
+
+        irData -= self.tgc * irDataCP
+        irData /= emissivity
+
+        np.multiply(alpha, 1 + self.KsTa * (ta - 25), out = alphaCompensated)
+
+        # Sx = alpha^3 * (irData + alpha * taTr), then its fourth root
+        np.multiply(alphaCompensated, taTr, out = work)
+        work += irData
+        work *= alphaCompensated
+        work *= alphaCompensated
+        work *= alphaCompensated
+        np.sqrt(work, out = work)
+        np.sqrt(work, out = work)
+        work *= self.ksTo[1]
+
+        # First estimate of To
+        np.multiply(alphaCompensated, 1 - self.ksTo[1] * 273.15, out = To)
+        To += work
+        np.divide(irData, To, out = To)
+        To += taTr
+        np.sqrt(To, out = To)
+        np.sqrt(To, out = To)
+        To -= 273.15
+
+        # Temperature range of each pixel, number of corner temperatures reached
+        torange.fill(0)
+        for corner in self.ct[1:]:
+            np.greater_equal(To, corner, out = mask)
+            np.add(torange, mask, out = torange)
+
+        # Extended temperature range correction
+        np.take(self.ct, torange, out = work)
+        np.subtract(To, work, out = work)
+        np.take(self.ksTo, torange, out = gathered)
+        work *= gathered
+        work += 1
+        np.take(self.alphaCorrR, torange, out = gathered)
+        work *= gathered
+        work *= alphaCompensated
+        np.divide(irData, work, out = work)
+        work += taTr
+        np.sqrt(work, out = work)
+        np.sqrt(work, out = work)
+        work -= 273.15
+
+        np.put(result, pixels, work)
+        np.put(result, self.bad_pixels, -273.15)
+
+
+if __name__ == "__main__":
+    # Compare the vectorized engine with the Adafruit driver on frames read from the camera
+    import board
+    import busio
+    import adafruit_mlx90640 as amlx
+
+    mlx = amlx.MLX90640(busio.I2C(board.SCL, board.SDA))
+    engine = MLX90640Fast(amlx.eeData)
+
+    frame = [0] * 834
+    for _ in range(4):
+        mlx._GetFrameData(frame)
+        tr = mlx._GetTa(frame) - OPENAIR_TA_SHIFT
+
+        reference = np.zeros(768)
+        mlx._CalculateTo(frame, 0.95, tr, reference)
+
+        fast = np.zeros(768)
+        engine.calculate_to(frame, 0.95, engine.get_ta(frame) - OPENAIR_TA_SHIFT, fast)
+
+        pixels = engine.subpage_pixels[((frame[832] & 0x1000) != 0, frame[833])]
+        print(f"Sub-page {frame[833]}: max difference {np.max(np.abs(fast[pixels] - reference[pixels])):.6f} C")
+
+    # Memory allocated per frame by the vectorized calculation
+    import tracemalloc
+
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for _ in range(100):
+        engine.calculate_to(frame, 0.95, engine.get_ta(frame) - OPENAIR_TA_SHIFT, fast)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"Retained per frame: {(current - start) / 100:.1f} bytes, peak transient: {peak - start} bytes")
@@ -48,4 +48,189 @@ class PIDControl:
 
         self.output = min(output_max, max(output_min, self.output))
 
-        return self.output
\ No newline at end of file
+        return self.output
+
+class PIDBank:
+    '''PID controllers of every region, evaluated together
+
+    Gains, integrators, previous errors and limits are (n_region,) arrays, the outputs of all regions are
+    computed in one set of array operations. Indexing the bank gives a per region view with the interface
+    of PIDControl, so bank[i].gains[j] = value updates the bank.
+    '''
+
+    # Setpoints at or above this value, None or NaN disable the control of a region
+    setpoint_limit = 1000
+
+    def __init__(self, n_region, flow_rate_saturation_min = 5, flow_rate_saturation_max = 300, output_min = 0, output_max = 300):
+
+        self.n_region = n_region
+
+        # Kp, Ki and Kd of every region
+        self.gains = np.zeros((n_region, 3))
+
+        # Controller state
+        self.integral_error = np.zeros(n_region)
+        self.previous_error = np.zeros(n_region)
+        self.output = np.zeros(n_region)
+
+        # The integrator holds while the flow rate is at or beyond these limits
+        self.flow_rate_saturation_min = np.full(n_region, float(flow_rate_saturation_min))
+        self.flow_rate_saturation_max = np.full(n_region, float(flow_rate_saturation_max))
+
+        # Output range
+        self.output_min = np.full(n_region, float(output_min))
+        self.output_max = np.full(n_region, float(output_max))
+
+        # Work arrays, allocated once
+        self.setpoint = np.zeros(n_region)
+        self.error = np.zeros(n_region)
+        self.derivative = np.zeros(n_region)
+        self.work = np.zeros(n_region)
+        self.active = np.zeros(n_region, dtype = bool)
+        self.inactive = np.zeros(n_region, dtype = bool)
+        self.unsaturated = np.zeros(n_region, dtype = bool)
+        self.below_max = np.zeros(n_region, dtype = bool)
+
+        self.controllers = [PIDBankRegion(self, region) for region in range(n_region)]
+
+    def __getitem__(self, region):
+        return self.controllers[region]
+
+    def __len__(self):
+        return self.n_region
+
+    def __iter__(self):
+        return iter(self.controllers)
+
+    def reset(self):
+        '''Clear the integral and previous errors of every region'''
+        self.integral_error[:] = 0
+        self.previous_error[:] = 0
+
+    def compute_outputs(self, current_temperature, setpoint, time_step, current_flow_rate):
+        '''Outputs of every region, setpoint may hold None for the regions without a setpoint
+        Returns the output array of the bank, overwritten by the next call
+        '''
+
+        # Error, zero where the setpoint is missing or out of range
+        np.copyto(self.setpoint, setpoint, casting = 'unsafe')
+        np.less(self.setpoint, self.setpoint_limit, out = self.active)
+        np.logical_not(self.active, out = self.inactive)
+        np.subtract(current_temperature, self.setpoint, out = self.error)
+        np.copyto(self.error, 0., where = self.inactive)
+
+        # Update integral errors (only update if not saturated)
+        np.greater(current_flow_rate, self.flow_rate_saturation_min, out = self.unsaturated)
+        np.less(current_flow_rate, self.flow_rate_saturation_max, out = self.below_max)
+        np.logical_and(self.unsaturated, self.below_max, out = self.unsaturated)
+        np.multiply(self.error, time_step, out = self.work)
+        np.add(self.integral_error, self.work, out = self.integral_error, where = self.unsaturated)
+
+        # Update derivative
+        np.subtract(self.error, self.previous_error, out = self.derivative)
+        np.divide(self.derivative, time_step, out = self.derivative)
+
+        np.multiply(self.gains[:, 0], self.error, out = self.output)
+        np.multiply(self.gains[:, 1], self.integral_error, out = self.work)
+        np.add(self.output, self.work, out = self.output)
+        np.multiply(self.gains[:, 2], self.derivative, out = self.work)
+        np.add(self.output, self.work, out = self.output)
+        np.copyto(self.previous_error, self.error)
+
+        np.clip(self.output, self.output_min, self.output_max, out = self.output)
+
+        return self.output
+
+
+class PIDBankRegion:
+    '''One region of a PIDBank with the interface of PIDControl'''
+
+    def __init__(self, bank, region):
+        self.bank = bank
+        self.region = region
+
+    @property
+    def gains(self):
+        return self.bank.gains[self.region]
+
+    @gains.setter
+    def gains(self, gains):
+        self.bank.gains[self.region] = gains
+
+    @property
+    def integral_error(self):
+        return self.bank.integral_error[self.region]
+
+    @integral_error.setter
+    def integral_error(self, integral_error):
+        self.bank.integral_error[self.region] = integral_error
+
+    @property
+    def previous_error(self):
+        return self.bank.previous_error[self.region]
+
+    @previous_error.setter
+    def previous_error(self, previous_error):
+        self.bank.previous_error[self.region] = previous_error
+
+    @property
+    def output(self):
+        return self.bank.output[self.region]
+
+    def compute_output(self, current_temperature, setpoint, time_step, current_flow_rate, flow_rate_saturation_min = 5, flow_rate_saturation_max = 300, output_min = 0, output_max = 300):
+        '''Output of this region alone, with the state kept in the bank'''
+        controller = PIDControl()
+        controller.gains = self.gains
+        controller.integral_error = self.integral_error
+        controller.previous_error = self.previous_error
+        if setpoint is not None and not np.isfinite(setpoint):
+            setpoint = None
+        output = controller.compute_output(current_temperature, setpoint, time_step, current_flow_rate, flow_rate_saturation_min, flow_rate_saturation_max, output_min, output_max)
+        self.integral_error = controller.integral_error
+        self.previous_error = controller.previous_error
+        self.bank.output[self.region] = output
+        return output
+
+
+if __name__ == "__main__":
+    import time
+
+    # Check the bank against one PIDControl per region, including missing and out of range setpoints
+    rng = np.random.default_rng(0)
+    n_region = 10
+    bank = PIDBank(n_region)
+    controllers = [PIDControl() for _ in range(n_region)]
+    for region in range(n_region):
+        bank[region].gains = rng.uniform(0, 2, 3)
+        controllers[region].gains = bank[region].gains.copy()
+
+    error = 0.
+    for _ in range(100):
+        temperature = rng.uniform(40, 120, n_region)
+        setpoint = np.array([None if rng.random() < 0.1 else float(rng.uniform(50, 1100)) for _ in range(n_region)], dtype = object)
+        flow_rate = rng.uniform(0, 310, n_region)
+        time_step = rng.uniform(0.1, 1)
+        outputs = bank.compute_outputs(temperature, setpoint, time_step, flow_rate)
+        expected = [controllers[j].compute_output(temperature[j], setpoint[j], time_step, flow_rate[j]) for j in range(n_region)]
+        error = max(error, np.max(np.abs(outputs - expected)))
+    print(f"Maximum difference to PIDControl: {error:.2e}")
+
+    # Cost per tick of the list of controllers and of the bank
+    for n_region in [2, 8, 32, 128]:
+        bank = PIDBank(n_region)
+        controllers = [PIDControl() for _ in range(n_region)]
+        temperature = rng.uniform(40, 120, n_region)
+        setpoint = np.full(n_region, 80.)
+        flow_rate = np.full(n_region, 100.)
+
+        start = time.perf_counter()
+        for _ in range(1000):
+            [controllers[j].compute_output(temperature[j], setpoint[j], 0.5, flow_rate[j]) for j in range(n_region)]
+        list_time = (time.perf_counter() - start) / 1000
+
+        start = time.perf_counter()
+        for _ in range(1000):
+            bank.compute_outputs(temperature, setpoint, 0.5, flow_rate)
+        bank_time = (time.perf_counter() - start) / 1000
+
+        print(f"{n_region:4d} regions: PIDControl list {1e6 * list_time:8.1f} us, PIDBank {1e6 * bank_time:6.1f} us")
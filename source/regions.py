@@ -0,0 +1,358 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Import libraries
+import hashlib
+import numpy as np
+
+class RegionStatistics():
+    '''Sum, mean and pixel count of rectangular regions of a frame from its summed-area table
+    Boundaries follow the UI convention [y_min, y_max, x_min, x_max], where y is the column and x is the row
+    of the frame, and the upper bounds are excluded
+    '''
+
+    # table can be shared with another instance, so a single update serves both region lists
+    def __init__(self, resolution, region_boundaries = None, table = None):
+
+        # Tuple of the resolution of the frame (rows, columns)
+        self.resolution = resolution
+
+        # Summed-area table with a leading row and column of zeros, so every rectangle needs exactly 4 corners
+        self.table = np.zeros((resolution[0] + 1, resolution[1] + 1)) if table is None else table
+        self.table_flat = self.table.reshape(-1)
+        self.table_body = self.table[1:, 1:]
+
+        # Boundaries the index arrays were compiled from
+        self.region_boundaries = None
+
+        self.compile(np.zeros((0, 4), dtype = int) if region_boundaries is None else region_boundaries)
+
+    def compile(self, region_boundaries):
+        '''Precompile the regions to flat indices of their corners in the summed-area table'''
+
+        region_boundaries = np.array(region_boundaries, dtype = int).reshape(-1, 4)
+        self.region_boundaries = region_boundaries.copy()
+        self.n_region = len(region_boundaries)
+
+        # Clip to the frame, an inverted rectangle becomes empty
+        columns = self.resolution[1]
+        column_min = np.clip(region_boundaries[:, 0], 0, columns)
+        column_max = np.clip(region_boundaries[:, 1], column_min, columns)
+        row_min = np.clip(region_boundaries[:, 2], 0, self.resolution[0])
+        row_max = np.clip(region_boundaries[:, 3], row_min, self.resolution[0])
+
+        # sum = S[row_max, column_max] - S[row_min, column_max] - S[row_max, column_min] + S[row_min, column_min]
+        width = columns + 1
+        self.corners = np.stack([row_max * width + column_max, row_min * width + column_max,
+                                 row_max * width + column_min, row_min * width + column_min])
+
+        self.count = (row_max - row_min) * (column_max - column_min)
+        self.empty = self.count == 0
+
+        # Work buffers for the gather
+        self.corner_values = np.zeros(self.corners.shape)
+        self.sum = np.zeros(self.n_region)
+        self.mean = np.zeros(self.n_region)
+
+    def set_boundaries(self, region_boundaries):
+        '''Recompile only if the boundaries changed'''
+
+        if not np.array_equal(self.region_boundaries, region_boundaries):
+            self.compile(region_boundaries)
+
+    def update(self, frame_grid):
+        '''Build the summed-area table of a new frame'''
+
+        np.cumsum(frame_grid, axis = 0, out = self.table_body)
+        np.cumsum(self.table_body, axis = 1, out = self.table_body)
+
+    def compute(self):
+        '''Sum and mean of every region from the current table, written to self.sum and self.mean'''
+
+        np.take(self.table_flat, self.corners, out = self.corner_values, mode = 'clip')
+        np.subtract(self.corner_values[0], self.corner_values[1], out = self.sum)
+        np.subtract(self.sum, self.corner_values[2], out = self.sum)
+        np.add(self.sum, self.corner_values[3], out = self.sum)
+
+        # Empty regions have no mean
+        np.divide(self.sum, self.count, out = self.mean, where = ~self.empty)
+        self.mean[self.empty] = np.nan
+
+        return self.sum, self.mean, self.count
+
+
+class RegionWeights():
+    '''Region averages as a single product of a precompiled weight matrix with the frame
+    Each region is a rectangle [y_min, y_max, x_min, x_max] unless a shape is set for it:
+    a boolean mask or a weighted kernel of the frame resolution, or a polygon of (column, row) vertices
+    '''
+
+    # Above this number of regions the weight matrix is stored as a scipy sparse matrix, if scipy is installed
+    sparse_threshold = 16
+
+    # percentiles are reported by statistics() for the pixels of each region
+    def __init__(self, resolution, n_region, percentiles = (10, 50, 90)):
+
+        # Tuple of the resolution of the frame (rows, columns)
+        self.resolution = resolution
+        self.n_pixels = resolution[0] * resolution[1]
+        self.n_region = n_region
+        self.percentiles = np.array(percentiles, dtype = float)
+
+        # Fields of the per-region statistics
+        self.percentile_fields = [f'p{q:g}' for q in percentiles]
+        self.statistics_fields = ['mean', 'min', 'max', 'std'] + self.percentile_fields + ['hotspot_row', 'hotspot_column']
+        self.statistics_dtype = np.dtype([(field, float) for field in self.statistics_fields])
+
+        # Shape of each region, None for the rectangle given by its boundaries
+        self.shapes = [None] * n_region
+
+        # Boundaries the matrix was compiled from, None forces the first compilation
+        self.region_boundaries = None
+        self.changed = True
+
+        # Weight matrix, one row per region normalized to a sum of 1
+        self.weights = np.zeros((n_region, self.n_pixels))
+        self.sparse = False
+        self.empty = np.ones(n_region, dtype = bool)
+        self.any_empty = True
+        self.region_hash = ''
+
+    def weights_from_shape(self, shape):
+        '''Convert a mask, kernel or polygon to pixel weights of the frame resolution'''
+
+        # Polygon vertices in (column, row) coordinates, pixels are inside if their centre is
+        if isinstance(shape, dict) and 'polygon' in shape:
+            from matplotlib.path import Path
+            rows, columns = np.indices(self.resolution)
+            centres = np.column_stack([columns.reshape(-1), rows.reshape(-1)])
+            return Path(np.asarray(shape['polygon'], dtype = float)).contains_points(centres).astype(float)
+
+        weights = np.asarray(shape)
+        if weights.shape != self.resolution:
+            raise ValueError(f"Region shape must match the frame resolution {self.resolution}, got {weights.shape}")
+
+        if np.any(weights < 0):
+            raise ValueError("Region weights must not be negative")
+
+        return weights.astype(float).reshape(-1)
+
+    def set_shape(self, region, shape):
+        '''Set the shape of a region: boolean mask, weighted kernel, {'polygon': vertices} or None for its rectangle'''
+
+        self.shapes[region] = None if shape is None else self.weights_from_shape(shape)
+        self.changed = True
+
+    def update(self, region_boundaries):
+        '''Recompile the weight matrix if a shape or the boundaries changed'''
+
+        if self.changed or not np.array_equal(self.region_boundaries, region_boundaries):
+            self.compile(region_boundaries)
+
+    def compile(self, region_boundaries):
+        '''Build the normalized weight matrix of all regions'''
+
+        self.region_boundaries = np.array(region_boundaries, dtype = int).copy()
+        weights = np.zeros((self.n_region, self.n_pixels))
+        weights_grid = weights.reshape(self.n_region, self.resolution[0], self.resolution[1])
+
+        for i in range(self.n_region):
+            if self.shapes[i] is not None:
+                weights[i] = self.shapes[i]
+            else:
+                # Same slicing as the rectangle average, negative bounds are clipped to the frame
+                y_min, y_max, x_min, x_max = np.maximum(self.region_boundaries[i], 0)
+                weights_grid[i, x_min:x_max, y_min:y_max] = 1
+
+        # Support of each region for the order statistics, every pixel of non-zero weight counts once
+        self.membership = weights > 0
+        self.outside = ~self.membership
+        self.count = self.membership.sum(axis = 1)
+
+        # Flat indices of the sorted pixels giving the minimum, maximum and percentiles of each region
+        # Percentiles interpolate linearly between the two closest ranks, as np.percentile does
+        last = np.maximum(self.count - 1, 0)
+        row_start = np.arange(self.n_region) * self.n_pixels
+        rank = self.percentiles[None, :] / 100 * last[:, None]
+        rank_low = np.floor(rank).astype(int)
+        self.percentile_low = row_start[:, None] + rank_low
+        self.percentile_high = row_start[:, None] + np.minimum(rank_low + 1, last[:, None])
+        self.percentile_fraction = rank - rank_low
+        self.minimum_index = row_start
+        self.maximum_index = row_start + last
+
+        # Work buffers of the statistics
+        self.masked = np.zeros((self.n_region, self.n_pixels))
+        self.masked_flat = self.masked.reshape(-1)
+        self.hotspot_index = np.zeros(self.n_region, dtype = np.int64)
+        self.hotspot_row = np.zeros(self.n_region, dtype = np.int64)
+        self.hotspot_column = np.zeros(self.n_region, dtype = np.int64)
+        self.square = np.zeros(self.n_pixels)
+        self.second_moment = np.zeros(self.n_region)
+        self.mean_square = np.zeros(self.n_region)
+        self.low = np.zeros(self.percentile_low.shape)
+        self.high = np.zeros(self.percentile_low.shape)
+        self.percentile_values = np.zeros(self.percentile_low.shape)
+        self.order_statistic = np.zeros(self.n_region)
+
+        # Normalize every region, empty regions have no average
+        total = weights.sum(axis = 1)
+        self.empty = total == 0
+        self.any_empty = bool(np.any(self.empty))
+        np.divide(weights, total[:, None], out = weights, where = ~self.empty[:, None])
+
+        # Hash of the region definitions, saved with the data
+        self.region_hash = hashlib.sha1(weights.tobytes()).hexdigest()[:16]
+
+        self.sparse = False
+        if self.n_region > self.sparse_threshold:
+            try:
+                from scipy import sparse
+                weights = sparse.csr_matrix(weights)
+                self.sparse = True
+            except ImportError:
+                pass
+
+        self.weights = weights
+        self.changed = False
+
+    def average(self, frame, out):
+        '''Average of every region of the flattened frame, written to out'''
+
+        if self.sparse:
+            out[:] = self.weights @ frame
+        else:
+            np.matmul(self.weights, frame, out = out)
+
+        if self.any_empty:
+            out[self.empty] = np.nan
+
+    def statistics(self, frame, out):
+        '''Mean, minimum, maximum, standard deviation, percentiles and hottest pixel of every region
+        of the flattened frame, written to the structured array out of dtype statistics_dtype
+        The mean and standard deviation are weighted, the order statistics (minimum, maximum, percentiles
+        and hottest pixel) are taken over the region's support, every pixel of non-zero weight counting once
+        '''
+
+        self.average(frame, out['mean'])
+
+        # Weighted standard deviation from the second moment, equal to the plain one for masks and rectangles
+        # Every step writes into the buffers of compile, nothing is allocated per tick
+        np.multiply(frame, frame, out = self.square)
+        if self.sparse:
+            self.second_moment[:] = self.weights @ self.square
+        else:
+            np.matmul(self.weights, self.square, out = self.second_moment)
+        np.square(out['mean'], out = self.mean_square)
+        np.subtract(self.second_moment, self.mean_square, out = self.second_moment)
+        np.maximum(self.second_moment, 0, out = self.second_moment)
+        np.sqrt(self.second_moment, out = self.second_moment)
+        out['std'] = self.second_moment
+
+        # Hottest pixel, with the pixels outside of each region at -inf
+        self.masked.fill(-np.inf)
+        np.copyto(self.masked, frame, where = self.membership)
+        np.argmax(self.masked, axis = 1, out = self.hotspot_index)
+        np.divmod(self.hotspot_index, self.resolution[1], out = (self.hotspot_row, self.hotspot_column))
+        out['hotspot_row'] = self.hotspot_row
+        out['hotspot_column'] = self.hotspot_column
+
+        # Sort each region once, with the pixels outside of it at +inf, then read the ranks
+        # A full sort of the rows is faster here than np.partition on the ranks of every region
+        np.copyto(self.masked, np.inf, where = self.outside)
+        self.masked.sort(axis = 1)
+
+        np.take(self.masked_flat, self.minimum_index, out = self.order_statistic, mode = 'clip')
+        out['min'] = self.order_statistic
+        np.take(self.masked_flat, self.maximum_index, out = self.order_statistic, mode = 'clip')
+        out['max'] = self.order_statistic
+
+        np.take(self.masked_flat, self.percentile_low, out = self.low, mode = 'clip')
+        np.take(self.masked_flat, self.percentile_high, out = self.high, mode = 'clip')
+        np.subtract(self.high, self.low, out = self.percentile_values)
+        np.multiply(self.percentile_values, self.percentile_fraction, out = self.percentile_values)
+        np.add(self.percentile_values, self.low, out = self.percentile_values)
+        for j, field in enumerate(self.percentile_fields):
+            out[field] = self.percentile_values[:, j]
+
+        if self.any_empty:
+            for field in self.statistics_fields:
+                out[field][self.empty] = np.nan
+
+
+if __name__ == "__main__":
+    # Check against np.mean on slices and time both approaches
+    import timeit
+
+    resolution = (24, 32)
+    rng = np.random.default_rng(0)
+    frame_grid = rng.uniform(20, 120, resolution)
+
+    n_region = 50
+    column_min = rng.integers(0, resolution[1] - 1, n_region)
+    row_min = rng.integers(0, resolution[0] - 1, n_region)
+    region_boundaries = np.stack([column_min, rng.integers(column_min + 1, resolution[1] + 1),
+                                  row_min, rng.integers(row_min + 1, resolution[0] + 1)], axis = 1)
+
+    statistics = RegionStatistics(resolution, region_boundaries)
+    statistics.update(frame_grid)
+    _, mean, count = statistics.compute()
+
+    reference = np.array([np.mean(frame_grid[b[2]:b[3], b[0]:b[1]]) for b in region_boundaries])
+    print(f"Max error: {np.max(np.abs(mean - reference)):.2e}")
+
+    def loop():
+        for b in region_boundaries:
+            np.mean(frame_grid[b[2]:b[3], b[0]:b[1]])
+
+    def table():
+        statistics.update(frame_grid)
+        statistics.compute()
+
+    weights = RegionWeights(resolution, n_region)
+    weights.update(region_boundaries)
+    weights_mean = np.zeros(n_region)
+    weights.average(frame_grid.reshape(-1), weights_mean)
+    print(f"Max error of the weight matrix: {np.max(np.abs(weights_mean - reference)):.2e}")
+
+    # A polygon covering a rectangle selects the same pixels
+    weights.set_shape(0, {'polygon': [(column_min[0] - 0.5, row_min[0] - 0.5), (region_boundaries[0, 1] - 0.5, row_min[0] - 0.5),
+                                      (region_boundaries[0, 1] - 0.5, region_boundaries[0, 3] - 0.5), (column_min[0] - 0.5, region_boundaries[0, 3] - 0.5)]})
+    weights.update(region_boundaries)
+    weights.average(frame_grid.reshape(-1), weights_mean)
+    print(f"Polygon error: {abs(weights_mean[0] - reference[0]):.2e}")
+
+    # Order statistics against np.percentile on slices
+    weights.set_shape(0, None)
+    weights.update(region_boundaries)
+    statistics_values = np.zeros(n_region, dtype = weights.statistics_dtype)
+    weights.statistics(frame_grid.reshape(-1), statistics_values)
+    error = 0
+    for i, b in enumerate(region_boundaries):
+        pixels = frame_grid[b[2]:b[3], b[0]:b[1]]
+        row, column = np.unravel_index(np.argmax(pixels), pixels.shape)
+        expected = [np.mean(pixels), np.min(pixels), np.max(pixels), np.std(pixels)] + list(np.percentile(pixels, weights.percentiles)) + [row + b[2], column + b[0]]
+        error = max(error, np.max(np.abs(np.array(statistics_values[i].tolist()) - expected)))
+    print(f"Max error of the statistics: {error:.2e}")
+
+    def matrix():
+        weights.update(region_boundaries)
+        weights.average(frame_grid.reshape(-1), weights_mean)
+
+    def all_statistics():
+        weights.statistics(frame_grid.reshape(-1), statistics_values)
+
+    n = 1000
+    print(f"{n_region} regions, slices: {timeit.timeit(loop, number = n) / n * 1e6:.1f} us, summed-area table: {timeit.timeit(table, number = n) / n * 1e6:.1f} us, weight matrix: {timeit.timeit(matrix, number = n) / n * 1e6:.1f} us")
+    print(f"{n_region} regions, all statistics: {timeit.timeit(all_statistics, number = n) / n * 1e6:.1f} us")
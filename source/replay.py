@@ -0,0 +1,124 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Import libraries
+import os
+import time
+import numpy as np
+
+# Directory of the recordings shipped with the application
+test_data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_data')
+
+# Define replay frame source class
+class ReplayCam:
+    '''Frame source streaming a recorded run instead of the thermal camera
+
+    Recordings are either text files with one frame per row (the _temp.csv files written
+    in save mode, optionally starting with the time column) or .npy arrays, which are
+    memory-mapped. The recording is read once at construction.
+    '''
+
+    # Default constructor
+    # frame_rate is the number of recorded frames streamed per second, None advances one frame per get_temperature call
+    # loop restarts the recording at the end, otherwise the last frame is held
+    def __init__(self, filename = os.path.join(test_data_dir, 'temperature_static.csv'), frame_rate = None, loop = True):
+
+        # Tuple of the resolution of the camera
+        self.resolution = (24,32)
+        n_pixels = self.resolution[0] * self.resolution[1]
+
+        # Add default max and min temperature
+        self.max = 120
+        self.min = 30
+
+        self.filename = filename
+        self.frame_rate = frame_rate
+        self.loop = loop
+
+        # Load the recording once
+        if filename.endswith('.npy'):
+            frames = np.load(filename, mmap_mode = 'r')
+        else:
+            frames = np.genfromtxt(filename, delimiter = ',', dtype = np.float32)
+
+            # Drop header lines, which are parsed as NaN rows
+            frames = np.atleast_2d(frames)
+            frames = frames[~np.all(np.isnan(frames), axis = 1)]
+
+        frames = np.atleast_2d(frames)
+        if frames.shape[1] == n_pixels + 1:
+            # First column is the time of the frame
+            frames = frames[:, 1:]
+        elif frames.shape[1] != n_pixels:
+            raise ValueError(f"Recording {filename} has {frames.shape[1]} columns, expected {n_pixels} or {n_pixels + 1}")
+
+        self.frames = frames
+        self.n_frames = frames.shape[0]
+
+        # Temperature vector
+        self.temperature = np.zeros(n_pixels)
+
+        # Replay state
+        self.frame_index = -1
+        self.finished = False
+        self.start_time = None
+
+        # Sequence number and timestamp of the frame currently in self.temperature
+        self.frame_sequence = 0
+        self.frame_timestamp = 0.
+
+    def start_acquisition(self):
+        '''Start streaming from the first frame'''
+        self.start_time = time.monotonic()
+        self.frame_index = -1
+        self.finished = False
+
+    def stop_acquisition(self, timeout = 2):
+        '''Nothing runs in the background'''
+        pass
+
+    def next_frame_index(self):
+        '''Index of the frame to serve now'''
+
+        if self.frame_rate is None:
+            index = self.frame_index + 1
+        else:
+            if self.start_time is None:
+                self.start_time = time.monotonic()
+            index = int((time.monotonic() - self.start_time) * self.frame_rate)
+
+        if index >= self.n_frames:
+            if self.loop:
+                index %= self.n_frames
+            else:
+                index = self.n_frames - 1
+                self.finished = True
+
+        return index
+
+    def get_temperature(self):
+        index = self.next_frame_index()
+
+        # Only copy when the frame changes
+        if index != self.frame_index:
+            self.frame_index = index
+            np.copyto(self.temperature, self.frames[index])
+            self.frame_sequence += 1
+            self.frame_timestamp = time.monotonic()
+
+    # Temperature setter
+    def set_range(self, min, max):
+        # Set temperature
+        self.min = min
+        self.max = max
@@ -0,0 +1,302 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Import libraries
+import threading
+import time
+import numpy as np
+from source.solenoid_valve import Solenoid
+
+class Simulator():
+    '''Simulated rig: heated plate cooled by air jets, mass flow controllers, solenoid valves and thermal camera
+
+    The plate is a 2D field on the camera grid, heated uniformly, losing heat to the ambient, diffusing between
+    pixels and cooled under each jet by a Gaussian footprint proportional to the flow through it.
+    Each jet flows only while its solenoid is open, and its MFC follows the commanded flow with a first-order lag.
+    The simulated devices expose the same interface as the drivers, so the application runs unchanged.
+    The model advances with the wall clock, time_scale > 1 runs it faster.
+    '''
+
+    def __init__(self, n_region, resolution = (24,32), ambient = 25., plate_temperature = 110., jet_temperature = 20.,
+                 plate_time_constant = 20., diffusivity = 0.5, jet_width = 2.5, jet_time_constant = 2.,
+                 max_flow_rate = 300., mfc_time_constant = 0.3, camera_noise = 0.3, flow_noise = 0.002,
+                 frame_rate = 2., time_scale = 1., seed = None):
+
+        self.n_region = n_region
+        self.resolution = resolution
+
+        # Thermal model
+        self.ambient = ambient
+        self.jet_temperature = jet_temperature
+        self.plate_time_constant = plate_time_constant
+        self.diffusivity = diffusivity
+        self.heating = (plate_temperature - ambient) / plate_time_constant
+
+        # Cooling rate per unit flow rate at the centre of a jet, full flow cools with jet_time_constant
+        self.jet_gain = 1 / (jet_time_constant * max_flow_rate)
+
+        # Jets evenly spaced along the plate, Gaussian footprints (n_region, rows, columns)
+        rows, columns = np.indices(resolution)
+        centres = (np.arange(n_region) + 0.5) * resolution[1] / n_region
+        self.jet_footprint = np.exp(-((rows[None] - resolution[0] / 2)**2 + (columns[None] - centres[:, None, None])**2) / (2 * jet_width**2))
+
+        # Flow through the MFCs
+        self.max_flow_rate = max_flow_rate
+        self.mfc_time_constant = mfc_time_constant
+        self.flow_rate = np.zeros(n_region)
+        self.flow_rate_command = np.zeros(n_region)
+        self.valve_open = np.zeros(n_region, dtype = bool)
+        self.valve_bits = np.array([Solenoid.solenoid_bit(i) for i in range(n_region)])
+
+        # Plate temperature, starting at steady state without cooling
+        self.temperature = np.full(resolution, plate_temperature)
+        self.laplacian = np.zeros(resolution)
+        self.cooling = np.zeros(resolution)
+        self.cooling_flat = self.cooling.reshape(-1)
+        self.jet_footprint_flat = self.jet_footprint.reshape(n_region, -1)
+
+        # Integration
+        self.time_step = 0.05
+        self.time_scale = time_scale
+        self.time = 0.
+        self.last_wall_time = time.monotonic()
+        self.lock = threading.Lock()
+
+        # Measurement noise
+        self.rng = np.random.default_rng(seed)
+        self.camera_noise = camera_noise
+        self.flow_noise = flow_noise
+
+        # Simulated devices, at the addresses of the rig
+        self.adc = [SimulatedTLA2528(self, 0), SimulatedTLA2528(self, 8)]
+        self.dac = [SimulatedDACx578(self, 0), SimulatedDACx578(self, 8)]
+        self.drv = SimulatedDRV8806(self)
+        self.camera = SimulatedCam(self, frame_rate)
+
+    def advance(self):
+        '''Integrate the model up to the current time'''
+
+        with self.lock:
+            now = time.monotonic()
+            elapsed = (now - self.last_wall_time) * self.time_scale
+
+            # Long pauses are not caught up, at most 10 s of model time
+            if elapsed > 10.:
+                self.last_wall_time = now - 10. / self.time_scale
+                elapsed = 10.
+
+            # Whole steps only, the remainder is kept so frequent calls integrate the same time as rare ones
+            n_step = int(elapsed / self.time_step)
+            self.last_wall_time += n_step * self.time_step / self.time_scale
+
+            for _ in range(n_step):
+                self.step(self.time_step)
+
+    def step(self, dt):
+        '''One explicit Euler step of the MFCs and of the plate'''
+
+        # MFCs follow the command, no flow through a closed valve
+        target = np.where(self.valve_open, self.flow_rate_command, 0.)
+        self.flow_rate += (target - self.flow_rate) * dt / self.mfc_time_constant
+
+        # Diffusion with insulated edges
+        padded = np.pad(self.temperature, 1, mode = 'edge')
+        np.subtract(padded[:-2, 1:-1] + padded[2:, 1:-1] + padded[1:-1, :-2] + padded[1:-1, 2:], 4 * self.temperature, out = self.laplacian)
+
+        # Jet cooling
+        np.matmul(self.flow_rate * self.jet_gain, self.jet_footprint_flat, out = self.cooling_flat)
+
+        self.temperature += dt * (self.heating - (self.temperature - self.ambient) / self.plate_time_constant
+                                  + self.diffusivity * self.laplacian - self.cooling * (self.temperature - self.jet_temperature))
+        self.time += dt
+
+    def set_dac_output(self, channel, voltage):
+        '''Commanded flow rate of an MFC from its setpoint voltage, 1-5 V for 0 to full flow'''
+        if channel < self.n_region:
+            self.flow_rate_command[channel] = np.clip((voltage - 1.) * 75., 0., self.max_flow_rate)
+
+    def set_valve_word(self, word):
+        '''Open the valves whose bits are set in the solenoid state word'''
+        self.valve_open[:] = [(word >> int(bit)) & 1 == 1 for bit in self.valve_bits]
+
+class SimulatedTLA2528():
+    '''Flow meter outputs of 8 consecutive MFCs, as read by the TLA2528 driver'''
+
+    def __init__(self, simulator, first_channel):
+        self.simulator = simulator
+        self.first_channel = first_channel
+        self.AVDD = 5.55
+        self.data = np.zeros(8)
+
+    def measure_voltage(self):
+        self.simulator.advance()
+        flow_rate = self.simulator.flow_rate[self.first_channel : self.first_channel + 8]
+
+        # Output voltage of the MFCs, 1 V at no flow
+        self.data[:] = 0.
+        self.data[:len(flow_rate)] = flow_rate / (75 * 0.98) + 1.
+        self.data += self.simulator.rng.normal(0, self.simulator.flow_noise, 8)
+        np.clip(self.data, 0, self.AVDD, out = self.data)
+        return self.data
+
+class SimulatedDACChannel():
+    '''Channel of the simulated DAC with the raw_value interface of the Adafruit driver'''
+
+    def __init__(self, dac, index):
+        self.dac = dac
+        self.index = index
+        self._value = 0
+
+    @property
+    def raw_value(self):
+        return self._value
+
+    @raw_value.setter
+    def raw_value(self, value):
+        self._value = value
+        self.dac.input_codes[self.index] = value
+        self.dac.update(self.index)
+
+    @property
+    def normalized_value(self):
+        return self._value / self.dac.full_scale()
+
+    @normalized_value.setter
+    def normalized_value(self, value):
+        self.raw_value = int(value * self.dac.full_scale())
+
+class SimulatedDACx578():
+    '''DAC7578 driving the setpoints of 8 consecutive MFCs, decodes the I2C commands written by MFC'''
+
+    resolution = 12
+
+    def __init__(self, simulator, first_channel):
+        self.simulator = simulator
+        self.first_channel = first_channel
+        self.channels = [SimulatedDACChannel(self, i) for i in range(8)]
+        self.input_codes = np.zeros(8, dtype = np.int64)
+
+        # The DAC is its own I2C device
+        self.i2c_device = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def write(self, buffer, start = 0, end = None):
+        '''Command byte (write 0x00, write and update all 0x20, write and update 0x30) and left aligned code'''
+
+        command, high, low = bytes(buffer[start:end])
+        channel = command & 0x0F
+        self.input_codes[channel] = ((high << 8) | low) >> (16 - self.resolution)
+        self.channels[channel]._value = int(self.input_codes[channel])
+
+        if command & 0xF0 == 0x20:
+            for i in range(8):
+                self.update(i)
+        elif command & 0xF0 == 0x30:
+            self.update(channel)
+
+    def full_scale(self):
+        '''Largest code of the resolution of the DAC'''
+        return (1 << self.resolution) - 1
+
+    def update(self, channel):
+        '''Copy an input register to the output'''
+        self.simulator.advance()
+        self.simulator.set_dac_output(self.first_channel + channel, self.input_codes[channel] / self.full_scale() * 5.)
+
+class SimulatedDRV8806():
+    '''Solenoid drivers, the DRV8806 SPI interface is the driver itself'''
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.spi = self
+
+    def xfer2(self, data):
+        '''Bytes are shifted most significant first'''
+        self.simulator.advance()
+        self.simulator.set_valve_word(int.from_bytes(bytes(data), 'big'))
+
+class SimulatedCam():
+    '''Thermal camera with the interface of ThermalCam, frames of the simulated plate with noise'''
+
+    def __init__(self, simulator, frame_rate = 2.):
+
+        self.simulator = simulator
+        self.frame_period = 1 / frame_rate
+
+        # Tuple of the resolution of the camera
+        self.resolution = simulator.resolution
+
+        # Add default max and min temperature
+        self.max = 120
+        self.min = 30
+
+        # Temperature vector
+        self.temperature = np.zeros(self.resolution[0] * self.resolution[1])
+
+        # Sequence number and timestamp of the frame currently in self.temperature
+        self.frame_sequence = 0
+        self.frame_timestamp = 0.
+        self.next_frame_time = 0.
+
+    def start_acquisition(self):
+        '''Frames are taken from the model when requested'''
+        pass
+
+    def stop_acquisition(self, timeout = 2):
+        pass
+
+    def get_temperature(self):
+        self.simulator.advance()
+
+        # A new frame every frame period of simulated time
+        if self.simulator.time >= self.next_frame_time:
+            self.next_frame_time = self.simulator.time + self.frame_period
+            np.copyto(self.temperature, self.simulator.temperature.reshape(-1))
+            self.temperature += self.simulator.rng.normal(0, self.simulator.camera_noise, self.temperature.shape)
+            np.round(self.temperature, decimals = 2, out = self.temperature)
+            self.frame_sequence += 1
+            self.frame_timestamp = time.monotonic()
+
+    # Temperature setter
+    def set_range(self, min, max):
+        # Set temperature
+        self.min = min
+        self.max = max
+
+
+if __name__ == "__main__":
+    # Open the valves, command a flow step and print the response of each region
+    from source.mass_flow_controller import MFC
+    from source.temperature import Temperature
+
+    n_region = 2
+    simulator = Simulator(n_region, time_scale = 20, seed = 0)
+    solenoid = Solenoid(n_region, simulator = simulator)
+    mfc = MFC(n_region, simulator = simulator)
+    temperature = Temperature(n_region, simulator = simulator)
+    region_boundaries = np.array([[0, 16, 0, 24], [16, 32, 0, 24]])
+
+    solenoid.set_states(np.ones(n_region, dtype = bool))
+    mfc.set_flow_rates(np.array([150., 0.]))
+    for tick in range(9):
+        time.sleep(0.1)
+        mfc.get_flow_rate()
+        temperature.get_temperature()
+        temperature.get_temperature_average(n_region, region_boundaries)
+        print(f"t = {simulator.time:5.1f} s, flow rate: {mfc.flow_rate}, temperature: {np.round(temperature.temperature_average, 2)}")
@@ -13,26 +13,57 @@ THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
 '''
 
 import numpy as np
+from source.drivers import RigConfig
 
 class Solenoid:
 
-    def __init__(self, n_region, test_UI = False):
+    # Create solenoid mask to follow harware
+    solenoid_mask = {0 : 9, 1 : 8, 2 : 5, 3 : 4, 4 : 7, 5 : 6, 6 : 1, 7 : 0, 8 : 3, 9 : 2}
+
+    # spi_speed_hz is the SPI clock of the DRV8806 shift registers
+    # simulator replaces the solenoid drivers by the simulated ones
+    # rig selects the valve backend, by default the simulated drivers with a simulator and the DRV8806 otherwise
+    # connect creates the drivers in the constructor, otherwise connect is called later, possibly from another thread
+    def __init__(self, n_region, test_UI = False, spi_speed_hz = 100000, simulator = None, rig = None, connect = True):
 
         self.test_UI = test_UI
-        self.state = [0b00000000, 0b00000000]
+        self.n_region = n_region
 
-        if test_UI:
-            return
-        from source.DRV8806 import DRV8806
+        # Bit of every region in the state word, and enough state bytes for all of them
+        self.solenoid_bits = np.array([self.solenoid_bit(i) for i in range(n_region)])
+        self.state = [0b00000000] * max(2, int(self.solenoid_bits.max()) // 8 + 1)
+
+        # Bytes of the last transfer, None until the first one
+        self.sent_state = None
 
-        self.DRV = DRV8806()
+        # Valve backend, the drivers are created by connect
+        if rig is None:
+            rig = RigConfig.select(simulator = simulator)
+        self.rig = rig
+        self.spi_speed_hz = spi_speed_hz
+        self.simulator = simulator
 
-        # Create solenoid mask to follow harware
-        self.solenoid_mask = {0 : 9, 1 : 8, 2 : 5, 3 : 4, 4 : 7, 5 : 6, 6 : 1, 7 : 0, 8 : 3, 9 : 2}
+        # The DRV8806 drivers of the rig have one output per region of the mask, other backends are not limited
+        if not test_UI and self.rig.drivers['valve'] == 'drv8806' and n_region > len(self.solenoid_mask):
+            raise ValueError(f"Unsupported number of solenoid valves: {n_region}, the DRV8806 drivers have {len(self.solenoid_mask)}")
+
+        if connect:
+            self.connect()
+
+    def connect(self):
+        '''Create the solenoid drivers, may run in another thread'''
+        if self.test_UI:
+            return
+        self.DRV = self.rig.create('valve', spi_speed_hz = self.spi_speed_hz, simulator = self.simulator)
     
+    @classmethod
+    def solenoid_bit(cls, region):
+        '''Bit of a region in the state word, regions beyond the drivers of the rig use their own bit'''
+        return cls.solenoid_mask.get(region, region)
+
     def set_solenoid_state(self, solenoid_id, new_state: bool):
 
-        solenoid_id = self.solenoid_mask[solenoid_id]
+        solenoid_id = self.solenoid_bits[solenoid_id]
         
         byte_index = solenoid_id // 8
         bit_in_byte = solenoid_id % 8
@@ -48,8 +79,42 @@ class Solenoid:
 
         self.update_solenoids()
 
-    def update_solenoids(self):
+    def set_states(self, states, force = False):
+        '''Set the state of several solenoids with a single transfer
+        states is an integer with bit i for region i, or an array of booleans for the first len(states) regions
+        The transfer is skipped if the state bytes do not change, unless force is set
+        '''
+
+        if isinstance(states, (int, np.integer)):
+            regions = np.arange(self.n_region)
+            on = np.array([(int(states) >> region) & 1 == 1 for region in range(self.n_region)], dtype = bool)
+        else:
+            on = np.asarray(states, dtype = bool)
+            if on.ndim != 1 or len(on) > self.n_region:
+                raise ValueError(f"Expected at most {self.n_region} solenoid states, got an array of shape {on.shape}")
+            regions = np.arange(len(on))
+
+        # Map the regions to their bits in the state word and replace those bits
+        # Python integers hold the word of any number of regions
+        changed_bits = 0
+        set_bits = 0
+        for bit, region_on in zip(self.solenoid_bits[regions], on):
+            changed_bits |= 1 << int(bit)
+            if region_on:
+                set_bits |= 1 << int(bit)
+
+        word = int.from_bytes(bytes(self.state), 'little')
+        word = (word & ~changed_bits) | set_bits
+        self.state = list(word.to_bytes(len(self.state), 'little'))
+
+        self.update_solenoids(force)
+
+    def update_solenoids(self, force = False):
         if self.test_UI:
             return
-        self.DRV.spi.xfer2(self.state[::-1])
 
+        # The shift registers hold their state, so an unchanged state is not sent again
+        if not force and self.state == self.sent_state:
+            return
+        self.DRV.spi.xfer2(self.state[::-1])
+        self.sent_state = list(self.state)
@@ -0,0 +1,81 @@
+'''
+Copyright 2024-2025, the Active Cooling Experimental Application Authors
+
+Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS” AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# Import libraries
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+class DeviceStartup():
+    '''Brings several devices up concurrently in a thread pool
+
+    Each device is a name and a function connecting it. The owner polls ready() from its event loop,
+    so the UI can be built and updated while the devices start.
+    '''
+
+    # tasks is a dict {name: connect function}
+    def __init__(self, tasks, max_workers = None):
+
+        self.names = list(tasks)
+        self.start_time = time.perf_counter()
+
+        # Time taken by every device in seconds and the exception of the failed ones
+        self.timings = {}
+        self.errors = {}
+
+        self.executor = ThreadPoolExecutor(max_workers = max_workers or len(tasks) or 1, thread_name_prefix = 'DeviceStartup')
+        self.futures = {name: self.executor.submit(self.run, name, task) for name, task in tasks.items()}
+
+    def run(self, name, task):
+        start = time.perf_counter()
+        try:
+            task()
+        except Exception as error:
+            self.errors[name] = error
+            traceback.print_exc()
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def pending(self):
+        '''Names of the devices still starting'''
+        return [name for name in self.names if not self.futures[name].done()]
+
+    def ready(self):
+        '''True once every device has finished starting, successfully or not'''
+        if self.pending():
+            return False
+        self.executor.shutdown(wait = False)
+        return True
+
+    def wait(self):
+        '''Block until every device has finished starting'''
+        self.executor.shutdown(wait = True)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def print_timings(self):
+        '''Print the startup time of every device'''
+        for name in self.names:
+            status = f"failed: {self.errors[name]}" if name in self.errors else "ready"
+            print(f"{name:<24}{self.timings.get(name, 0):8.3f} s  {status}")
+        print(f"{'all devices':<24}{self.elapsed():8.3f} s")
+
+
+if __name__ == "__main__":
+    # Three devices taking 0.2 s each start in about 0.2 s instead of 0.6 s
+    startup = DeviceStartup({f'device {i}': lambda: time.sleep(0.2) for i in range(3)})
+    while not startup.ready():
+        time.sleep(0.01)
+    startup.print_timings()
@@ -13,16 +13,24 @@ THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
 '''
 
 import numpy as np
+from source.regions import RegionStatistics, RegionWeights
+from source.drivers import RigConfig
 
 class Temperature():
-    def __init__(self, n_region, test = False):
+    # rig selects the camera backend, by default the simulated camera, the recording in test mode or the thermal camera
+    # connect brings the camera up in the constructor, otherwise connect_camera is called later, possibly from another thread
+    def __init__(self, n_region, test = False, camera_options = None, replay_file = None, percentiles = (10, 50, 90), filter_options = None, simulator = None, rig = None, connect = True):
         self.test = test
 
-        if self.test:
-            pass
-        else:
-            from source.thermal_cam import ThermalCam
-            self.thermal_cam = ThermalCam()
+        # Frames come from the simulated rig, from a recording when replaying or testing, from the thermal camera otherwise
+        if rig is None:
+            rig = RigConfig.select(test or replay_file is not None, simulator)
+        self.rig = rig
+        self.simulator = simulator
+        self.camera_options = dict(camera_options or {})
+        if replay_file is not None:
+            self.camera_options['filename'] = replay_file
+        self.thermal_cam = None
 
         # Tuple of the resolution of the camera
         self.resolution = (24,32)
@@ -33,30 +41,82 @@ class Temperature():
         self.max = 120
         self.min = 30
 
+        # Optional temporal filter and dead pixel rejection applied to every frame
+        self.frame_filter = None
+        if filter_options is not None:
+            from source.frame_filter import FrameFilter
+            self.frame_filter = FrameFilter(self.resolution, **filter_options)
+
+        # True when the camera delivered no new frame since the previous tick
+        self.frame_stale = False
+
+        # Frame and its 2D view, allocated once and written in place every tick
         self.temperature = np.zeros(self.resolution[0] * self.resolution[1])
         self.temperature_grid = self.temperature.reshape(self.resolution[0], self.resolution[1])
 
         # Container for temperature average per region
         self.temperature_average = np.zeros(n_region)
 
+        # Control regions as a weight matrix, so they can be masks, polygons or kernels as well as rectangles
+        self.region_weights = RegionWeights(self.resolution, n_region, percentiles)
+
+        # Mean, min, max, std, percentiles and hottest pixel (row, column) per region, updated with the averages
+        self.region_statistics = np.zeros(n_region, dtype = self.region_weights.statistics_dtype)
+
+        # Summed-area table statistics of additional rectangular analysis regions
+        self.analysis_statistics = RegionStatistics(self.resolution)
+
+        if connect:
+            self.connect_camera()
+
+    def connect_camera(self):
+        '''Create the camera and start reading frames in the background, so the control loop never waits on it'''
+        self.thermal_cam = self.rig.create('camera', simulator = self.simulator, **self.camera_options)
+        self.thermal_cam.start_acquisition()
+
     def get_temperature(self):
-        if self.test:
-            self.temperature = np.genfromtxt('source/test_data/temperature_static.csv', delimiter = ",", dtype=np.float32)[1:]
-        else:
-            self.thermal_cam.get_temperature()
-            self.temperature = self.thermal_cam.temperature
+        self.thermal_cam.get_temperature()
+        np.copyto(self.temperature, self.thermal_cam.temperature)
 
-        self.temperature_grid = self.temperature.reshape(self.resolution[0], self.resolution[1])
+        if self.frame_filter is not None:
+            self.frame_filter.apply(self.temperature, self.thermal_cam.frame_sequence, self.thermal_cam.frame_timestamp)
+            self.frame_stale = self.frame_filter.stale
+
+        # Build the summed-area table of the analysis regions once per frame, only when there are some
+        if self.analysis_statistics.n_region > 0:
+            self.analysis_statistics.update(self.temperature_grid)
+
+    def stop(self):
+        '''Stop the camera acquisition thread'''
+        if self.thermal_cam is not None:
+            self.thermal_cam.stop_acquisition()
 
     def get_temperature_average(self, n_region, region_boundaries):
             '''Get temperature average within regions'''
 
-            # Get temperature average within regions
-            for i in range(n_region):
+            # The weight matrix is only recompiled when a region changes
+            self.region_weights.update(region_boundaries[:n_region])
+            self.region_weights.statistics(self.temperature, self.region_statistics)
+            np.copyto(self.temperature_average, self.region_statistics['mean'])
 
-                # Get region boundaries
-                y_min, y_max, x_min, x_max = region_boundaries[i]
-            
-                # Calculate average temperature within patched region
-                self.temperature_average[i] = np.mean(self.temperature_grid[x_min:x_max, y_min:y_max])
-    
+    def set_region_shape(self, region, shape):
+        '''Replace the rectangle of a control region by a boolean mask, a weighted kernel or {'polygon': vertices}
+        None restores the rectangle
+        '''
+        self.region_weights.set_shape(region, shape)
+
+    def get_region_hash(self, n_region, region_boundaries):
+        '''Hash of the current control region definitions'''
+        self.region_weights.update(region_boundaries[:n_region])
+        return self.region_weights.region_hash
+
+    def set_analysis_regions(self, region_boundaries):
+        '''Set the analysis regions, rows of [y_min, y_max, x_min, x_max], evaluated in addition to the control regions'''
+        self.analysis_statistics.set_boundaries(region_boundaries)
+
+        # The table is not built without analysis regions, build it for the current frame
+        self.analysis_statistics.update(self.temperature_grid)
+
+    def get_analysis_statistics(self):
+        '''Sum, mean and pixel count of every analysis region of the current frame'''
+        return self.analysis_statistics.compute()
@@ -13,6 +13,9 @@ THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
 '''
 
 # Import libraries
+import os
+import threading
+import time
 import numpy as np
 import busio
 import board
@@ -21,10 +24,32 @@ import adafruit_mlx90640 as amlx
 # Define thermal camera class
 class ThermalCam:
 
+    # Directory of the parsed calibration cache
+    calibration_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'active_cooling')
+
+    # Supported refresh rates in Hz, each refresh delivers one sub-page (half of the chess pattern)
+    # Rates of 8 Hz and above need the I2C bus clocked at 400 kHz or more (dtparam=i2c_arm_baudrate on the Pi)
+    refresh_rates = {0.5: amlx.RefreshRate.REFRESH_0_5_HZ, 1: amlx.RefreshRate.REFRESH_1_HZ,
+                     2: amlx.RefreshRate.REFRESH_2_HZ, 4: amlx.RefreshRate.REFRESH_4_HZ,
+                     8: amlx.RefreshRate.REFRESH_8_HZ, 16: amlx.RefreshRate.REFRESH_16_HZ,
+                     32: amlx.RefreshRate.REFRESH_32_HZ, 64: amlx.RefreshRate.REFRESH_64_HZ}
+
     # Default constructor
-    def __init__(self, test = False):
+    # backend selects the temperature calculation: 'numpy' (vectorized) or 'adafruit' (reference driver)
+    # rebuild_calibration forces the EEPROM to be read and parsed again, refreshing the cache
+    # refresh_rate is the sub-page rate of the camera in Hz
+    # bus_manager shares the I2C bus with the other devices, the camera opens its own connection otherwise
+    def __init__(self, test = False, backend = 'numpy', rebuild_calibration = False, refresh_rate = 1, bus_manager = None):
 
         self.test = test
+        self.backend = backend
+
+        if refresh_rate not in self.refresh_rates:
+            raise ValueError(f"Unsupported thermal camera refresh rate: {refresh_rate} Hz")
+        self.refresh_rate = refresh_rate
+
+        # Interval between polls of the data ready flag, leaves the bus free between sub-pages
+        self.poll_interval = 1 / (20 * refresh_rate)
         
         # Tuple of the resolution of the camera
         self.resolution = (24,32)
@@ -33,43 +58,213 @@ class ThermalCam:
         self.emissivity = 0.95
 
         # Setup I2C connection with camera
-        self.i2c_connection = busio.I2C(board.SCL, board.SDA)
+        self.bus_manager = bus_manager
+        if bus_manager is not None:
+            self.i2c_connection = bus_manager.i2c()
+        else:
+            self.i2c_connection = busio.I2C(board.SCL, board.SDA)
 
         # Start library
-        self.mlx = amlx.MLX90640(self.i2c_connection)
+        if self.backend == 'numpy':
+            self.connect_numpy_backend(rebuild_calibration)
+        elif self.backend == 'adafruit':
+            # The constructor reads the whole EEPROM, held as one camera transaction since the other devices may be starting at the same time
+            if bus_manager is not None:
+                with bus_manager.transaction('camera', bus_manager.PRIORITY_CAMERA):
+                    self.mlx = amlx.MLX90640(self.i2c_connection)
+            else:
+                self.mlx = amlx.MLX90640(self.i2c_connection)
+            self.engine = None
+        else:
+            raise ValueError(f"Unknown thermal camera backend: {self.backend}")
+
+        # Camera transactions yield the bus to waiting flow reads and DAC writes
+        if bus_manager is not None and self.backend == 'adafruit':
+            self.mlx.i2c_device = bus_manager.manage_i2c_device(self.mlx.i2c_device, 'camera', bus_manager.PRIORITY_CAMERA)
 
         # Set refresh rate
-        self.mlx.refresh_rate = amlx.RefreshRate.REFRESH_1_HZ
+        self.mlx.refresh_rate = self.refresh_rates[self.refresh_rate]
 
         # Temperature vector
         self.temperature = np.zeros(self.resolution[0]*self.resolution[1])
 
+        # Raw frame (768 pixels, auxiliary data, control register and sub-page), reused for every read
+        self.raw_frame = np.zeros(834, dtype = np.int64)
+
+        # Static frame served in test mode, loaded once
+        if self.test:
+            self.test_frame = np.genfromtxt(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_data', 'temperature_static.csv'), delimiter = ",", dtype=np.float32)[1:]
+
         # Add default max and min temperature
         self.max = 120
         self.min = 30
 
+        # Double buffer filled by the acquisition thread
+        # The front buffer holds the latest complete frame, the back buffer is being written
+        self.frame_buffers = np.zeros((2, self.resolution[0]*self.resolution[1]))
+        self.frame_timestamps = np.zeros(2)
+        self.frame_sequences = np.zeros(2, dtype = np.int64)
+        self.front_buffer = 0
+
+        # Time at which each sub-page of each buffer was last updated
+        self.subpage_buffer_timestamps = np.zeros((2, 2))
+
+        # Lock only protects the swap of the front buffer index and the copy out of it
+        self.frame_lock = threading.Lock()
+
+        # Acquisition thread state
+        self.acquisition_thread = None
+        self.acquisition_running = threading.Event()
+        self.acquisition_errors = 0
+
+        # Sequence number and timestamps of the frame currently in self.temperature
+        self.frame_sequence = 0
+        self.frame_timestamp = 0.
+        self.subpage_timestamps = np.zeros(2)
+
+    def connect_numpy_backend(self, rebuild_calibration = False):
+        '''Connect to the camera and load its calibration into the vectorized engine
+        The parsed calibration is cached per sensor, so the EEPROM is only read and parsed on a cache miss
+        '''
+        from adafruit_bus_device.i2c_device import I2CDevice
+        from source.mlx90640_fast import MLX90640Fast
+
+        # The Adafruit constructor always parses the EEPROM in Python
+        # Only its I2C frame access is used here, so the parsing is skipped
+        self.mlx = amlx.MLX90640.__new__(amlx.MLX90640)
+        self.mlx.i2c_device = I2CDevice(self.i2c_connection, 0x33)
+
+        # Arbitrated before the EEPROM is read, the other devices may be starting at the same time
+        if self.bus_manager is not None:
+            self.mlx.i2c_device = self.bus_manager.manage_i2c_device(self.mlx.i2c_device, 'camera', self.bus_manager.PRIORITY_CAMERA)
+
+        # Unique ID of the sensor
+        self.sensor_id = '-'.join(f'{word:04x}' for word in self.mlx.serial_number)
+        self.calibration_cache = os.path.join(self.calibration_cache_dir, f'mlx90640_{self.sensor_id}.npz')
+
+        self.engine = None
+        if not rebuild_calibration:
+            self.engine = MLX90640Fast.load(self.calibration_cache, self.sensor_id)
+
+        if self.engine is None:
+            ee_data = [0] * 832
+            self.mlx._I2CReadWords(0x2400, ee_data)
+            self.engine = MLX90640Fast(ee_data)
+            self.engine.save(self.calibration_cache, self.sensor_id)
+
+    def start_acquisition(self):
+        '''Start the background thread reading frames from the camera'''
+
+        if self.test or self.acquisition_running.is_set():
+            return
+
+        self.acquisition_running.set()
+        self.acquisition_thread = threading.Thread(target = self.acquisition_loop, name = 'ThermalCamAcquisition', daemon = True)
+        self.acquisition_thread.start()
+
+    def stop_acquisition(self, timeout = 2):
+        '''Stop the background acquisition thread'''
+
+        self.acquisition_running.clear()
+        if self.acquisition_thread is not None:
+            self.acquisition_thread.join(timeout)
+            self.acquisition_thread = None
+
+    def acquisition_loop(self):
+        '''Read each sub-page as soon as it is ready, merge it into the rolling frame in the back buffer
+        and publish it by swapping buffers
+        '''
+
+        sequence = 0
+        while self.acquisition_running.is_set():
+            back_buffer = 1 - self.front_buffer
+
+            # Start from the latest frame, getFrame only updates the pixels of one sub-page
+            np.copyto(self.frame_buffers[back_buffer], self.frame_buffers[self.front_buffer])
+            np.copyto(self.subpage_buffer_timestamps[back_buffer], self.subpage_buffer_timestamps[self.front_buffer])
+
+            try:
+                if not self.wait_subpage_ready():
+                    break
+                subpage = self.getFrame(self.frame_buffers[back_buffer])
+            except (RuntimeError, OSError, ValueError):
+                # Keep the previous frame published, the consumer sees an unchanged sequence number
+                self.acquisition_errors += 1
+                time.sleep(0.01)
+                continue
+
+            if subpage is None:
+                self.acquisition_errors += 1
+                continue
+
+            sequence += 1
+            self.frame_timestamps[back_buffer] = time.monotonic()
+            self.frame_sequences[back_buffer] = sequence
+            self.subpage_buffer_timestamps[back_buffer, subpage] = self.frame_timestamps[back_buffer]
+
+            # Publish the new frame
+            with self.frame_lock:
+                self.front_buffer = back_buffer
+
+    def wait_subpage_ready(self):
+        '''Poll the data ready flag, sleeping between polls so other devices can use the bus
+        Returns False if acquisition was stopped while waiting
+        '''
+
+        status_register = [0]
+        while self.acquisition_running.is_set():
+            self.mlx._I2CReadWords(0x8000, status_register)
+            if status_register[0] & 0x0008:
+                return True
+            time.sleep(self.poll_interval)
+        return False
+
+    def get_latest_frame(self, out, subpage_timestamps = None):
+        '''Copy the latest published frame into out without touching the bus
+        Returns the sequence number and the monotonic timestamp of the frame
+        '''
+
+        with self.frame_lock:
+            np.copyto(out, self.frame_buffers[self.front_buffer])
+            if subpage_timestamps is not None:
+                np.copyto(subpage_timestamps, self.subpage_buffer_timestamps[self.front_buffer])
+            return self.frame_sequences[self.front_buffer], self.frame_timestamps[self.front_buffer]
+
+    def frame_complete(self):
+        '''True once both sub-pages of the current frame have been received'''
+        return bool(np.all(self.subpage_timestamps > 0))
+
     def get_temperature(self):
         if self.test:
-            self.temperature = np.genfromtxt('source/test_data/temperature_static.csv', delimiter = ",", dtype=np.float32)[1:]
+            np.copyto(self.temperature, self.test_frame)
+        elif self.acquisition_running.is_set():
+            self.frame_sequence, self.frame_timestamp = self.get_latest_frame(self.temperature, self.subpage_timestamps)
         else:
             self.getFrame(self.temperature)
             
-        self.temperature = np.round(self.temperature, decimals=2)
+        np.round(self.temperature, decimals=2, out=self.temperature)
 
     def getFrame(self, framebuf):
         OPENAIR_TA_SHIFT = 8
         emissivity = self.emissivity
         tr = 23.15
-        mlx90640Frame = [0] * 834
+        mlx90640Frame = self.raw_frame
         status = self.mlx._GetFrameData(mlx90640Frame)
 
         if status < 0:
-            pass
+            return None
+        elif self.engine is not None:
+            # For a MLX90640 in the open air the shift is -8 degC.
+            tr = self.engine.get_ta(mlx90640Frame) - OPENAIR_TA_SHIFT
+            self.engine.calculate_to(mlx90640Frame, emissivity, tr, framebuf)
         else:
             # For a MLX90640 in the open air the shift is -8 degC.
             tr = self.mlx._GetTa(mlx90640Frame) - OPENAIR_TA_SHIFT
             self.mlx._CalculateTo(mlx90640Frame, emissivity, tr, framebuf)
 
+        # Sub-page that was updated
+        return status
+
 
     # Temperature setter
     def set_range(self, min, max):        
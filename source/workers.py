@@ -1,29 +1,53 @@
-from PySide6.QtCore import QObject, QTimer, QElapsedTimer, Signal, Slot
+from PySide6.QtCore import QObject, Signal, Slot
+import time
 import numpy as np
 
+from source.control_loop import ControlScheduler
+
 # Define a worker class for measure and control logic
 class MeasureAndControlWorker(QObject):
 
     update_ui_signal = Signal()
     stop_signal = Signal()
+    start_signal = Signal()
+    autotune_finished_signal = Signal()
 
     def __init__(self, application):
         super().__init__()
         self.application = application
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.perform_measure_and_control)
 
-        self.elapsed_timer = QElapsedTimer()
-        self.elapsed_timer.start()
-        self.application.time = self.elapsed_timer.elapsed() / 1000
-        self.application.previous_time = self.elapsed_timer.elapsed() / 1000
+        # Ticks run on absolute deadlines of the monotonic clock, in the scheduler thread
+        self.scheduler = ControlScheduler(self.perform_measure_and_control, self.application.control_period, self.application.overrun_policy)
+
+        # Rows written to the save files, allocated on first save
+        self.save_data_array = None
+        self.save_temperature_array = None
+        self.save_statistics_array = None
+
+        # Experiment time restarts with the save and scheduler modes, the loop keeps its own clock
+        self.experiment_start = time.monotonic()
+        self.application.time = 0
+        self.application.time_step = self.scheduler.time_step
 
         # Triggers for time restart
-        self.application.UI.scheduler_checkbox.checkStateChanged.connect(self.elapsed_timer.restart)
-        self.application.UI.save_checkbox.checkStateChanged.connect(self.elapsed_timer.restart)
+        self.application.UI.scheduler_checkbox.checkStateChanged.connect(self.restart_experiment_time)
+        self.application.UI.save_checkbox.checkStateChanged.connect(self.restart_experiment_time)
+
+        # The loop is started in the worker thread once the devices are ready
+        self.start_signal.connect(self.start_control_loop)
 
-        # Define signal to communicate with main thread
-        self.timer.start(500)
+    @Slot()
+    def start_control_loop(self):
+        '''Start the measure and control loop, the experiment time starts at zero'''
+        self.restart_experiment_time()
+        self.scheduler.start()
+
+    def stop_control_loop(self):
+        '''Stop the loop after the current tick'''
+        self.scheduler.stop()
+
+    def restart_experiment_time(self):
+        self.experiment_start = time.monotonic()
 
     def perform_measure_and_control(self):
         self.get_time()
@@ -47,22 +71,41 @@ class MeasureAndControlWorker(QObject):
             time_step = self.application.time_step
             self.application.UI.time_step = self.application.time_step
 
-            # Initialize a list to store pid_output for each region
-            pid_outputs = np.zeros(self.application.n_region)
+            # The autotune experiment drives the MFCs in place of the controllers until it finishes
+            if self.apply_autotune():
+                return
 
-            # Apply flow rate increment to MFCs
-            for j in range(self.application.n_region):
-                # Calculate flow rate increment from PID controller
-                pid_output = self.application.PID[j].compute_output(temperature_average[j], temperature_setpoint[j], time_step, current_flow_rate[j])
-                pid_outputs[j] = pid_output
-                if not self.application.UI.decoupler_checkbox.isChecked():
-                    self.application.MFC.set_flow_rate(j, pid_output)
+            # Outputs of every region in one evaluation
+            pid_outputs = self.application.PID.compute_outputs(temperature_average, temperature_setpoint, time_step, current_flow_rate)
             
             # Apply decoupling terms if decoupler is enabled
             if self.application.UI.decoupler_checkbox.isChecked():
-                for j in range(self.application.n_region):
-                    decoupled_output = self.application.decouplers.compute_decoupled_output(pid_outputs)
-                    self.application.MFC.set_flow_rate(j, decoupled_output[j])
+                pid_outputs = self.application.decouplers.compute_decoupled_output(pid_outputs, time_step)
+
+            # Write all MFCs at once, unchanged channels are skipped
+            self.application.MFC.set_flow_rates(pid_outputs)
+
+    def apply_autotune(self):
+        '''Advance the autotune experiment, returns True while it drives the MFCs'''
+
+        autotune = self.application.autotune
+        if not autotune.requested:
+            if autotune.running:
+                autotune.stop()
+            return False
+
+        if not autotune.running:
+            autotune.start(self.scheduler.loop_time)
+
+        flow_rates = np.zeros(self.application.n_region)
+        if autotune.update(self.scheduler.loop_time, self.application.temperature.temperature_average, flow_rates):
+            # Tuned regions get their gains and the controllers start over from the current flow rates
+            autotune.apply(self.application.PID)
+            self.application.PID.reset()
+            self.autotune_finished_signal.emit()
+
+        self.application.MFC.set_flow_rates(flow_rates)
+        return True
 
     def apply_scheduler(self):
         '''Apply scheduler to MFC flow rates and temperature setpoints'''    
@@ -85,11 +128,11 @@ class MeasureAndControlWorker(QObject):
 
                 self.application.UI.scheduler_current_state.setText(str(self.application.UI.scheduler_data[0][1:]))         
                                                        
-            for j in range(self.application.n_region):
-                if self.application.UI.mfc_temperature_checkbox.isChecked():
+            if self.application.UI.mfc_temperature_checkbox.isChecked():
+                for j in range(self.application.n_region):
                     self.application.UI.temperature_setpoint[j] = scheduled_temperature_setpoints[j]
-                else:
-                    self.application.MFC.set_flow_rate(j, scheduled_flow_rates[j])
+            else:
+                self.application.MFC.set_flow_rates(scheduled_flow_rates[:self.application.n_region])
                 
 
                             
@@ -104,46 +147,65 @@ class MeasureAndControlWorker(QObject):
         self.application.measure_and_control_thread.start()
 
     def get_time(self):
-        self.application.time = self.elapsed_timer.elapsed() / 1000
-        self.application.time_step = self.elapsed_timer.elapsed() / 1000 - self.application.previous_time
-        self.application.previous_time = self.application.time
+        # Scheduled time since the previous tick, independent of experiment time restarts
+        self.application.time = time.monotonic() - self.experiment_start
+        self.application.time_step = self.scheduler.time_step
 
     def save_data(self):
         if self.application.UI.save_mode:
+            n_region = self.application.n_region
+
+            # Rows are allocated once per file layout and overwritten every tick
             if self.application.UI.mfc_temperature_checkbox.isChecked():
-                self.save_temperature_array = np.zeros(1 + len(self.application.temperature.temperature))              
-                self.save_data_array = np.zeros(1 + 10 * self.application.n_region)
-                self.save_data_array[2*self.application.n_region + 1 : 3*self.application.n_region + 1] = self.application.UI.temperature_setpoint
-                for i in range(self.application.n_region):
+                n_columns = 1 + 10 * n_region
+            else:
+                n_columns = 1 + 6 * n_region
+
+            if self.save_data_array is None or self.save_data_array.shape[1] != n_columns:
+                self.save_data_array = np.zeros((1, n_columns))
+            if self.save_statistics_array is None:
+                self.save_statistics_array = np.zeros((1, 1 + len(self.application.temperature.region_statistics.dtype.names) * n_region))
+            if self.save_temperature_array is None:
+                self.save_temperature_array = np.zeros((1, 1 + len(self.application.temperature.temperature)))
+
+            save_data_row = self.save_data_array[0]
+            save_temperature_row = self.save_temperature_array[0]
+            save_statistics_row = self.save_statistics_array[0]
+
+            if self.application.UI.mfc_temperature_checkbox.isChecked():
+                save_data_row[2*n_region + 1 : 3*n_region + 1] = self.application.UI.temperature_setpoint
+                for i in range(n_region):
                     for j in range(3):
-                        self.save_data_array[(3+j)*self.application.n_region + 1 + i] = self.application.UI.PID[i].gains[j]
+                        save_data_row[(3+j)*n_region + 1 + i] = self.application.UI.PID[i].gains[j]
 
-                    data_indexing = 1+ 6*self.application.n_region + (i*4)
-                    self.save_data_array[data_indexing : data_indexing +4] = self.application.UI.region_boundaries[i]
+                    data_indexing = 1+ 6*n_region + (i*4)
+                    save_data_row[data_indexing : data_indexing +4] = self.application.UI.region_boundaries[i]
 
             else:
-                self.save_data_array = np.zeros(1 + 6* self.application.n_region)
-                self.save_temperature_array = np.zeros(1 + len(self.application.temperature.temperature))
+                for i in range(n_region):
+                    data_indexing = 1+ 2*n_region + (i*4)
+                    save_data_row[data_indexing : data_indexing +4] = self.application.UI.region_boundaries[i]
 
-                for i in range(self.application.n_region):
-                    data_indexing = 1+ 2*self.application.n_region + (i*4)
-                    self.save_data_array[data_indexing : data_indexing +4] = self.application.UI.region_boundaries[i]
-
-            self.save_data_array[0] = self.application.time
-            self.save_temperature_array[0] = self.application.time
+            save_data_row[0] = self.application.time
+            save_temperature_row[0] = self.application.time
+            save_statistics_row[0] = self.application.time
             
             if not self.application.test_UI:
-                self.save_data_array[1:self.application.n_region + 1] = self.application.MFC.flow_rate
+                save_data_row[1:n_region + 1] = self.application.MFC.flow_rate
 
-            self.save_data_array[self.application.n_region + 1 : self.application.n_region * 2 + 1] = self.application.temperature.temperature_average
-            self.save_temperature_array[1:] = self.application.temperature.temperature
+            save_data_row[n_region + 1 : n_region * 2 + 1] = self.application.temperature.temperature_average
+            save_temperature_row[1:] = self.application.temperature.temperature
 
-            self.save_data_array = self.save_data_array.reshape(1, -1)
-            self.save_temperature_array = self.save_temperature_array.reshape(1, -1)
+            # Region statistics, one block of n_region columns per statistic
+            region_statistics = self.application.temperature.region_statistics
+            for j, field in enumerate(region_statistics.dtype.names):
+                save_statistics_row[1 + j*n_region : 1 + (j+1)*n_region] = region_statistics[field]
 
             with open(self.application.UI.filename, 'a') as file:
                 np.savetxt(file, self.save_data_array, delimiter=',', fmt='%10.5f')
 
             with open(self.application.UI.filename.replace('.csv', '_temp.csv'), 'a') as file:
                 np.savetxt(file, self.save_temperature_array, delimiter = ',', fmt = '%10.5f')
-        
+
+            with open(self.application.UI.filename.replace('.csv', '_stats.csv'), 'a') as file:
+                np.savetxt(file, self.save_statistics_array, delimiter = ',', fmt = '%10.5f')
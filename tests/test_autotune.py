@@ -0,0 +1,87 @@
+import numpy as np
+
+from source.autotune import Autotune, fit_fopdt, simc_gains
+
+def fopdt_response(time_points, gain, time_constant, delay, step):
+    '''Step response of a first order plus dead time process'''
+    return gain * step * (1 - np.exp(-np.maximum(time_points - delay, 0) / time_constant))
+
+def test_fit_recovers_models_on_the_grid():
+    time_points = np.arange(0, 60, 0.5)
+    gain = np.array([-0.05, -0.02])
+    time_constant = np.array([20., 8.])
+    delay = np.array([4., 1.2])
+    response = np.column_stack([fopdt_response(time_points, *model, 50.) for model in zip(gain, time_constant, delay)])
+
+    # Both models lie on the grid: delays every 0.2 s, time constants every second
+    fitted_gain, fitted_time_constant, fitted_delay, residual = fit_fopdt(time_points, response, 50., max_delay = 7.8, time_constants = np.arange(5., 41.))
+
+    assert np.allclose(fitted_gain, gain)
+    assert np.allclose(fitted_time_constant, time_constant)
+    assert np.allclose(fitted_delay, delay)
+    assert np.all(residual < 1e-12)
+
+def test_fit_of_a_noisy_response_on_the_default_grid():
+    rng = np.random.default_rng(0)
+    time_points = np.arange(0, 60, 0.5)
+    response = fopdt_response(time_points, -0.05, 12., 3., 50.)[:, None] + rng.normal(0, 0.02, (len(time_points), 1))
+
+    gain, time_constant, delay, residual = fit_fopdt(time_points, response, 50.)
+
+    assert np.allclose(gain, -0.05, rtol = 0.05)
+    assert np.allclose(time_constant, 12., rtol = 0.1)
+    assert np.allclose(delay, 3., atol = 0.6)
+
+    # Noise and the spacing of the grid
+    assert 0.02 < np.sqrt(residual[0]) < 0.03
+
+def test_simc_gains():
+    gain = np.array([-0.05, -0.02])
+    time_constant = np.array([20., 80.])
+    delay = np.array([4., 1.])
+    sample_time = 0.5
+
+    gains = simc_gains(gain, time_constant, delay, sample_time)
+
+    # Kc = tau / (-K (tau_c + theta)), tau_I = min(tau, 4 (tau_c + theta)), with theta + dt / 2 and tau_c = theta
+    effective_delay = delay + sample_time / 2
+    Kc = time_constant / (-gain * 2 * effective_delay)
+    tau_i = np.minimum(time_constant, 8 * effective_delay)
+    assert np.allclose(gains, np.column_stack([Kc, Kc / tau_i, np.zeros(2)]))
+
+    # The integral time is the time constant for the slow process only
+    assert np.isclose(Kc[0] / gains[0, 1], 20.)
+    assert np.isclose(Kc[1] / gains[1, 1], 10.)
+
+def test_autotune_of_fopdt_regions(capsys):
+    models = np.array([[-0.05, 20., 4.], [-0.03, 10., 2.]])
+    time_step = 0.5
+    autotune = Autotune(2, [[0], [1]], base_flow_rate = 50., step_size = 50., settle_time = 10., step_time = 60.)
+
+    # Each region responds to its own step from its start, at the control period
+    flow_rates = np.zeros(2)
+    step_start = np.full(2, np.inf)
+    statuses = []
+    autotune.start(0.)
+    for tick in range(1000):
+        time = tick * time_step
+        temperature = 90. + np.array([fopdt_response(time - step_start[region], *models[region], 50.) for region in range(2)])
+        if autotune.update(time, temperature, flow_rates):
+            break
+        step_start[(flow_rates > autotune.base_flow_rate) & np.isinf(step_start)] = time
+        statuses.append(autotune.status)
+
+    assert autotune.finished and not autotune.running
+    assert autotune.status == 'Autotune finished'
+    assert statuses[0] == 'Autotune group 1 of 2: settling before the step of regions [0]'
+    assert 'Autotune group 2 of 2: step of regions [1]' in statuses
+
+    # Delays are resolved to the grid, a step of a third of the step time over 39
+    assert np.allclose(autotune.models[:, 0], models[:, 0], rtol = 0.02)
+    assert np.allclose(autotune.models[:, 1], models[:, 1], rtol = 0.1)
+    assert np.allclose(autotune.models[:, 2], models[:, 2], atol = 20. / 39)
+    assert np.all(autotune.residuals < 0.05)
+    assert np.allclose(autotune.gains, simc_gains(*autotune.models.T, time_step))
+
+    # Progress is reported through the status only
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,39 @@
+import time
+import numpy as np
+
+from source.simulator import Simulator
+from source.mass_flow_controller import MFC
+
+def test_sampled_flow_rate_follows_a_step_of_the_simulated_mfcs():
+    # Real time, as run by the test mode of the application
+    simulator = Simulator(2, seed = 0)
+    simulator.valve_open[:] = True
+    mfc = MFC(2, sample_rate = 100, simulator = simulator)
+    try:
+        mfc.set_flow_rates(np.array([150., 80.]))
+
+        # The MFCs settle within a few of their 0.3 s time constants
+        time.sleep(1.5)
+        mfc.get_flow_rate()
+        time.sleep(0.2)
+        mfc.get_flow_rate()
+    finally:
+        mfc.stop()
+
+    assert mfc.flow_samples > 5
+    assert mfc.sampler.errors == 0
+    assert np.allclose(mfc.flow_rate, [150., 80.], rtol = 0.02)
+    assert np.all(mfc.flow_rate_min <= mfc.flow_rate) and np.all(mfc.flow_rate <= mfc.flow_rate_max)
+
+def test_dac_codes_follow_the_resolution_of_the_dac():
+    for resolution in [12, 10, 8]:
+        simulator = Simulator(2, seed = 0)
+        simulator.dac[0].resolution = resolution
+        mfc = MFC(2, simulator = simulator)
+        mfc.set_flow_rates(np.array([150., 400.]))
+
+        # 150 is a 3 V setpoint, 400 is clamped to 5 V and full scale
+        full_scale = (1 << resolution) - 1
+        assert mfc.dac_codes[0] == int(3. / 5. * full_scale)
+        assert mfc.dac_codes[1] == full_scale
+        assert np.allclose(simulator.flow_rate_command, [150., 300.], rtol = 2 / full_scale)
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from source.mlx90640_fast import MLX90640Fast, OPENAIR_TA_SHIFT
+
+amlx = pytest.importorskip('adafruit_mlx90640')
+
+def synthetic_eeprom(seed = 1, chess = True):
+    '''832 EEPROM words with the calibration values of a typical sensor and random per-pixel data'''
+
+    rng = np.random.default_rng(seed)
+    ee = np.zeros(832, dtype = np.int64)
+
+    # Calibration mode, scales and row/column offset, alpha and kta nibbles
+    ee[10] = 0x0800 if chess else 0
+    ee[16] = 0x4210
+    ee[17] = 0xFFC4
+    ee[18:32] = rng.integers(0, 65536, 14)
+    ee[32] = 0x4542
+    ee[33] = 0x2F44
+    ee[34:48] = rng.integers(0, 65536, 14)
+
+    # Gain, PTAT, VDD, compensation pixels, resolution, kv, kta, KsTa and ksTo
+    ee[48] = 6000
+    ee[49] = 12273
+    ee[50] = (20 << 10) | 338
+    ee[51] = 0x9C5F
+    ee[52] = 0x4534
+    ee[53] = 0x1A53
+    ee[54] = 0x5A4E
+    ee[55] = 0x5852
+    ee[56] = 0x23B3
+    ee[57] = (3 << 10) | 0x1C0
+    ee[58] = (2 << 10) | 964
+    ee[59] = 0x0450
+    ee[60] = 0xF008
+    ee[61] = 0x9D9E
+    ee[62] = 0x9A9B
+    ee[63] = 0x1849
+
+    # Offset, alpha and kta of every pixel, no broken or outlier pixels
+    offset = rng.integers(0, 64, 768)
+    alpha = rng.integers(0, 64, 768)
+    kta = rng.integers(0, 8, 768)
+    ee[64:] = (offset << 10) | (alpha << 4) | (kta << 1)
+    return ee
+
+def synthetic_frame(subpage, chess = True, seed = 2):
+    '''834 word raw frame: pixels, auxiliary data, control register and sub-page'''
+
+    rng = np.random.default_rng(seed)
+    frame = np.zeros(834, dtype = np.int64)
+    frame[:768] = rng.integers(-200, 300, 768) % 65536
+
+    # PTAT, VBE, VDD, gain and compensation pixels
+    frame[768] = 20397
+    frame[800] = 1700
+    frame[810] = 52192
+    frame[778] = 6100
+    frame[776] = 65476
+    frame[808] = 65470
+
+    # Reading pattern and 18 bit resolution in the control register
+    frame[832] = (0x1000 if chess else 0) | 0x0800 | (1 << 7)
+    frame[833] = subpage
+    return frame
+
+@pytest.mark.parametrize('chess', [True, False])
+@pytest.mark.parametrize('subpage', [0, 1])
+def test_object_temperature_matches_the_adafruit_driver(chess, subpage):
+    ee = synthetic_eeprom(chess = chess)
+    frame = synthetic_frame(subpage, chess = chess)
+
+    # Adafruit driver without a device, the parameters are extracted from the module level EEPROM words
+    mlx = amlx.MLX90640.__new__(amlx.MLX90640)
+    amlx.eeData[:] = [int(word) for word in ee]
+    mlx._ExtractParameters()
+    frame_words = [int(word) for word in frame]
+    reference = [0.] * 768
+    mlx._CalculateTo(frame_words, 0.95, mlx._GetTa(frame_words) - OPENAIR_TA_SHIFT, reference)
+
+    engine = MLX90640Fast(ee)
+    result = np.zeros(768)
+    engine.calculate_to(frame, 0.95, engine.get_ta(frame) - OPENAIR_TA_SHIFT, result)
+
+    # Only the pixels of the sub-page are calculated
+    pixels = engine.subpage_pixels[(chess, subpage)]
+    assert len(pixels) == 384
+    assert np.all(np.isfinite(result[pixels]))
+    assert np.max(np.abs(result[pixels] - np.array(reference)[pixels])) < 0.01
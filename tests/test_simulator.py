@@ -0,0 +1,47 @@
+import numpy as np
+
+import source.simulator
+from source.simulator import Simulator
+
+class Clock():
+    '''Monotonic clock advanced by hand'''
+
+    def __init__(self):
+        self.now = 0.
+
+    def monotonic(self):
+        return self.now
+
+def test_short_calls_integrate_the_same_time_as_one_long_call(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(source.simulator, 'time', clock)
+
+    short_calls = Simulator(2, seed = 0)
+    long_call = Simulator(2, seed = 0)
+    for simulator in [short_calls, long_call]:
+        simulator.valve_open[:] = True
+        simulator.flow_rate_command[:] = 150.
+
+    # 100 Hz calls, each well below half a model step
+    for _ in range(300):
+        clock.now += 0.01
+        short_calls.advance()
+    long_call.advance()
+
+    assert short_calls.time > 2.9
+    assert abs(short_calls.time - long_call.time) <= short_calls.time_step
+    assert np.allclose(short_calls.flow_rate, long_call.flow_rate, rtol = 0.02)
+
+def test_long_pauses_are_capped(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(source.simulator, 'time', clock)
+
+    simulator = Simulator(1, time_scale = 2.)
+    clock.now += 60.
+    simulator.advance()
+    assert np.isclose(simulator.time, 10.)
+
+    # The time after the pause is integrated normally
+    clock.now += 1.
+    simulator.advance()
+    assert np.isclose(simulator.time, 12.)
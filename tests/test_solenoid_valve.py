@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from source.simulator import Simulator
+from source.solenoid_valve import Solenoid
+
+def test_regions_map_to_the_bits_of_the_drivers():
+    simulator = Simulator(10)
+    solenoid = Solenoid(10, simulator = simulator)
+    solenoid.set_states(np.array([True, False, True]))
+    assert solenoid.state == [0b00100000, 0b00000010]
+    assert list(simulator.valve_open) == [True, False, True] + [False] * 7
+
+    solenoid.set_solenoid_state(1, True)
+    assert list(simulator.valve_open[:3]) == [True, True, True]
+
+def test_more_regions_than_the_drivers_in_test_mode_and_simulation():
+    n_region = 70
+    Solenoid(n_region, test_UI = True).set_states(np.ones(n_region, dtype = bool))
+
+    simulator = Simulator(n_region)
+    solenoid = Solenoid(n_region, simulator = simulator)
+    states = np.arange(n_region) % 3 == 0
+    solenoid.set_states(states)
+    assert np.array_equal(simulator.valve_open, states)
+
+    solenoid.set_states((1 << n_region) - 1)
+    assert np.all(simulator.valve_open)
+
+def test_the_drivers_of_the_rig_limit_the_number_of_regions():
+    with pytest.raises(ValueError, match = 'DRV8806'):
+        Solenoid(11, connect = False)
+
+def test_too_many_states_are_rejected():
+    solenoid = Solenoid(4, test_UI = True)
+    with pytest.raises(ValueError, match = 'at most 4'):
+        solenoid.set_states(np.ones(5, dtype = bool))
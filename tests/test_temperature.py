@@ -0,0 +1,33 @@
+import tracemalloc
+import numpy as np
+
+from source.temperature import Temperature
+
+def test_frame_path_does_not_allocate_per_tick():
+    # Many regions, so per-region temporaries would be larger than the transient views of the structured array
+    n_region = 256
+    region_boundaries = np.array([[i % 32, i % 32 + 1, 0, 24] for i in range(n_region)])
+    temperature = Temperature(n_region, test = True)
+
+    def tick():
+        temperature.get_temperature()
+        temperature.get_temperature_average(n_region, region_boundaries)
+
+    # Warm up while tracing, numpy fills its caches during the first ticks
+    tracemalloc.start()
+    try:
+        for _ in range(1000):
+            tick()
+
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(200):
+            tick()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Nothing is retained, and no array of the size of a frame is allocated, even transiently
+    assert current - start == 0
+    assert peak - start < temperature.temperature.nbytes
+    assert np.all(np.isfinite(temperature.temperature_average))
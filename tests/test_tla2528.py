@@ -0,0 +1,81 @@
+import ctypes
+import timeit
+import numpy as np
+import pytest
+
+from source.TLA2825IRTER import TLA2528
+
+class ReadMessage():
+    '''Read message with the addr, len and buf fields of smbus2.i2c_msg'''
+
+    def __init__(self, address, length):
+        self.addr = address
+        self.len = length
+        self.buf = ctypes.create_string_buffer(length)
+
+    @classmethod
+    def read(cls, address, length):
+        return cls(address, length)
+
+    def __bytes__(self):
+        return self.buf.raw
+
+class MockSMBus():
+    '''Stand-in for SMBus counting bus transactions, burst reads return a fixed pattern'''
+
+    i2c_msg = ReadMessage
+
+    def __init__(self):
+        self.transactions = 0
+        self.pattern = bytes(range(0x10, 0x30, 2))
+
+    def write_i2c_block_data(self, address, register, data):
+        self.transactions += 1
+
+    def read_byte(self, address):
+        # SYSTEM_STATUS with OSR_DONE set
+        self.transactions += 1
+        return 0x08
+
+    def i2c_rdwr(self, *messages):
+        self.transactions += 1
+        for message in messages:
+            ctypes.memmove(message.buf, self.pattern, message.len)
+
+def legacy_decode(raw_data, AVDD):
+    '''Per-channel decode of the original driver'''
+    data = np.zeros(8)
+    for i in range(8):
+        msb = raw_data[2 * i]
+        lsb = raw_data[2 * i + 1]
+        adc_value = (msb << 4) | (lsb >> 4)
+        data[i] = adc_value * AVDD / 4096
+    return data
+
+@pytest.mark.parametrize('armed, oversampling, transactions', [(True, 1, 1), (False, 1, 3), (True, 4, 1), (False, 4, 5)])
+def test_bus_transactions_per_measurement(armed, oversampling, transactions):
+    bus = MockSMBus()
+    adc = TLA2528(address=0x12, bus=bus, armed=armed, oversampling=oversampling)
+    bus.transactions = 0
+    adc.measure_voltage()
+    assert bus.transactions == transactions
+
+@pytest.mark.parametrize('armed', [True, False])
+def test_decode_matches_the_legacy_driver(armed):
+    bus = MockSMBus()
+    adc = TLA2528(address=0x12, bus=bus, armed=armed)
+    assert np.max(np.abs(adc.measure_voltage() - legacy_decode(list(bus.pattern), adc.AVDD))) == 0
+
+def test_oversampled_results_use_16_bits():
+    bus = MockSMBus()
+    adc = TLA2528(address=0x12, bus=bus, oversampling=4)
+    codes = np.frombuffer(bus.pattern, dtype='>u2')
+    assert np.allclose(adc.measure_voltage(), codes * adc.AVDD / 65536)
+
+def test_benchmark_measurement():
+    '''Python time per measurement of both paths, printed with pytest -s'''
+    n = 2000
+    for armed in [False, True]:
+        adc = TLA2528(address=0x12, bus=MockSMBus(), armed=armed)
+        elapsed = timeit.timeit(adc.measure_voltage, number=n)
+        print(f"armed={armed}: {elapsed / n * 1e6:.1f} us per measurement")